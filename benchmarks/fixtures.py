@@ -0,0 +1,112 @@
+"""
+微基准测试使用的请求体，按真实请求的规模构造：几百轮的长对话、几 MB 的 base64 图片
+"""
+import base64
+import random
+import typing
+from benchmarks.upstreams import common
+
+
+def text(chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < chars:
+        word = rng.choice(common.WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def image_data_url(megabytes: float = 4, seed: int = 0) -> str:
+    """随机字节的 data URL，不可压缩，和真实照片的 base64 大小相当"""
+    data = random.Random(seed).randbytes(int(megabytes * 1024 * 1024))
+    return "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+
+
+def conversation(
+    turns: int = 200,
+    chars: int = 2000,
+    images: int = 0,
+    image_megabytes: float = 4,
+    seed: int = 0,
+) -> list[dict[str, typing.Any]]:
+    """
+    system 加上 turns 轮 user/assistant 交替的对话，images 张图片放在最近的几条 user 消息中
+    """
+    messages: list[dict[str, typing.Any]] = [{"role": "system", "content": text(chars, seed)}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": text(chars, seed + i + 1)})
+
+    users = [x for x in reversed(messages) if x["role"] == "user"]
+    for i, message in enumerate(users[:images]):
+        message["content"] = [
+            {"type": "text", "text": message["content"]},
+            {"type": "image_url", "image_url": {"url": image_data_url(image_megabytes, seed + i), "detail": "auto"}},
+        ]
+    return messages
+
+
+def body(model: str = "mock-model", stream: bool = True, **kwargs) -> dict[str, typing.Any]:
+    return {"model": model, "stream": stream, "messages": conversation(**kwargs)}
+
+
+def deltas(count: int = 2000, reasoning: int = 0, seed: int = 0) -> list[dict[str, typing.Any]]:
+    """worker 产生的流式块，先 reasoning 个推理块，再正文"""
+    rng = random.Random(seed)
+    return [
+        {
+            "type": "text",
+            "content": None if i < reasoning else rng.choice(common.WORDS) + " ",
+            "reasoning_content": rng.choice(common.WORDS) + " " if i < reasoning else None,
+            "tool_calls": None,
+        }
+        for i in range(count)
+    ]
+
+
+def regexp(rules: int = 8) -> list[dict[str, typing.Any]]:
+    """RegexMiddleware 的规则，混合角色、深度和标志"""
+    patterns = [
+        {"pattern": r"\s+$", "replacement": ""},
+        {"pattern": r"lorem", "replacement": "LOREM", "role": "user"},
+        {"pattern": r"(quick|lazy) (\w+)", "replacement": r"\2 \1", "case_insensitive": True},
+        {"pattern": r"^", "replacement": "> ", "multiline": True, "max_depth": 4},
+        {"pattern": r"<think>.*?</think>", "replacement": "", "dot_all": True, "role": "assistant"},
+        {"pattern": r"\d{4}-\d{2}-\d{2}", "replacement": "DATE", "min_depth": 10},
+        {"pattern": r"你好", "replacement": "hello", "count": 1},
+        {"pattern": r"\b(\w+) \1\b", "replacement": r"\1"},
+    ]
+    return [patterns[i % len(patterns)] for i in range(rules)]
+
+
+def insertions(count: int = 10) -> list[dict[str, typing.Any]]:
+    """InjectMiddleware 的插入项，一半带关键词"""
+    return [
+        {
+            "order": -(i % 6) - 1,
+            "role": "system" if i % 3 == 0 else "user",
+            "content": f"insertion {i}: " + text(200, i),
+            "before": i % 2 == 0,
+            "keywords": [common.WORDS[i % len(common.WORDS)], "missing keyword"] if i % 2 else [],
+        }
+        for i in range(count)
+    ]
+
+
+def template(macros: int = 20, chars: int = 4000) -> str:
+    """包含嵌套宏的消息，MacroMiddleware 对每条带 {{ 的消息都会调用 macro.render"""
+    parts = []
+    for i in range(macros):
+        parts.append(text(chars // macros, i))
+        match i % 4:
+            case 0:
+                parts.append(f"{{{{setvar:v{i}:{text(20, i)}}}}}")
+            case 1:
+                parts.append(f"{{{{upper:{{{{getvar:v{i - 1}}}}}}}}}")
+            case 2:
+                parts.append(f"{{{{replace:{text(40, i)}:the:THE}}}}")
+            case 3:
+                parts.append("{{//:comment}}")
+    return "".join(parts)
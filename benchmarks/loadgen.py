@@ -0,0 +1,216 @@
+"""
+对 /v1/chat/completions 施加固定并发的负载，统计吞吐量、TTFT 和块间延迟
+
+    python -m benchmarks.loadgen --url http://127.0.0.1:18000/v1/chat/completions --profile benchmarks/profiles/openai_stream.yaml
+"""
+import re
+import json
+import time
+import typing
+import asyncio
+import argparse
+import dataclasses
+import collections
+import rnet
+import yaml
+
+# 只统计带有内容的事件，忽略只有 role 的首块、usage 和 [DONE]
+CONTENT = re.compile(rb'"(?:reasoning_)?content":"[^"]')
+
+
+@dataclasses.dataclass
+class LoadSettings:
+    """对应 profile 中的 benchmark.load"""
+
+    concurrency: int = 32
+    requests: int = 500
+    stream: bool = True
+    model: str = "mock-model"
+    token: str = "bench"
+    # 对话消息数和每条消息的字符数
+    messages: int = 8
+    prompt_chars: int = 2000
+    timeout: float = 120
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any]) -> "LoadSettings":
+        fields = {x.name for x in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+    def payload(self) -> dict[str, typing.Any]:
+        return {
+            "model": self.model,
+            "stream": self.stream,
+            "messages": [
+                {
+                    "role": "user" if i % 2 == 0 else "assistant",
+                    "content": (f"message {i} " + "lorem ipsum dolor sit amet " * (self.prompt_chars // 27 + 1))[:self.prompt_chars],
+                }
+                for i in range(self.messages)
+            ],
+        }
+
+
+@dataclasses.dataclass
+class Result:
+    status: int | str
+    latency: float = 0.0
+    ttft: float | None = None
+    chunks: int = 0
+    gaps: list[float] = dataclasses.field(default_factory=list)
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+@dataclasses.dataclass
+class Report:
+    requests: int
+    ok: int
+    statuses: dict[str, int]
+    duration: float
+    throughput: float
+    chunks_per_second: float
+    ttft_p50: float | None
+    ttft_p99: float | None
+    chunk_gap_mean: float | None
+    chunk_gap_p50: float | None
+    chunk_gap_p99: float | None
+    latency_p50: float | None
+    latency_p99: float | None
+
+    @classmethod
+    def from_results(cls, results: list[Result], duration: float) -> "Report":
+        ok = [x for x in results if x.status == 200]
+        ttfts = [x.ttft for x in ok if x.ttft is not None]
+        gaps = [gap for x in ok for gap in x.gaps]
+        latencies = [x.latency for x in ok]
+        return cls(
+            requests=len(results),
+            ok=len(ok),
+            statuses=dict(collections.Counter(str(x.status) for x in results)),
+            duration=duration,
+            throughput=len(ok) / duration if duration else 0,
+            chunks_per_second=sum(x.chunks for x in ok) / duration if duration else 0,
+            ttft_p50=percentile(ttfts, 50),
+            ttft_p99=percentile(ttfts, 99),
+            chunk_gap_mean=sum(gaps) / len(gaps) if gaps else None,
+            chunk_gap_p50=percentile(gaps, 50),
+            chunk_gap_p99=percentile(gaps, 99),
+            latency_p50=percentile(latencies, 50),
+            latency_p99=percentile(latencies, 99),
+        )
+
+    def __str__(self) -> str:
+        def ms(value: float | None) -> str:
+            return "n/a" if value is None else f"{value * 1000:.2f}ms"
+
+        return "\n".join([
+            f"requests      {self.ok}/{self.requests} ok {self.statuses} in {self.duration:.2f}s",
+            f"throughput    {self.throughput:.1f} req/s, {self.chunks_per_second:.1f} chunks/s",
+            f"ttft          p50 {ms(self.ttft_p50)}  p99 {ms(self.ttft_p99)}",
+            f"chunk gap     mean {ms(self.chunk_gap_mean)}  p50 {ms(self.chunk_gap_p50)}  p99 {ms(self.chunk_gap_p99)}",
+            f"latency       p50 {ms(self.latency_p50)}  p99 {ms(self.latency_p99)}",
+        ])
+
+
+async def request(client: rnet.Client, url: str, load: LoadSettings, body: bytes) -> Result:
+    headers = {"Authorization": f"Bearer {load.token}", "Content-Type": "application/json"}
+    started = time.perf_counter()
+    try:
+        async with await client.post(url, body=body, headers=headers, timeout=load.timeout) as response:
+            assert isinstance(response, rnet.Response)
+            # 不同版本的 rnet 返回 int 或 StatusCode
+            status = response.status if isinstance(response.status, int) else response.status.as_int()
+            if status != 200 or not load.stream:
+                await response.bytes()
+                latency = time.perf_counter() - started
+                return Result(status, latency, latency if status == 200 else None)
+
+            result = Result(status)
+            last = None
+            buffer = b""
+            async with response.stream() as streamer:
+                async for data in streamer:
+                    now = time.perf_counter()
+                    buffer += data
+                    *events, buffer = buffer.split(b"\n\n")
+                    for event in events:
+                        if not CONTENT.search(event):
+                            continue
+                        if last is None:
+                            result.ttft = now - started
+                        else:
+                            result.gaps.append(now - last)
+                        last = now
+                        result.chunks += 1
+
+            result.latency = time.perf_counter() - started
+            return result
+    except Exception as e:
+        return Result(e.__class__.__name__, time.perf_counter() - started)
+
+
+async def models(url: str, token: str) -> list[str]:
+    """GET /v1/models，同时让 worker 从上游刷新模型列表（例如 Pollinations 只支持列表中的模型）"""
+    client = rnet.Client()
+    async with await client.get(url, headers={"Authorization": f"Bearer {token}"}) as response:
+        assert isinstance(response, rnet.Response)
+        assert response.ok, f"{response.status} {await response.text()}"
+        return [x["id"] for x in (await response.json())["data"]]
+
+
+async def run(url: str, load: LoadSettings) -> Report:
+    client = rnet.Client()
+    body = json.dumps(load.payload()).encode("utf-8")
+    results: list[Result] = []
+    remaining = load.requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            results.append(await request(client, url, load, body))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(load.concurrency)])
+    return Report.from_results(results, time.perf_counter() - started)
+
+
+def load_settings(profile: str | None) -> LoadSettings:
+    if not profile:
+        return LoadSettings()
+
+    with open(profile, "r", encoding="utf-8") as f:
+        settings = yaml.safe_load(f) or {}
+    return LoadSettings.from_dict(settings.get("benchmark", {}).get("load", {}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:18000/v1/chat/completions")
+    parser.add_argument("--profile", default=None, help="读取其中的 benchmark.load")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--json", default=None, help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    load = load_settings(args.profile)
+    for name in ("concurrency", "requests", "stream"):
+        if (value := getattr(args, name)) is not None:
+            setattr(load, name, value)
+
+    report = asyncio.run(run(args.url, load))
+    print(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(dataclasses.asdict(report), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""
+热路径函数的微基准测试，结果写入 JSON，用 --compare 和之前版本的结果比较
+
+    python -m benchmarks.micro [-k concat] [--json after.json] [--compare before.json]
+
+worker.* 用例在本进程的线程中启动 benchmarks/upstreams 的模拟上游（不限速），测量 worker 解析流式响应的完整循环
+"""
+import os
+import gc
+import sys
+import json
+import time
+import typing
+import asyncio
+import inspect
+import platform
+import argparse
+import datetime
+import statistics
+import threading
+import subprocess
+import dataclasses
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+CWD = os.getcwd()
+
+# src 下的模块使用相对路径读取配置
+os.environ.setdefault("LMPROXY_SETTINGS", os.path.join(ROOT, "benchmarks", "profiles", "micro.yaml"))
+sys.path.insert(0, SRC)
+os.chdir(SRC)
+
+from benchmarks import fixtures  # noqa: E402
+from benchmarks.upstreams import common  # noqa: E402
+
+# 用例名称 -> 准备函数，准备函数返回被测的无参函数（同步或异步）
+CASES: dict[str, typing.Callable[[], typing.Awaitable[typing.Callable[[], typing.Any]]]] = {}
+
+
+def case(name: str):
+    def decorator(func):
+        CASES[name] = func
+        return func
+    return decorator
+
+
+@dataclasses.dataclass
+class Result:
+    name: str
+    # 每轮调用次数和轮数
+    number: int
+    rounds: int
+    # 单次调用的耗时（秒）
+    min: float
+    median: float
+    mean: float
+    stdev: float
+
+    @property
+    def ops(self) -> float:
+        return 1 / self.median if self.median else 0
+
+
+async def measure(name: str, func: typing.Callable[[], typing.Any], rounds: int, round_time: float) -> Result:
+    is_async = inspect.iscoroutinefunction(func)
+
+    async def call(number: int) -> float:
+        started = time.perf_counter()
+        if is_async:
+            for _ in range(number):
+                await func()
+        else:
+            for _ in range(number):
+                func()
+        return time.perf_counter() - started
+
+    # 预热，同时估算每轮的调用次数
+    once = await call(1)
+    number = max(1, int(round_time / once)) if once > 0 else 1000
+
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            times.append(await call(number) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return Result(
+        name=name,
+        number=number,
+        rounds=rounds,
+        min=min(times),
+        median=statistics.median(times),
+        mean=statistics.fmean(times),
+        stdev=statistics.stdev(times) if len(times) > 1 else 0,
+    )
+
+
+# ---- 引擎和 SSE 编码 ----
+
+@case("engine.concat_chunks")
+async def concat_chunks():
+    """一个 2000 块的流经过 Engine.concat_chunks 后取出完整消息"""
+    import main
+    import context
+
+    deltas = [context.Text(**x) for x in fixtures.deltas(2000, reasoning=500)]
+
+    def run():
+        ctx = context.Context(headers={}, body={}, type="text")
+        for delta in deltas:
+            accumulator = main._engine.concat_chunks(ctx, delta)
+        return accumulator.to_text()
+    return run
+
+
+@case("main.sse_chunk")
+async def sse_chunk():
+    """main 中每个流式块的 JSON 和 SSE 编码"""
+    import main
+    import context
+
+    delta = context.Text(**fixtures.deltas(1)[0])
+
+    def run():
+        return main._sse_delta(0x12345678, '"mock-model"', delta)
+    return run
+
+
+# ---- 中间件 ----
+
+@case("macro.render")
+async def macro_render():
+    """一条 4000 字符、25 个宏（含嵌套）的消息"""
+    import macro
+    import macros  # noqa: F401
+
+    template = fixtures.template()
+
+    async def run():
+        return await macro.render(template, 64)
+    return run
+
+
+@case("regex.apply_regex.200_turns")
+async def apply_regex():
+    """8 条规则应用到 200 轮对话的每条消息"""
+    from middlewares import regex
+
+    middleware = regex.RegexMiddleware({"regexp": fixtures.regexp()}, None)
+    messages = fixtures.conversation(200)
+
+    def run():
+        size = len(messages)
+        for i, message in enumerate(messages):
+            middleware.apply_regex(message["content"], message["role"], size - i - 1)
+    return run
+
+
+@case("inject.insert.200_turns")
+async def inject_insert():
+    """10 个插入项插入 200 轮对话，包括每次复制消息列表的开销"""
+    from middlewares import inject
+
+    middleware = inject.InjectMiddleware({}, None)
+    messages = fixtures.conversation(200)
+    insertions = fixtures.insertions()
+
+    def run():
+        middleware.insert([dict(x) for x in messages], insertions)
+    return run
+
+
+@case("inject.matchKeywords.200_turns")
+async def inject_match_keywords():
+    from middlewares import inject
+
+    middleware = inject.InjectMiddleware({}, None)
+    contents = [x["content"] for x in fixtures.conversation(200)]
+    keywords = ["missing keyword", "another missing keyword", "lazy dog"]
+
+    def run():
+        return middleware.matchKeywords(keywords, contents)
+    return run
+
+
+@case("tools.process_chunks.stream_2000")
+async def tools_process_chunks():
+    """2000 块不含工具调用的流经过 ToolCallMiddleware，累积方式与 Engine 相同"""
+    import context
+    import middleware
+    from middlewares import tools
+
+    manager = middleware.MiddlewareManager({}, None)
+    manager.add_middleware(tools.ToolCallMiddleware({}, None))
+    deltas = [context.Text(**x) for x in fixtures.deltas(2000)]
+
+    async def run():
+        ctx = context.Context(headers={}, body={"stream": True}, type="text")
+        window = manager.stream_content
+        if window:
+            ctx.metadata.stream_content = context.TextAccumulator(0 if window is True else int(window))
+        for delta in deltas:
+            if window:
+                ctx.metadata.stream_content.add(delta)
+            await manager.process_chunks(ctx, [delta])
+    return run
+
+
+# ---- 请求体复制和转换 ----
+
+@case("context.payload.200_turns")
+async def context_payload():
+    import context
+
+    ctx = context.Context(headers={}, body=fixtures.body(), type="text")
+
+    def run():
+        return ctx.payload({})
+    return run
+
+
+@case("context.payload.images_4x4mb")
+async def context_payload_images():
+    """200 轮对话加 4 张 4MB 图片（base64 后约 22MB）"""
+    import context
+
+    ctx = context.Context(headers={}, body=fixtures.body(images=4), type="text")
+
+    def run():
+        return ctx.payload({})
+    return run
+
+
+@case("aistudio.convert_to_gemini.images_4x4mb")
+async def convert_to_gemini():
+    import proxies
+    from workers import aistudio
+
+    worker = aistudio.AiStudioWorker({"api_keys": ["micro"]}, proxies.ProxyFactory({}))
+    payload = fixtures.body(images=4)
+
+    async def run():
+        return await worker.convert_to_gemini(payload)
+    return run
+
+
+@case("jsonbody.dumps.images_4x4mb")
+async def jsonbody_dumps():
+    """每个请求编码一次的开销"""
+    import jsonbody
+
+    payload = fixtures.body(images=4)
+
+    def run():
+        return jsonbody.dumps(payload)
+    return run
+
+
+@case("jsonbody.render.images_4x4mb")
+async def jsonbody_render():
+    """每次尝试替换 chat_id 和 id 的开销"""
+    import jsonbody
+
+    template = jsonbody.Template({**fixtures.body(images=4), "chat_id": "", "id": ""}, ("chat_id", "id"))
+
+    def run():
+        return template.render(chat_id="chat", id="id")
+    return run
+
+
+# ---- 缓存 ----
+
+@case("cache.ttl_cache.hit")
+async def ttl_cache_hit():
+    import cache
+
+    @cache.ttl_cache(300)
+    def lookup(model: str, type: str) -> bool:
+        return True
+
+    def run():
+        return lookup("mock-model", type="text")
+    return run
+
+
+@case("cache.ttl_cache.async_hit")
+async def ttl_cache_async_hit():
+    import cache
+
+    @cache.ttl_cache(300)
+    async def lookup(model: str, type: str) -> bool:
+        return True
+
+    async def run():
+        return await lookup("mock-model", type="text")
+    return run
+
+
+# ---- worker 流式解析 ----
+
+class Upstream(threading.Thread):
+    """在后台线程中运行的模拟上游，不限速"""
+
+    def __init__(self, kind: str, settings: common.MockSettings) -> None:
+        import uvicorn
+        import importlib
+
+        super().__init__(daemon=True)
+        app = importlib.import_module(f"benchmarks.upstreams.{kind}").create_app(settings)
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+
+    def run(self) -> None:
+        self.server.run()
+
+    def url(self, timeout: float = 10) -> str:
+        self.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise TimeoutError("mock upstream not started")
+            time.sleep(0.01)
+        return "http://127.0.0.1:%d" % self.server.servers[0].sockets[0].getsockname()[1]
+
+
+# 模拟上游 -> (profile, 请求的模型)
+STREAMS = {
+    "openai": ("openai_stream.yaml", "mock-model"),
+    "akash": ("web_akash.yaml", "mock-model"),
+    "chatbot": ("web_chatbot.yaml", "grok-4-fast-reasoning"),
+    "zai": ("web_zai.yaml", "GLM-4.5-thinking"),
+    "longchat": ("web_longchat.yaml", "longcat-flash-thinking"),
+    "k2think": ("web_k2think.yaml", "K2-Think"),
+    "aistudio": ("web_aistudio.yaml", "mock-model"),
+}
+
+
+def worker_stream(kind: str, tokens: int = 1000, reasoning_tokens: int = 200):
+    profile, model = STREAMS[kind]
+
+    async def setup():
+        import loader
+        import proxies
+        import context
+
+        url = Upstream(kind, common.MockSettings(
+            ttft=0, tokens_per_second=0, tokens=tokens, reasoning_tokens=reasoning_tokens,
+        )).url()
+
+        # 使用 profile 中的 worker 配置，只替换上游地址
+        with open(os.path.join(ROOT, "benchmarks", "profiles", profile), "r", encoding="utf-8") as f:
+            settings = yaml.safe_load(
+                f.read().replace("http://127.0.0.1:18001", url)
+            )["worker"]["workers"][0]
+        worker = loader.get_object(settings["class"])(settings, proxies.ProxyFactory({}))
+        body = fixtures.body(model, turns=8)
+
+        async def run():
+            ctx = context.Context(headers={}, body=body, type="text")
+            chunks = 0
+            async for _ in await worker.generate_text(ctx):
+                chunks += 1
+            assert chunks >= tokens, f"{kind}: {chunks} chunks"
+        return run
+    return setup
+
+
+for kind in STREAMS:
+    case(f"worker.{kind}.stream_1200_chunks")(worker_stream(kind))
+
+
+# ---- 运行和比较 ----
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[Result], baseline: dict[str, typing.Any], threshold: float) -> list[str]:
+    """和之前的结果比较中位数，返回变慢超过 threshold 的用例"""
+    before = {x["name"]: x for x in baseline.get("results", [])}
+    regressions = []
+    print(f"--- compare with {baseline.get('revision')}")
+    for result in results:
+        if result.name not in before:
+            continue
+        ratio = result.median / before[result.name]["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(result.name)
+        elif ratio < 1 - threshold:
+            flag = "  improved"
+        print(f"{result.name:<45} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+async def run(names: list[str], rounds: int, round_time: float) -> list[Result]:
+    results = []
+    for name in names:
+        func = await CASES[name]()
+        result = await measure(name, func, rounds, round_time)
+        results.append(result)
+        print(
+            f"{name:<45} median {format_time(result.median):>9}  min {format_time(result.min):>9}"
+            f"  stdev {format_time(result.stdev):>9}  ({result.rounds}x{result.number})"
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy microbenchmarks")
+    parser.add_argument("-k", dest="keyword", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--round-time", type=float, default=0.2, help="每轮的目标时间（秒）")
+    parser.add_argument("--json", default=None, help="将结果写入 JSON 文件")
+    parser.add_argument("--compare", default=None, help="与之前的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="中位数变慢超过该比例视为退化")
+    args = parser.parse_args()
+
+    names = [x for x in CASES if args.keyword in x]
+    results = asyncio.run(run(names, args.rounds, args.round_time))
+
+    if args.json:
+        with open(os.path.join(CWD, args.json), "w", encoding="utf-8") as f:
+            json.dump({
+                "revision": git_revision(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": [dataclasses.asdict(x) for x in results],
+            }, f, indent=2)
+
+    if args.compare:
+        with open(os.path.join(CWD, args.compare), "r", encoding="utf-8") as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
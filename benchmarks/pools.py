@@ -0,0 +1,228 @@
+"""
+ResourceManager（key）和 ProxyManager（代理）的争用测试：大量并发任务反复租用资源，
+报告获取延迟的分位数、公平性（最长等待、每个任务完成数的 Jain 指数）、资源利用率和事件循环的 CPU 占用
+
+    python -m benchmarks.pools [benchmarks/profiles/pools.yaml] [-k retrying] [--json result.json]
+
+不需要网络，租用期间用 sleep 模拟请求
+"""
+import os
+import sys
+import json
+import time
+import random
+import typing
+import asyncio
+import argparse
+import dataclasses
+import yaml
+from benchmarks import loadgen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import resources  # noqa: E402
+import proxies  # noqa: E402
+
+
+class SimulatedError(Exception):
+    """模拟上游失败，get_retying 会换一个 key 重试"""
+
+
+@dataclasses.dataclass
+class Scenario:
+    """对应 profile 中 scenarios 的一项"""
+
+    name: str = "default"
+    # 并发任务数和总租用次数
+    tasks: int = 1000
+    leases: int = 20000
+    keys: int = 32
+    # 0 表示不使用代理
+    proxies: int = 0
+    # 平均持有时间（秒），指数分布
+    hold: float = 0.01
+    # 释放后的冷却时间（秒）
+    cooldown: float = 0.0
+    # 每次租用失败的概率，只在 retrying 模式下重试
+    failure_rate: float = 0.0
+    # get：ResourceManager.get()；retrying：get_retying()
+    pattern: str = "get"
+    max_retries: int = 3
+    # 重试前的等待（秒）
+    wait: float = 0.0
+    # 获取资源的超时（秒），None 表示无限等待
+    timeout: float | None = None
+    # 整个场景的时间上限（秒），超过则视为卡死
+    deadline: float = 120
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any]) -> "Scenario":
+        fields = {x.name for x in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+@dataclasses.dataclass
+class Report:
+    name: str
+    completed: int
+    failed: int
+    stalled: bool
+    duration: float
+    leases_per_second: float
+    # 获取资源的等待时间（秒），包括代理和 key
+    wait_p50: float | None
+    wait_p99: float | None
+    wait_p999: float | None
+    wait_max: float | None
+    # 各任务完成次数的 Jain 公平指数，1 为完全公平
+    fairness: float | None
+    # key 被持有的时间占 key 数 × 时长的比例
+    utilization: float
+    # 进程 CPU 时间占墙钟时间的比例，以及每次租用的 CPU 时间（秒）
+    cpu: float
+    cpu_per_lease: float | None
+
+    def __str__(self) -> str:
+        def ms(value: float | None) -> str:
+            return "n/a" if value is None else f"{value * 1000:.2f}ms"
+
+        return "\n".join([
+            f"leases        {self.completed} ok, {self.failed} failed in {self.duration:.2f}s"
+            f" ({self.leases_per_second:.0f}/s){'  STALLED' if self.stalled else ''}",
+            f"wait          p50 {ms(self.wait_p50)}  p99 {ms(self.wait_p99)}"
+            f"  p99.9 {ms(self.wait_p999)}  max {ms(self.wait_max)}",
+            f"fairness      {'n/a' if self.fairness is None else f'{self.fairness:.3f}'}"
+            f"  utilization {self.utilization:.1%}",
+            f"cpu           {self.cpu:.1%} of wall, {ms(self.cpu_per_lease)} per lease",
+        ])
+
+
+def jain(values: list[int]) -> float | None:
+    if not values or not any(values):
+        return None
+    return sum(values) ** 2 / (len(values) * sum(x * x for x in values))
+
+
+async def run(scenario: Scenario) -> Report:
+    rng = random.Random(scenario.seed)
+    keys = resources.ResourceManager(
+        [f"key-{i:04d}" for i in range(scenario.keys)],
+        cooldown_time=scenario.cooldown,
+        default_timeout=scenario.timeout,
+        name=f"bench-{scenario.name}",
+    )
+    pool = proxies.ProxyManager(
+        "", [f"http://proxy-{i:04d}:8080" for i in range(scenario.proxies)],
+        timeout=scenario.timeout, name=f"bench-{scenario.name}",
+    ) if scenario.proxies else proxies.DummyProxyManager()
+
+    waits: list[float] = []
+    done = [0] * scenario.tasks
+    held = 0.0
+    failed = 0
+    remaining = scenario.leases
+
+    async def lease(started: float) -> None:
+        """持有 key，返回前按 failure_rate 抛出 SimulatedError"""
+        nonlocal held
+        waits.append(time.perf_counter() - started)
+        hold = rng.expovariate(1 / scenario.hold) if scenario.hold > 0 else 0
+        await asyncio.sleep(hold)
+        held += hold
+        if rng.random() < scenario.failure_rate:
+            raise SimulatedError()
+
+    async def request() -> bool:
+        started = time.perf_counter()
+        async with await pool.acquire(scenario.timeout):
+            if scenario.pattern == "retrying":
+                try:
+                    async for attempt in keys.get_retying(scenario.max_retries, scenario.wait, [SimulatedError]):
+                        async with attempt:
+                            await lease(started)
+                        started = time.perf_counter()
+                    return True
+                except resources.NoMoreResourceError:
+                    return False
+
+            try:
+                async with keys.get():
+                    await lease(started)
+                return True
+            except SimulatedError:
+                return False
+
+    async def task(index: int) -> None:
+        nonlocal remaining, failed
+        while remaining > 0:
+            remaining -= 1
+            try:
+                ok = await request()
+            except asyncio.TimeoutError:
+                ok = False
+            if ok:
+                done[index] += 1
+            else:
+                failed += 1
+
+    cpu = time.process_time()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(task(i)) for i in range(scenario.tasks)]
+    _, pending = await asyncio.wait(tasks, timeout=scenario.deadline)
+    for x in pending:
+        x.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    duration = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+
+    completed = sum(done)
+    return Report(
+        name=scenario.name,
+        completed=completed,
+        failed=failed,
+        stalled=bool(pending),
+        duration=duration,
+        leases_per_second=completed / duration if duration else 0,
+        wait_p50=loadgen.percentile(waits, 50),
+        wait_p99=loadgen.percentile(waits, 99),
+        wait_p999=loadgen.percentile(waits, 99.9),
+        wait_max=max(waits) if waits else None,
+        fairness=jain(done),
+        utilization=held / (scenario.keys * duration) if duration else 0,
+        cpu=cpu / duration if duration else 0,
+        cpu_per_lease=cpu / completed if completed else None,
+    )
+
+
+def load_scenarios(profile: str) -> list[Scenario]:
+    with open(profile, "r", encoding="utf-8") as f:
+        settings = yaml.safe_load(f) or {}
+    defaults = settings.get("defaults", {})
+    return [Scenario.from_dict({**defaults, **x}) for x in settings.get("scenarios", [])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy key and proxy pool contention benchmark")
+    parser.add_argument("profile", nargs="?", default=os.path.join(ROOT, "benchmarks", "profiles", "pools.yaml"))
+    parser.add_argument("-k", dest="keyword", default="", help="只运行名称包含该字符串的场景")
+    parser.add_argument("--json", default=None, help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    reports = []
+    for scenario in load_scenarios(args.profile):
+        if args.keyword not in scenario.name:
+            continue
+        print(f"--- {scenario.name}: {scenario.tasks} tasks, {scenario.keys} keys, {scenario.proxies} proxies, {scenario.pattern}")
+        report = asyncio.run(run(scenario))
+        reports.append(report)
+        print(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([dataclasses.asdict(x) for x in reports], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
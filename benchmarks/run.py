@@ -0,0 +1,150 @@
+"""
+端到端基准测试：启动模拟上游和使用 profile 配置的 lmproxy，先直连上游测一次基线，再通过 lmproxy 测一次，
+报告两者的差值（lmproxy 自身的开销）和 lmproxy 进程的内存占用。不需要网络。
+
+    python -m benchmarks.run benchmarks/profiles/openai_stream.yaml [--json result.json]
+"""
+import os
+import sys
+import json
+import time
+import typing
+import asyncio
+import argparse
+import subprocess
+import dataclasses
+import yaml
+from benchmarks import loadgen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss(pid: int) -> dict[str, int] | None:
+    """当前和峰值 RSS（字节），只支持 Linux"""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return {
+        "rss": int(status["VmRSS"].split()[0]) * 1024,
+        "peak": int(status["VmHWM"].split()[0]) * 1024,
+    }
+
+
+async def wait_port(port: int, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process exited with {process.returncode} before listening on {port}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"port {port} not ready in {timeout}s")
+
+
+def start_upstream(kind: str, port: int, profile: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.upstream", kind, "--port", str(port), "--profile", profile],
+        cwd=ROOT,
+    )
+
+
+def start_proxy(port: int, profile: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "src"),
+        env={**os.environ, "LMPROXY_SETTINGS": profile},
+    )
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def overhead(proxy: loadgen.Report, direct: loadgen.Report) -> dict[str, float | None]:
+    def diff(a: float | None, b: float | None) -> float | None:
+        return None if a is None or b is None else a - b
+
+    return {
+        "ttft_p50": diff(proxy.ttft_p50, direct.ttft_p50),
+        "ttft_p99": diff(proxy.ttft_p99, direct.ttft_p99),
+        "per_chunk": diff(proxy.chunk_gap_mean, direct.chunk_gap_mean),
+        "latency_p50": diff(proxy.latency_p50, direct.latency_p50),
+    }
+
+
+async def run(profile: str, baseline: bool = True) -> dict[str, typing.Any]:
+    profile = os.path.abspath(profile)
+    with open(profile, "r", encoding="utf-8") as f:
+        settings: dict[str, typing.Any] = yaml.safe_load(f).get("benchmark", {})
+
+    kind = settings.get("upstream", "openai")
+    upstream_port = settings.get("upstream_port", 18001)
+    proxy_port = settings.get("proxy_port", 18000)
+    load = loadgen.LoadSettings.from_dict(settings.get("load", {}))
+
+    result: dict[str, typing.Any] = {"profile": os.path.basename(profile), "load": dataclasses.asdict(load)}
+    # upstream 为空时不启动模拟上游（例如 worker 从 cassette 回放）
+    upstream = start_upstream(kind, upstream_port, profile) if kind else None
+    proxy = None
+    try:
+        if upstream is not None:
+            await wait_port(upstream_port, upstream)
+
+        direct = None
+        baseline_url = settings.get("baseline_url", f"http://127.0.0.1:{upstream_port}/v1/chat/completions")
+        if baseline and baseline_url and upstream is not None:
+            direct = await loadgen.run(baseline_url, load)
+            result["direct"] = dataclasses.asdict(direct)
+            print(f"--- direct ({baseline_url})\n{direct}")
+
+        proxy = start_proxy(proxy_port, profile)
+        await wait_port(proxy_port, proxy)
+        result["rss_idle"] = rss(proxy.pid)
+        result["models"] = await loadgen.models(f"http://127.0.0.1:{proxy_port}/v1/models", load.token)
+        print(f"--- models {result['models']}")
+
+        report = await loadgen.run(f"http://127.0.0.1:{proxy_port}/v1/chat/completions", load)
+        result["proxy"] = dataclasses.asdict(report)
+        result["rss"] = rss(proxy.pid)
+        print(f"--- lmproxy\n{report}")
+
+        if direct is not None:
+            result["overhead"] = overhead(report, direct)
+            print("--- overhead\n" + "  ".join(
+                f"{k} {'n/a' if v is None else f'{v * 1000:.2f}ms'}" for k, v in result["overhead"].items()
+            ))
+        if result["rss"]:
+            print(f"--- rss {result['rss']['rss'] / 2**20:.1f}MiB, peak {result['rss']['peak'] / 2**20:.1f}MiB")
+    finally:
+        if proxy is not None:
+            stop(proxy)
+        if upstream is not None:
+            stop(upstream)
+
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy end-to-end benchmark")
+    parser.add_argument("profile", help="benchmarks/profiles 下的配置文件")
+    parser.add_argument("--no-baseline", action="store_true", help="不直连上游测基线")
+    parser.add_argument("--json", default=None, help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.profile, not args.no_baseline))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
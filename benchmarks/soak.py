@@ -0,0 +1,233 @@
+"""
+长时间运行的浸泡测试：启动模拟上游和 lmproxy，持续保持大量并发的长流式请求，
+定时采样 lmproxy 的 RSS、按类型统计的存活对象、asyncio 任务数和可能无限增长的全局结构（通过 /admin/objects），
+结束时对预热之后的每条序列检查是否持续增长，存在增长时以非零状态退出。
+
+    python -m benchmarks.soak [benchmarks/profiles/soak.yaml] [--duration 600] [--interval 10] [--json samples.json]
+
+profile 中需要设置 admin.token；benchmark.soak.keys 非零时为每个 worker 生成该数量的 key，
+避免 key 数限制并发的流数量。
+"""
+import os
+import sys
+import json
+import time
+import typing
+import asyncio
+import argparse
+import tempfile
+import statistics
+import collections
+import dataclasses
+import rnet
+import yaml
+from benchmarks import loadgen, run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclasses.dataclass
+class SoakSettings:
+    """对应 profile 中的 benchmark.soak"""
+
+    # 总时长和采样间隔（秒）
+    duration: float = 3 * 3600
+    interval: float = 60
+    # 预热时间（秒），之前的采样不参与增长判断
+    warmup: float = 600
+    # 后三分之一的中位数比前三分之一高出 tolerance 比例且超过 min_growth 时视为增长
+    tolerance: float = 0.05
+    min_growth: int = 100
+    min_rss_growth: int = 16 * 2**20
+    # 为每个 worker 生成的 key 数，0 使用 profile 中的 key
+    keys: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any]) -> "SoakSettings":
+        fields = {x.name for x in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+def growth(values: list[float], tolerance: float, min_growth: float) -> float | None:
+    """
+    前、中、后三段的中位数逐段上升，且后段比前段的增量超过阈值时返回增量，否则返回 None。
+    用分段中位数而不是首尾差值，避免被单次采样的抖动（GC、突发请求）误导
+    """
+    if len(values) < 6:
+        return None
+
+    third = len(values) // 3
+    first, middle, last = (statistics.median(x) for x in (values[:third], values[third:-third], values[-third:]))
+    delta = last - first
+    if first < middle < last and delta > min_growth and delta > abs(first) * tolerance:
+        return delta
+    return None
+
+
+def analyze(samples: list[dict[str, typing.Any]], settings: SoakSettings) -> dict[str, float]:
+    """返回持续增长的序列及其增量"""
+    started = samples[0]["elapsed"] if samples else 0
+    samples = [x for x in samples if x["elapsed"] - started >= settings.warmup]
+    series: dict[str, list[float]] = collections.defaultdict(list)
+    names = set()
+    for sample in samples:
+        names.update(f"objects.{k}" for k in sample["objects"])
+        names.update(f"tasks.{k}" for k in sample["tasks_by_coroutine"])
+
+    for sample in samples:
+        if sample["rss"] is not None:
+            series["rss"].append(sample["rss"])
+        series["tasks"].append(sample["tasks"])
+        for name, value in sample["structures"].items():
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    series[f"structures.{name}.{k}"].append(v)
+            else:
+                series[f"structures.{name}"].append(value)
+        for name in names:
+            group, _, key = name.partition(".")
+            source = sample["objects"] if group == "objects" else sample["tasks_by_coroutine"]
+            series[name].append(source.get(key, 0))
+
+    flagged = {}
+    for name, values in series.items():
+        min_growth = settings.min_rss_growth if name == "rss" else settings.min_growth
+        # 任务和全局结构的数量本身较小，任何持续增长都值得注意
+        if name == "tasks" or name.startswith(("tasks.", "structures.")):
+            min_growth = 0
+        if (delta := growth(values, settings.tolerance, min_growth)) is not None:
+            flagged[name] = delta
+    return flagged
+
+
+async def objects(url: str, token: str) -> dict[str, typing.Any]:
+    client = rnet.Client()
+    async with await client.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=60) as response:
+        assert isinstance(response, rnet.Response)
+        assert response.ok, f"{response.status} {await response.text()}"
+        return await response.json()
+
+
+async def soak(profile: str, settings: SoakSettings, load: loadgen.LoadSettings, token: str) -> dict[str, typing.Any]:
+    with open(profile, "r", encoding="utf-8") as f:
+        benchmark: dict[str, typing.Any] = yaml.safe_load(f).get("benchmark", {})
+
+    kind = benchmark.get("upstream", "openai")
+    upstream_port = benchmark.get("upstream_port", 18001)
+    proxy_port = benchmark.get("proxy_port", 18000)
+    url = f"http://127.0.0.1:{proxy_port}/v1/chat/completions"
+
+    upstream = run.start_upstream(kind, upstream_port, profile)
+    proxy = None
+    samples: list[dict[str, typing.Any]] = []
+    statuses: collections.Counter[str] = collections.Counter()
+    try:
+        await run.wait_port(upstream_port, upstream)
+        proxy = run.start_proxy(proxy_port, profile)
+        await run.wait_port(proxy_port, proxy)
+
+        started = time.monotonic()
+        deadline = started + settings.duration
+        client = rnet.Client()
+        body = json.dumps(load.payload()).encode("utf-8")
+
+        async def worker() -> None:
+            # 只累计状态，不保留每个请求的结果，避免测试本身的内存增长
+            while time.monotonic() < deadline:
+                result = await loadgen.request(client, url, load, body)
+                statuses[str(result.status)] += 1
+
+        async def sampler() -> None:
+            while True:
+                sample = await objects(f"http://127.0.0.1:{proxy_port}/admin/objects?limit=0", token)
+                sample["elapsed"] = time.monotonic() - started
+                sample["rss"] = (run.rss(proxy.pid) or {}).get("rss", sample["rss"])
+                sample["requests"] = sum(statuses.values())
+                samples.append(sample)
+                rss = f"{sample['rss'] / 2**20:.1f}MiB" if sample["rss"] else "n/a"
+                print(
+                    f"[{sample['elapsed']:7.0f}s] rss {rss}  tasks {sample['tasks']}"
+                    f"  objects {sum(sample['objects'].values())}  requests {sample['requests']} {dict(statuses)}",
+                    flush=True,
+                )
+                if time.monotonic() >= deadline:
+                    return
+                await asyncio.sleep(min(settings.interval, max(0, deadline - time.monotonic())))
+
+        sampling = asyncio.create_task(sampler())
+        await asyncio.gather(*[worker() for _ in range(load.concurrency)])
+        await sampling
+    finally:
+        if proxy is not None:
+            run.stop(proxy)
+        run.stop(upstream)
+
+    return {"samples": samples, "statuses": dict(statuses), "growth": analyze(samples, settings)}
+
+
+def prepare(profile: str, settings: SoakSettings) -> str:
+    """生成 key 后写入临时 profile，返回其路径；不需要生成时返回原路径"""
+    if not settings.keys:
+        return profile
+
+    with open(profile, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    for i, worker in enumerate(data.get("worker", {}).get("workers", [])):
+        if isinstance(worker, dict):
+            worker["api_keys"] = [f"soak-{i}-{n:05d}" for n in range(settings.keys)]
+
+    fd, path = tempfile.mkstemp(prefix="lmproxy-soak-", suffix=".yaml")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy soak test for memory and task growth")
+    parser.add_argument("profile", nargs="?", default=os.path.join(ROOT, "benchmarks", "profiles", "soak.yaml"))
+    parser.add_argument("--duration", type=float, default=None, help="覆盖 benchmark.soak.duration（秒）")
+    parser.add_argument("--interval", type=float, default=None, help="覆盖 benchmark.soak.interval（秒）")
+    parser.add_argument("--warmup", type=float, default=None, help="覆盖 benchmark.soak.warmup（秒）")
+    parser.add_argument("--concurrency", type=int, default=None, help="覆盖 benchmark.load.concurrency")
+    parser.add_argument("--json", default=None, help="将全部采样和结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    profile = os.path.abspath(args.profile)
+    with open(profile, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    settings = SoakSettings.from_dict(data.get("benchmark", {}).get("soak", {}))
+    load = loadgen.LoadSettings.from_dict(data.get("benchmark", {}).get("load", {}))
+    token = data.get("admin", {}).get("token", "")
+    if not token:
+        parser.error("profile 中需要设置 admin.token 以读取 /admin/objects")
+
+    for name in ("duration", "interval", "warmup"):
+        if (value := getattr(args, name)) is not None:
+            setattr(settings, name, value)
+    if args.concurrency is not None:
+        load.concurrency = args.concurrency
+
+    effective = prepare(profile, settings)
+    try:
+        result = asyncio.run(soak(effective, settings, load, token))
+    finally:
+        if effective != profile:
+            os.remove(effective)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    print(f"--- {sum(result['statuses'].values())} requests {result['statuses']}")
+    if not result["growth"]:
+        print("--- no sustained growth")
+        return
+
+    print("--- sustained growth")
+    for name, delta in sorted(result["growth"].items(), key=lambda x: -x[1]):
+        print(f"{name:60s} +{delta / 2**20:.1f}MiB" if name == "rss" else f"{name:60s} +{delta:.0f}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+启动模拟上游
+
+    python -m benchmarks.upstream openai --port 18001 --profile benchmarks/profiles/openai_stream.yaml
+"""
+import argparse
+import importlib
+import uvicorn
+import yaml
+from benchmarks.upstreams import common
+
+
+def load_mock_settings(profile: str | None) -> common.MockSettings:
+    if not profile:
+        return common.MockSettings()
+
+    with open(profile, "r", encoding="utf-8") as f:
+        settings = yaml.safe_load(f) or {}
+    return common.MockSettings.from_dict(settings.get("benchmark", {}).get("mock", {}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lmproxy mock upstream")
+    parser.add_argument("kind", help="benchmarks/upstreams 下的模块名，例如 openai")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--profile", default=None, help="读取其中的 benchmark.mock")
+    args = parser.parse_args()
+
+    module = importlib.import_module(f"benchmarks.upstreams.{args.kind}")
+    app = module.create_app(load_mock_settings(args.profile))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
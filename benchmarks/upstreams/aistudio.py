@@ -0,0 +1,103 @@
+"""
+generativelanguage.googleapis.com 的模拟上游，对应 workers.AiStudioWorker
+
+streamGenerateContent 默认返回跨多行的 JSON 数组（`[{...}\\n,\\r\\n{...}]`），带 alt=sse 时返回 SSE，
+和 Gemini API 一致；思考内容是 thought 为 true 的 part，usageMetadata 在最后一块中
+"""
+import json
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+STATUS = {400: "INVALID_ARGUMENT", 403: "PERMISSION_DENIED", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL"}
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    def failure(status: int) -> blacksheep.Response:
+        return common.failure(status, {"code": status, "message": f"mock {status}", "status": STATUS.get(status, "UNKNOWN")})
+
+    def candidate(parts: list[dict[str, typing.Any]], finish: bool = False) -> dict[str, typing.Any]:
+        result = {"content": {"parts": parts, "role": "model"}, "index": 0}
+        if finish:
+            result["finishReason"] = "STOP"
+        return result
+
+    @app.router.get("/v1beta/models")
+    async def models(request: blacksheep.Request) -> blacksheep.Response:
+        if not request.query.get("key"):
+            return failure(403)
+
+        return blacksheep.json({"models": [{
+            "name": "models/mock-model",
+            "baseModelId": "mock-model",
+            "version": "001",
+            "displayName": "Mock Model",
+            "supportedGenerationMethods": ["generateContent", "countTokens"],
+        }]})
+
+    @app.router.post("/v1beta/*")
+    async def generate(request: blacksheep.Request) -> blacksheep.Response:
+        model, _, method = request.route_values["tail"].partition(":")
+        if method not in ("generateContent", "streamGenerateContent"):
+            return failure(400)
+        if not request.query.get("key"):
+            return failure(403)
+
+        body = json.loads(await request.read() or b"{}")
+        if status := upstream.fault():
+            return failure(status)
+
+        thinking = (body.get("generationConfig") or {}).get("thinkingConfig") or {}
+        reasoning = thinking.get("includeThoughts", False) and thinking.get("thinkingBudget") != 0
+        prompt_tokens = sum(
+            len(part.get("text", "")) for content in body.get("contents", []) for part in content.get("parts", [])
+        ) // 4
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": settings.tokens,
+            "thoughtsTokenCount": settings.reasoning_tokens if reasoning else 0,
+        }
+        usage["totalTokenCount"] = sum(usage.values())
+
+        if method == "generateContent":
+            parts = []
+            if reasoning and settings.reasoning_tokens:
+                parts.append({"text": await upstream.complete(settings.reasoning_tokens), "thought": True})
+            parts.append({"text": await upstream.complete()})
+            return blacksheep.json({
+                "candidates": [candidate(parts, True)],
+                "usageMetadata": usage,
+                "modelVersion": model.removeprefix("models/"),
+            })
+
+        def chunk(parts: list[dict[str, typing.Any]], finish: bool = False) -> dict[str, typing.Any]:
+            data = {"candidates": [candidate(parts, finish)], "modelVersion": model.removeprefix("models/")}
+            if finish:
+                data["usageMetadata"] = usage
+            return data
+
+        async def chunks() -> typing.AsyncGenerator[dict[str, typing.Any], None]:
+            async for phase, text in upstream.stream(reasoning):
+                yield chunk([{"text": text, "thought": True} if phase == "reasoning" else {"text": text}])
+            yield chunk([{"text": ""}], True)
+
+        if request.query.get("alt", [""])[0] == "sse":
+            async def stream() -> typing.AsyncGenerator[bytes, None]:
+                async for data in chunks():
+                    yield f"data: {json.dumps(data, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+
+            return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", stream))
+
+        async def array() -> typing.AsyncGenerator[bytes, None]:
+            separator = b"["
+            async for data in chunks():
+                yield separator + json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+                separator = b"\n,\r\n"
+            yield b"]"
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"application/json", array))
+
+    return app
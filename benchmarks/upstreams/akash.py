@@ -0,0 +1,94 @@
+"""
+chat.akash.network 的模拟上游，对应 workers.AkashWorker
+
+聊天接口返回 AI SDK 的数据流：每行 `<类型>:<JSON>`，文本为 `0:"..."`，推理内容包在 `<think>` 和 `</think>` 之间，
+结束时 `e:` 和 `d:` 行带有 usage。AkashGen 模型返回图片任务 ID，再由 /api/image-status/ 轮询结果
+"""
+import json
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+    # 图片任务 ID -> 剩余的 pending 次数
+    jobs: dict[str, int] = {}
+
+    def line(type: str, data: typing.Any) -> bytes:
+        return f"{type}:{json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n".encode("utf-8")
+
+    @app.router.get("/api/auth/session/")
+    async def session(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json({"success": True})
+
+    @app.router.get("/api/models/")
+    async def models(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json([
+            {"id": "mock-model", "name": "Mock Model", "available": True},
+            {"id": "AkashGen", "name": "AkashGen", "available": True},
+        ])
+
+    @app.router.post("/api/chat/")
+    async def chat(request: blacksheep.Request) -> blacksheep.Response:
+        body = json.loads(await request.read() or b"{}")
+        if status := upstream.fault():
+            return common.failure(status)
+
+        message_id = f"msg-{upstream.random.getrandbits(64):x}"
+        usage = {
+            "promptTokens": common.prompt_tokens(body.get("messages", [])),
+            "completionTokens": settings.tokens + settings.reasoning_tokens,
+        }
+        finish = {"finishReason": "stop", "usage": usage}
+
+        if body.get("model") == "AkashGen":
+            job_id = f"job-{upstream.random.getrandbits(64):x}"
+            jobs[job_id] = 2
+
+            async def generate() -> typing.AsyncGenerator[bytes, None]:
+                yield line("f", {"messageId": message_id})
+                yield line("0", f"<image_generation> jobId='{job_id}' prompt='mock' negative=''</image_generation>")
+                yield line("e", {**finish, "isContinued": False})
+                yield line("d", finish)
+        else:
+            async def generate() -> typing.AsyncGenerator[bytes, None]:
+                yield line("f", {"messageId": message_id})
+                reasoning = False
+                async for phase, text in upstream.stream():
+                    if phase == "reasoning" and not reasoning:
+                        reasoning = True
+                        yield line("0", "<think>")
+                    elif phase == "content" and reasoning:
+                        reasoning = False
+                        yield line("0", "</think>")
+                    yield line("0", text)
+                yield line("e", {**finish, "isContinued": False})
+                yield line("d", finish)
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/plain; charset=utf-8", generate))
+
+    @app.router.get("/api/image-status/")
+    async def image_status(request: blacksheep.Request) -> blacksheep.Response:
+        results = []
+        for job_id in request.query.get("ids", [""])[0].split(","):
+            if job_id not in jobs:
+                results.append({"id": job_id, "status": "failed"})
+            elif jobs[job_id] > 0:
+                jobs[job_id] -= 1
+                results.append({"id": job_id, "status": "pending"})
+            else:
+                del jobs[job_id]
+                results.append({
+                    "id": job_id,
+                    "status": "succeeded",
+                    "result": f"{request.scheme}://{request.host}/images/{job_id}.jpg",
+                })
+        return blacksheep.json(results)
+
+    @app.router.get("/images/{name}")
+    async def images(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.Response(200, None, blacksheep.Content(b"image/jpeg", common.image()))
+
+    return app
@@ -0,0 +1,72 @@
+"""
+demo.chat-sdk.dev 的模拟上游，对应 workers.ChatbotWorker
+
+首页和 /api/auth/session 下发访客 cookie，/api/chat 返回 AI SDK 的 UI 消息流（SSE），
+文本和推理内容分别是 text-delta 和 reasoning-delta 事件，只有 *-reasoning 模型输出推理内容
+"""
+import json
+import typing
+import hashlib
+import blacksheep
+from benchmarks.upstreams import common
+
+PARTS = {"reasoning": "reasoning", "content": "text"}
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    def session_cookie(response: blacksheep.Response) -> blacksheep.Response:
+        response.set_cookie(blacksheep.Cookie("authjs.session-token", f"guest-{upstream.random.getrandbits(64):x}", path="/"))
+        return response
+
+    @app.router.get("/")
+    async def index(request: blacksheep.Request) -> blacksheep.Response:
+        return session_cookie(blacksheep.html("<!doctype html><title>Chatbot</title>"))
+
+    @app.router.get("/api/auth/session")
+    async def session(request: blacksheep.Request) -> blacksheep.Response:
+        return session_cookie(blacksheep.json({
+            "user": {"id": "guest", "email": "guest@example.com", "type": "guest"},
+            "expires": "2099-01-01T00:00:00.000Z",
+        }))
+
+    @app.router.post("/api/chat")
+    async def chat(request: blacksheep.Request) -> blacksheep.Response:
+        body = json.loads(await request.read() or b"{}")
+        if status := upstream.fault():
+            return common.failure(status)
+
+        reasoning = str(body.get("selectedChatModel", "")).endswith("-reasoning")
+        message_id = f"msg-{upstream.random.getrandbits(64):x}"
+
+        async def generate() -> typing.AsyncGenerator[bytes, None]:
+            yield common.sse({"type": "start", "messageId": message_id})
+            yield common.sse({"type": "start-step"})
+            part = None
+            async for phase, text in upstream.stream(reasoning):
+                if PARTS[phase] != part:
+                    if part is not None:
+                        yield common.sse({"type": f"{part}-end", "id": "0"})
+                    part = PARTS[phase]
+                    yield common.sse({"type": f"{part}-start", "id": "0"})
+                yield common.sse({"type": f"{part}-delta", "id": "0", "delta": text})
+            yield common.sse({"type": f"{part}-end", "id": "0"})
+            yield common.sse({"type": "finish-step"})
+            yield common.sse({"type": "finish"})
+            yield common.sse("[DONE]")
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", generate))
+
+    @app.router.post("/api/files/upload")
+    async def upload(request: blacksheep.Request) -> blacksheep.Response:
+        data = await request.read() or b""
+        name = hashlib.sha256(data).hexdigest()[:16]
+        return blacksheep.json({
+            "url": f"{request.scheme}://{request.host}/files/{name}",
+            "pathname": name,
+            "contentType": "image/png",
+        })
+
+    return app
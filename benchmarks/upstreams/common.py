@@ -0,0 +1,134 @@
+import json
+import time
+import random
+import typing
+import asyncio
+import dataclasses
+import blacksheep
+
+# 固定词表，相同 seed 下输出完全相同
+WORDS = (
+    "the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "lorem", "ipsum",
+    "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod",
+    "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "你好", "世界",
+)
+
+
+@dataclasses.dataclass
+class MockSettings:
+    """
+    模拟上游的行为，对应 profile 中的 benchmark.mock
+    """
+
+    # 首个 token 之前的延迟（秒）
+    ttft: float = 0.2
+    tokens_per_second: float = 100
+    # 每个响应的 token 数
+    tokens: int = 256
+    # 每个流式块包含的 token 数
+    chunk_tokens: int = 1
+    # 返回 500 的概率
+    error_rate: float = 0.0
+    # 返回 429 的概率
+    rate_limit_rate: float = 0.0
+    # 推理内容的 token 数（在正文之前输出）
+    reasoning_tokens: int = 0
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any]) -> "MockSettings":
+        fields = {x.name for x in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+class Upstream:
+    """模拟上游共用的随机数、故障注入和 token 节奏"""
+
+    def __init__(self, settings: MockSettings) -> None:
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+
+    def fault(self) -> int | None:
+        """按配置的概率返回 500 或 429，否则返回 None"""
+        roll = self.random.random()
+        if roll < self.settings.error_rate:
+            return 500
+        if roll < self.settings.error_rate + self.settings.rate_limit_rate:
+            return 429
+        return None
+
+    def text(self, tokens: int) -> list[str]:
+        return [self.random.choice(WORDS) + " " for _ in range(tokens)]
+
+    async def chunks(self, tokens: int | None = None, first: bool = True) -> typing.AsyncGenerator[str, None]:
+        """
+        按 ttft 和 tokens_per_second 的节奏输出文本块，first 为 False 时不等待 ttft（例如推理之后的正文），
+        使用绝对时间计算下一块的时间，sleep 的误差不会累积
+        """
+        settings = self.settings
+        words = self.text(settings.tokens if tokens is None else tokens)
+        step = max(1, settings.chunk_tokens)
+        interval = step / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+
+        ttft = settings.ttft if first else 0
+        started = time.monotonic() + ttft
+        await asyncio.sleep(ttft)
+        for index in range(0, len(words), step):
+            if (delay := started + (index // step) * interval - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            yield "".join(words[index:index + step])
+
+    async def stream(self, reasoning: bool = True) -> typing.AsyncGenerator[tuple[str, str], None]:
+        """
+        先输出 reasoning_tokens 个推理 token，再输出正文，产生 ("reasoning" | "content", 文本块)，
+        reasoning 为 False 时（例如请求未开启思考）只输出正文
+        """
+        first = True
+        if reasoning and self.settings.reasoning_tokens:
+            async for text in self.chunks(self.settings.reasoning_tokens):
+                yield "reasoning", text
+            first = False
+        async for text in self.chunks(first=first):
+            yield "content", text
+
+    async def complete(self, tokens: int | None = None) -> str:
+        """非流式响应，等待生成全部 token 的时间"""
+        settings = self.settings
+        tokens = settings.tokens if tokens is None else tokens
+        duration = tokens / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        await asyncio.sleep(settings.ttft + duration)
+        return "".join(self.text(tokens))
+
+
+def prompt_tokens(messages: list[dict[str, typing.Any]]) -> int:
+    """粗略估算，约 4 个字符一个 token"""
+    return sum(len(str(x.get("content", ""))) for x in messages) // 4
+
+
+def application() -> blacksheep.Application:
+    """使用独立的路由，可以和 lmproxy 的应用（默认路由）在同一进程中运行"""
+    return blacksheep.Application(router=blacksheep.Router())
+
+
+def sse(data: typing.Any) -> bytes:
+    """一个 SSE 事件，字符串原样输出（例如 [DONE]），其余编码为紧凑的 JSON"""
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"data: {data}\n\n".encode("utf-8")
+
+
+def failure(status: int, error: typing.Any = None) -> blacksheep.Response:
+    """模拟上游的错误响应，429 带 Retry-After"""
+    return blacksheep.Response(
+        status,
+        [(b"Retry-After", b"1")] if status == 429 else None,
+        blacksheep.Content(
+            b"application/json",
+            json.dumps({"error": error or {"message": f"mock {status}"}}).encode("utf-8"),
+        ),
+    )
+
+
+def image(size: int = 4096) -> bytes:
+    """只有 JPEG 头尾标记的占位图片，不可解码，只用于测试传输"""
+    return b"\xff\xd8\xff\xe0" + bytes(max(0, size - 6)) + b"\xff\xd9"
@@ -0,0 +1,53 @@
+"""
+www.k2think.ai 的模拟上游，对应 workers.K2ThinkWorker
+
+/api/guest/chat/completions 每行 `data: {"content": ...}`，content 是到目前为止完整的 HTML 片段：
+推理内容在 `<details type="reasoning">` 中，正文在 `<answer>` 中，由客户端去掉已收到的前缀；最后一行带有 usage
+"""
+import json
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    def render(reasoning: str, content: str, done: bool) -> str:
+        html = ""
+        if reasoning:
+            html += (
+                f'<details type="reasoning" done="{str(bool(content)).lower()}">'
+                f"<summary>Thought</summary>\n> {reasoning}</details>\n"
+            )
+        if content:
+            html += f"<answer>{content}</answer>" if done else f"<answer>{content}"
+        return html
+
+    @app.router.get("/api/guest/models")
+    async def models(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json({"data": [{"id": "MBZUAI-IFM/K2-Think", "name": "K2-Think", "status": "active"}]})
+
+    @app.router.post("/api/guest/chat/completions")
+    async def completions(request: blacksheep.Request) -> blacksheep.Response:
+        body = json.loads(await request.read() or b"{}")
+        if status := upstream.fault():
+            return common.failure(status)
+
+        usage = {
+            "prompt_tokens": common.prompt_tokens(body.get("messages", [])),
+            "completion_tokens": settings.tokens + settings.reasoning_tokens,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        async def generate() -> typing.AsyncGenerator[bytes, None]:
+            texts = {"reasoning": "", "content": ""}
+            async for phase, text in upstream.stream():
+                texts[phase] += text
+                yield common.sse({"content": render(texts["reasoning"], texts["content"], False)})
+            yield common.sse({"content": render(texts["reasoning"], texts["content"], True), "usage": usage})
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", generate))
+
+    return app
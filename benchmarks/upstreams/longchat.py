@@ -0,0 +1,38 @@
+"""
+longcat.chat 的模拟上游，对应 workers.LongchatWorker
+
+/api/v1/chat-completion-oversea 返回 SSE，event.content 是该类型（think 或 content）到目前为止的完整文本，
+由客户端去掉已收到的前缀；只有 reasonEnabled 时输出 think 事件，最后一个事件带有 usage
+"""
+import json
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    @app.router.post("/api/v1/chat-completion-oversea")
+    async def completions(request: blacksheep.Request) -> blacksheep.Response:
+        body = json.loads(await request.read() or b"{}")
+        if status := upstream.fault():
+            return common.failure(status)
+
+        reasoning = bool(body.get("reasonEnabled", 0))
+        input_tokens = len(str(body.get("content", ""))) // 4
+        output_tokens = settings.tokens + (settings.reasoning_tokens if reasoning else 0)
+        usage = {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens}
+
+        async def generate() -> typing.AsyncGenerator[bytes, None]:
+            texts = {"think": "", "content": ""}
+            async for phase, text in upstream.stream(reasoning):
+                type = "think" if phase == "reasoning" else "content"
+                texts[type] += text
+                yield common.sse({"event": {"type": type, "content": texts[type]}})
+            yield common.sse({"event": {"type": "content", "content": texts["content"], "usage": usage}})
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", generate))
+
+    return app
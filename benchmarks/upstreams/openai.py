@@ -0,0 +1,84 @@
+"""
+OpenAI 兼容的模拟上游，对应 workers.OpenAiWorker
+"""
+import json
+import time
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+
+async def chat_completions(upstream: common.Upstream, body: dict[str, typing.Any]) -> blacksheep.Response:
+    """/v1/chat/completions 的响应，Pollinations 等 OpenAI 格式的上游共用"""
+    settings = upstream.settings
+    if status := upstream.fault():
+        return common.failure(status)
+
+    id = f"chatcmpl-{upstream.random.getrandbits(64):x}"
+    model = body.get("model", "mock-model")
+    usage = {
+        "prompt_tokens": common.prompt_tokens(body.get("messages", [])),
+        "completion_tokens": settings.tokens + settings.reasoning_tokens,
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    def chunk(delta: dict[str, typing.Any], **extra) -> bytes:
+        return common.sse({
+            "id": id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            **extra,
+        })
+
+    if not body.get("stream", False):
+        reasoning = await upstream.complete(settings.reasoning_tokens) if settings.reasoning_tokens else None
+        content = await upstream.complete()
+        return blacksheep.json({
+            "id": id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "reasoning_content": reasoning},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def generate() -> typing.AsyncGenerator[bytes, None]:
+        yield chunk({"role": "assistant", "content": ""})
+        async for phase, text in upstream.stream():
+            yield chunk({"reasoning_content" if phase == "reasoning" else "content": text})
+        yield chunk({}, usage=usage)
+        yield common.sse("[DONE]")
+
+    return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", generate))
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    @app.router.get("/v1/models")
+    async def models(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json({"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+
+    @app.router.post("/v1/chat/completions")
+    async def completions(request: blacksheep.Request) -> blacksheep.Response:
+        return await chat_completions(upstream, json.loads(await request.read() or b"{}"))
+
+    @app.router.post("/v1/embeddings")
+    async def embeddings(request: blacksheep.Request) -> blacksheep.Response:
+        if status := upstream.fault():
+            return common.failure(status)
+
+        return blacksheep.json({
+            "object": "list",
+            "data": [{"object": "embedding", "index": 0, "embedding": [upstream.random.random() for _ in range(256)]}],
+            "usage": {"prompt_tokens": 8, "total_tokens": 8},
+        })
+
+    return app
@@ -0,0 +1,39 @@
+"""
+pollinations.ai 的模拟上游，对应 workers.PollinationsWorker
+
+text.pollinations.ai 的接口（/models、OpenAI 格式的 /openai）挂在根路径下，
+image.pollinations.ai 的接口（/models、/prompt/{prompt}）挂在 /image 下，
+worker 的 text_base_url 和 image_base_url 分别指向这两处
+"""
+import json
+import blacksheep
+from benchmarks.upstreams import common, openai
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    @app.router.get("/models")
+    async def text_models(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json([
+            {"name": "mock-model", "description": "Mock Model", "input_modalities": ["text"], "output_modalities": ["text"]},
+        ])
+
+    @app.router.post("/openai")
+    async def completions(request: blacksheep.Request) -> blacksheep.Response:
+        return await openai.chat_completions(upstream, json.loads(await request.read() or b"{}"))
+
+    @app.router.get("/image/models")
+    async def image_models(request: blacksheep.Request) -> blacksheep.Response:
+        return blacksheep.json(["flux", "turbo"])
+
+    @app.router.get("/image/prompt/{prompt}")
+    async def image(request: blacksheep.Request) -> blacksheep.Response:
+        if status := upstream.fault():
+            return common.failure(status)
+
+        await upstream.complete(0)
+        return blacksheep.Response(200, None, blacksheep.Content(b"image/jpeg", common.image()))
+
+    return app
@@ -0,0 +1,47 @@
+"""
+chat.z.ai 的模拟上游，对应 workers.ZaiWorker
+
+/api/v1/auths/ 下发访客 token，/api/chat/completions 返回 SSE，每个事件的 data.delta_content 是增量文本，
+data.phase 为 thinking（开启 features.enable_thinking 时）或 answer，最后一个事件 phase 为 done 并带有 usage
+"""
+import json
+import typing
+import blacksheep
+from benchmarks.upstreams import common
+
+
+def create_app(settings: common.MockSettings) -> blacksheep.Application:
+    app = common.application()
+    upstream = common.Upstream(settings)
+
+    def event(**data) -> bytes:
+        return common.sse({"type": "chat:completion", "data": data})
+
+    @app.router.get("/api/v1/auths/")
+    async def auths(request: blacksheep.Request) -> blacksheep.Response:
+        id = f"guest-{upstream.random.getrandbits(64):x}"
+        return blacksheep.json({"id": id, "name": "Guest", "role": "guest", "token": f"mock-{id}"})
+
+    @app.router.post("/api/chat/completions")
+    async def completions(request: blacksheep.Request) -> blacksheep.Response:
+        body = json.loads(await request.read() or b"{}")
+        if not request.get_first_header(b"Authorization"):
+            return common.failure(401, {"detail": "Not authenticated"})
+        if status := upstream.fault():
+            return common.failure(status)
+
+        thinking = bool(body.get("features", {}).get("enable_thinking", False))
+        usage = {
+            "prompt_tokens": common.prompt_tokens(body.get("messages", [])),
+            "completion_tokens": settings.tokens + (settings.reasoning_tokens if thinking else 0),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        async def generate() -> typing.AsyncGenerator[bytes, None]:
+            async for phase, text in upstream.stream(thinking):
+                yield event(delta_content=text, phase="thinking" if phase == "reasoning" else "answer")
+            yield event(delta_content="", phase="done", done=True, usage=usage)
+
+        return blacksheep.Response(200, None, blacksheep.StreamedContent(b"text/event-stream", generate))
+
+    return app
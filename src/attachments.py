@@ -0,0 +1,275 @@
+"""
+请求中 base64 图片（data: URL）的内容寻址存储
+
+客户端每一轮都会重新发送之前的所有图片，需要上传图片的 worker 在每个请求中都会重新解码和上传同一张图片。
+AttachmentStore 以 data: URL 的 SHA-256 为键，每张图片只解码一次；解码后的字节在内存预算内保存在内存中，
+超出后按最久未使用的顺序写入临时文件，通过 mmap 读取。
+worker 的派生结果（例如上传后的 URL）按名称缓存在条目上，条目被淘汰时一起丢弃。
+
+条目中的字节随时可能被其他请求淘汰，需要字节时应在 get() 之后、任何 await 之前立即调用 data() 读出，
+或者用 load() 读取，必要时从 data: URL 重新解码。
+"""
+import mmap
+import typing
+import asyncio
+import hashlib
+import logging
+import binascii
+import tempfile
+import collections
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+
+def _sizeof(value: typing.Any) -> int:
+    # 只估算字符串和字节（以及一层 dict 中的字符串和字节）的大小
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(x) for x in value.values() if isinstance(x, (str, bytes)))
+    return 0
+
+
+class Attachment:
+    """一张图片的句柄，字节通过 AttachmentStore.data() 读取"""
+
+    __slots__ = ("digest", "mime_type", "size", "_data", "_offset", "_derived")
+
+    def __init__(self, digest: str, mime_type: str) -> None:
+        self.digest = digest
+        self.mime_type = mime_type
+        # 解码后的字节数，未解码时为 0
+        self.size = 0
+        # 内存中的字节；写入临时文件后为 None，_offset 为文件中的位置
+        self._data: bytes | None = None
+        self._offset = -1
+        self._derived: dict[str, typing.Any] = {}
+
+    @property
+    def decoded(self) -> bool:
+        return self._data is not None or self._offset >= 0
+
+    @property
+    def extension(self) -> str:
+        return self.mime_type.split("/")[-1]
+
+    def derived(self, key: str) -> typing.Any:
+        """缓存的派生结果，没有时返回 None"""
+        return self._derived.get(key, None)
+
+    def __repr__(self) -> str:
+        return f"Attachment({self.digest[:12]}, {self.mime_type}, {self.size} bytes)"
+
+
+class AttachmentStore:
+    def __init__(self, max_memory: int = 64 * 2**20, max_disk: int = 1024 * 2**20, max_entries: int = 1024):
+        """
+        Args:
+            max_memory: 内存中的字节和派生结果的上限（字节），超过后把最久未使用的图片写入临时文件
+            max_disk: 临时文件的上限（字节），超过后清空文件，其中的图片下次使用时重新解码
+            max_entries: 最大条目数
+        """
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.max_entries = max_entries
+        self.memory = 0
+        self.disk = 0
+        # hit：已有条目；miss：新条目；decoded：解码次数
+        self.counts: dict[str, int] = {"hit": 0, "miss": 0, "decoded": 0}
+        self._entries: collections.OrderedDict[str, Attachment] = collections.OrderedDict()
+        self._file: typing.BinaryIO | None = None
+        self._map: mmap.mmap | None = None
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def find(self, url: str) -> Attachment | None:
+        """
+        返回 data: URL 对应的条目，不是 base64 的 data: URL 时返回 None。
+        只计算摘要，不解码；只需要派生结果时不必读取字节
+        """
+        if not url.startswith("data:"):
+            return None
+        raw = url.encode("utf-8")
+        index = raw.find(b";base64,")
+        if index < 0:
+            return None
+
+        digest = hashlib.sha256(raw).hexdigest()
+        attachment = self._entries.get(digest, None)
+        if attachment is None:
+            self.counts["miss"] += 1
+            attachment = self._entries[digest] = Attachment(digest, raw[5:index].decode("utf-8"))
+        else:
+            self.counts["hit"] += 1
+            self._entries.move_to_end(digest)
+        return attachment
+
+    def get(self, url: str) -> Attachment | None:
+        """
+        返回 data: URL 对应的已解码的条目，不是 base64 的 data: URL 时返回 None。
+        返回后可以立即调用 data() 读取字节
+        """
+        if (attachment := self.find(url)) is not None:
+            self.load(attachment, url)
+        return attachment
+
+    def load(self, attachment: Attachment, url: str) -> bytes:
+        """
+        返回条目的字节，已不在内存和临时文件中时从 url 重新解码，任何时候调用都可以得到字节
+        """
+        payload = memoryview(url.encode("utf-8"))[url.index(";base64,") + 8:]
+        if self._entries.get(attachment.digest, None) is not attachment:
+            # 已被淘汰的条目不再计入存储的大小
+            if attachment._data is not None:
+                return attachment._data
+            self.counts["decoded"] += 1
+            return binascii.a2b_base64(payload)
+
+        if not attachment.decoded:
+            self._decode(attachment, payload)
+        self._evict(attachment)
+        if not attachment.decoded:
+            # 条目在临时文件中，淘汰其他图片时文件被清空
+            self._decode(attachment, payload)
+        return self.data(attachment)
+
+    def _decode(self, attachment: Attachment, data: memoryview) -> None:
+        self.counts["decoded"] += 1
+        attachment._data = binascii.a2b_base64(data)
+        attachment.size = len(attachment._data)
+        self.memory += attachment.size
+
+    def data(self, attachment: Attachment) -> bytes:
+        if attachment._data is not None:
+            return attachment._data
+        if attachment._offset >= 0:
+            return self._read(attachment._offset, attachment.size)
+        raise LookupError(f"{attachment} is not decoded")
+
+    def put_derived(self, attachment: Attachment, key: str, value: typing.Any) -> None:
+        if self._entries.get(attachment.digest, None) is not attachment:
+            # 已被淘汰的条目，只保存在句柄上
+            attachment._derived[key] = value
+            return
+
+        if key in attachment._derived:
+            self.memory -= _sizeof(attachment._derived[key])
+        attachment._derived[key] = value
+        self.memory += _sizeof(value)
+        self._evict(attachment)
+
+    async def derive(
+        self, attachment: Attachment, key: str, factory: typing.Callable[[], typing.Awaitable[T | None]]
+    ) -> T | None:
+        """
+        返回缓存的派生结果，没有时调用 factory 生成；同一条目的同一结果同时只生成一次，
+        结果为 None 或出现异常时不缓存
+        """
+        if (value := attachment._derived.get(key, None)) is not None:
+            return value
+
+        name = (attachment.digest, key)
+        task = self._inflight.get(name, None)
+        if task is None:
+            async def load() -> T | None:
+                try:
+                    value = await factory()
+                finally:
+                    self._inflight.pop(name, None)
+                if value is not None:
+                    self.put_derived(attachment, key, value)
+                return value
+
+            task = self._inflight[name] = asyncio.ensure_future(load())
+            # 调用者都被取消时，避免 "exception was never retrieved"
+            task.add_done_callback(lambda x: x.cancelled() or x.exception())
+
+        # 调用者被取消时不影响其他等待同一结果的调用者
+        return await asyncio.shield(task)
+
+    def _evict(self, keep: Attachment) -> None:
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries.values())))
+
+        if self.memory <= self.max_memory:
+            return
+
+        # 先把最久未使用的图片写入临时文件，keep 是刚刚使用的条目，保留在内存中
+        for attachment in self._entries.values():
+            if self.memory <= self.max_memory:
+                return
+            if attachment is not keep and attachment._data is not None:
+                self._spill(attachment)
+
+        # 派生结果（或超过临时文件上限、无法写入文件的图片）仍然超过上限时丢弃整个条目，
+        # 只在内存中没有内容的条目不需要丢弃
+        for attachment in list(self._entries.values()):
+            if self.memory <= self.max_memory:
+                return
+            if attachment is not keep and (attachment._derived or attachment._data is not None):
+                self._drop(attachment)
+
+    def _spill(self, attachment: Attachment) -> None:
+        if self.disk + attachment.size > self.max_disk:
+            self._reset_disk()
+        if attachment.size > self.max_disk:
+            return
+
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="lmproxy-attachments-")
+        self._file.seek(0, 2)
+        attachment._offset = self._file.tell()
+        self._file.write(attachment._data)
+        self.disk += attachment.size
+        self.memory -= attachment.size
+        attachment._data = None
+
+    def _reset_disk(self) -> None:
+        """清空临时文件，其中的图片回到未解码状态"""
+        logger.debug(f"Attachment spill file reached {self.disk} bytes, resetting")
+        for attachment in self._entries.values():
+            attachment._offset = -1
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+        self.disk = 0
+
+    def _drop(self, attachment: Attachment) -> None:
+        del self._entries[attachment.digest]
+        if attachment._data is not None:
+            self.memory -= attachment.size
+        # 仍持有句柄的请求可以继续使用内存中的字节，文件中的位置可能被覆盖，不再有效
+        attachment._offset = -1
+        self.memory -= sum(_sizeof(x) for x in attachment._derived.values())
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._map is None or len(self._map) < offset + size:
+            if self._map is not None:
+                self._map.close()
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + size]
+
+    def clear(self) -> None:
+        for attachment in list(self._entries.values()):
+            self._drop(attachment)
+        self._reset_disk()
+
+
+STORE = AttachmentStore()
+
+
+def configure(settings: dict[str, typing.Any]) -> None:
+    global STORE
+    STORE = AttachmentStore(
+        settings.get("max_memory", 64 * 2**20),
+        settings.get("max_disk", 1024 * 2**20),
+        settings.get("max_entries", 1024),
+    )
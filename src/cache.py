@@ -1,67 +1,216 @@
+import sys
 import time
+import typing
 import asyncio
 import inspect
+import logging
+import weakref
 import functools
-from typing import Any, Callable, Dict, Tuple
+import collections
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
 
-def ttl_cache(seconds: int):
+logger = logging.getLogger(__name__)
+
+# 所有 ttl_cache 的存储，metrics 抓取和诊断接口从这里读取命中统计和条目数
+CACHES: list["TTLCache"] = []
+
+
+def sizeof(obj: Any, seen: Optional[set[int]] = None, depth: int = 0) -> int:
+    """粗略估算对象及其包含的 dict/list/str 的大小"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or depth > 32:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k, seen, depth + 1) + sizeof(v, seen, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(sizeof(x, seen, depth + 1) for x in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(sizeof(getattr(obj, x, None), seen, depth + 1) for x in obj.__slots__ if isinstance(x, str))
+    elif hasattr(obj, "__dict__"):
+        size += sizeof(obj.__dict__, seen, depth + 1)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "size")
+
+    def __init__(self, value: Any, expires: float, size: int):
+        self.value = value
+        self.expires = expires
+        self.size = size
+
+
+class TTLCache:
+    """
+    按最近使用顺序排列的 TTL 存储，条目数或估算字节数超过上限时淘汰最久未使用的条目。
+    过期时间使用 time.monotonic()，不受系统时间调整影响
+    """
+
+    def __init__(self, name: str, seconds: float, max_entries: int = 128, max_bytes: int = 0, stale: float = 0):
+        self.name = name
+        self.seconds = seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale = stale
+        self.bytes = 0
+        self._entries: collections.OrderedDict[Hashable, _Entry] = collections.OrderedDict()
+        # hit：未过期；stale：已过期但在 stale 时间内，返回旧值并在后台刷新；
+        # miss：调用了被装饰的函数；coalesced：等待其他调用者正在进行的同一次调用
+        self.counts: Dict[str, int] = {"hit": 0, "stale": 0, "miss": 0, "coalesced": 0}
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable, now: float) -> Tuple[Optional[_Entry], bool]:
+        """返回 (条目, 是否未过期)，超过 stale 时间的条目被删除"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        if now >= entry.expires + self.stale:
+            self._remove(key)
+            return None, False
+
+        self._entries.move_to_end(key)
+        return entry, now < entry.expires
+
+    def put(self, key: Hashable, value: Any, now: float) -> None:
+        size = sizeof(value) if self.max_bytes else 0
+        if key in self._entries:
+            self._remove(key)
+        # 单个值就超过上限时不缓存
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        self._entries[key] = _Entry(value, now + self.seconds, size)
+        self.bytes += size
+        self._evict(now)
+
+    def _remove(self, key: Hashable) -> None:
+        self.bytes -= self._entries.pop(key).size
+
+    def _evict(self, now: float) -> None:
+        # 从最久未使用的一端开始，丢弃彻底过期的条目和超出上限的条目
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            over = len(self._entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes)
+            if not over and now < entry.expires + self.stale:
+                break
+            if over:
+                self.evictions += 1
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+
+def _is_method(func: Callable) -> bool:
+    try:
+        parameters = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return False
+    return bool(parameters) and parameters[0] == "self"
+
+
+def ttl_cache(seconds: float, max_entries: int = 128, max_bytes: int = 0, stale: float = 0):
     """
     支持同步和异步函数的时间缓存装饰器（TTL Cache）
-    缓存 n 秒后自动过期
+    缓存 n 秒后过期，条目数或估算字节数超过上限时淘汰最久未使用的条目
+
+    异步函数：同一个 key 的并发未命中只调用一次被装饰的函数，其余调用者等待同一个结果（异常不缓存）；
+    stale 大于 0 时，过期不超过 stale 秒的条目直接返回旧值，同时在后台刷新。
+    同步函数不支持后台刷新，过期即重新调用。
+
+    装饰方法时以 self 的弱引用作为 key 的一部分，缓存不会让实例一直存活。
 
     :param seconds: 缓存过期时间（秒）
+    :param max_entries: 最大条目数
+    :param max_bytes: 估算的最大字节数，0 不限
+    :param stale: 过期后仍可返回旧值的时间（秒），0 不启用
     :return: 装饰器
     """
     def decorator(func: Callable) -> Callable:
-        cache: Dict[Tuple, Dict[str, Any]] = {}  # {key: {"result": ..., "timestamp": ...}}
+        store = TTLCache(f"{func.__module__}.{func.__qualname__}", seconds, max_entries, max_bytes, stale)
+        CACHES.append(store)
+        method = _is_method(func)
+        inflight: Dict[Hashable, asyncio.Task] = {}
 
-        @functools.wraps(func)
-        async def async_wrapper(*args, **kwargs) -> Any:
+        def make_key(args: tuple, kwargs: dict) -> Optional[Hashable]:
+            if method and args:
+                try:
+                    args = (weakref.ref(args[0]), *args[1:])
+                except TypeError:
+                    pass
             try:
                 key = (args, tuple(sorted(kwargs.items())))
+                hash(key)
             except TypeError:
                 # 参数不可哈希，跳过缓存
-                return await func(*args, **kwargs)
+                return None
+            return key
+
+        def refresh(key: Hashable, args: tuple, kwargs: dict, background: bool) -> asyncio.Task:
+            async def load() -> Any:
+                try:
+                    value = await func(*args, **kwargs)
+                except Exception:
+                    if background:
+                        logger.warning(f"Background refresh of {store.name} failed", exc_info=True)
+                    raise
+                finally:
+                    inflight.pop(key, None)
+                store.put(key, value, time.monotonic())
+                return value
+
+            task = inflight[key] = asyncio.ensure_future(load())
+            # 后台刷新的结果没有人等待，避免 "exception was never retrieved"
+            task.add_done_callback(lambda x: x.cancelled() or x.exception())
+            return task
 
-            current_time = time.time()
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs) -> Any:
+            key = make_key(args, kwargs)
+            if key is None:
+                return await func(*args, **kwargs)
 
-            # 检查缓存
-            if key in cache:
-                cached = cache[key]
-                if current_time - cached["timestamp"] < seconds:
-                    return cached["result"]
+            entry, fresh = store.lookup(key, time.monotonic())
+            if entry is not None:
+                if fresh:
+                    store.counts["hit"] += 1
                 else:
-                    del cache[key]
-
-            # 调用异步函数并缓存
-            result = await func(*args, **kwargs)
-            cache[key] = {
-                "result": result,
-                "timestamp": current_time
-            }
-            return result
+                    store.counts["stale"] += 1
+                    if key not in inflight:
+                        refresh(key, args, kwargs, True)
+                return entry.value
+
+            task = inflight.get(key)
+            if task is None:
+                store.counts["miss"] += 1
+                task = refresh(key, args, kwargs, False)
+            else:
+                store.counts["coalesced"] += 1
+            # 调用者被取消时不影响其他等待同一结果的调用者
+            return await asyncio.shield(task)
 
         @functools.wraps(func)
         def sync_wrapper(*args, **kwargs) -> Any:
-            try:
-                key = (args, tuple(sorted(kwargs.items())))
-            except TypeError:
+            key = make_key(args, kwargs)
+            if key is None:
                 return func(*args, **kwargs)
 
-            current_time = time.time()
-
-            if key in cache:
-                cached = cache[key]
-                if current_time - cached["timestamp"] < seconds:
-                    return cached["result"]
-                else:
-                    del cache[key]
+            entry, fresh = store.lookup(key, time.monotonic())
+            if fresh:
+                store.counts["hit"] += 1
+                return entry.value
 
+            store.counts["miss"] += 1
             result = func(*args, **kwargs)
-            cache[key] = {
-                "result": result,
-                "timestamp": current_time
-            }
+            store.put(key, result, time.monotonic())
             return result
 
         # 自动判断是同步还是异步函数
@@ -72,9 +221,10 @@ def ttl_cache(seconds: int):
 
         # 添加清除缓存方法
         def clear_cache():
-            cache.clear()
+            store.clear()
 
         wrapper.clear_cache = clear_cache
+        wrapper.cache = store
         return wrapper
 
     return decorator
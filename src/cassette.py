@@ -0,0 +1,262 @@
+"""
+上游流量的录制与回放
+
+录制模式下，Worker.client() 返回的客户端照常访问上游，同时把每个响应的状态码、响应头、
+首字节耗时和每个块（包括到达间隔）追加到 cassette 文件；回放模式下不访问网络，
+按录制的顺序和时间（可加速）返回同样形状的 rnet 响应，用于复现线上问题和无网络的吞吐量测试。
+
+cassette 文件每行一个 JSON，以 .gz 结尾时使用 gzip 压缩。不记录请求头、请求体和查询参数（可能含有 key），
+回放时按方法和 URL 路径匹配，同一路径的多次录制依次轮流使用。
+"""
+import gzip
+import json
+import time
+import typing
+import asyncio
+import logging
+import urllib.parse
+import http_client
+import rnet
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteError(Exception):
+    """回放时没有可用的录制"""
+
+
+def _key(method: rnet.Method | str, url: str) -> str:
+    # rnet.Method 没有 name 属性，str() 为 "Method.POST"
+    method = str(method).rsplit(".", 1)[-1].upper()
+    return f"{method} {urllib.parse.urlsplit(url).path or '/'}"
+
+
+def _encode(data: bytes) -> str:
+    # surrogateescape 保证任意字节都能原样还原，切在多字节字符中间的块也一样
+    return data.decode("utf-8", "surrogateescape")
+
+
+def _decode(data: str) -> bytes:
+    return data.encode("utf-8", "surrogateescape")
+
+
+class Cassette:
+    def __init__(self, path: str, mode: typing.Literal["record", "replay"] = "replay", speed: float = 1.0):
+        """
+        Args:
+            path: cassette 文件路径，以 .gz 结尾时压缩
+            mode: record 录制，replay 回放
+            speed: 回放速度倍数，1 为原始速度，0 表示不等待
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的 cassette 模式 '{mode}'")
+
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._interactions: dict[str, list[dict[str, typing.Any]]] = {}
+        self._cursors: dict[str, int] = {}
+        if mode == "replay":
+            self.load()
+
+    def _open(self, mode: str) -> typing.TextIO:
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def load(self) -> None:
+        self._interactions.clear()
+        self._cursors.clear()
+        with self._open("r") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions.setdefault(interaction["key"], []).append(interaction)
+        logger.info(f"Loaded {sum(len(x) for x in self._interactions.values())} interactions from {self.path}")
+
+    def append(self, interaction: dict[str, typing.Any]) -> None:
+        # 每次追加都重新打开，gzip 会写成多个成员，读取时自动拼接
+        with self._open("a") as f:
+            f.write(json.dumps(interaction) + "\n")
+
+    def next(self, method: rnet.Method | str, url: str) -> dict[str, typing.Any]:
+        key = _key(method, url)
+        interactions = self._interactions.get(key)
+        if not interactions:
+            raise CassetteError(f"No recorded interaction for {key} in {self.path}")
+
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return interactions[cursor % len(interactions)]
+
+    async def delay(self, seconds: float) -> None:
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    def wrap(self, client: rnet.Client) -> rnet.Client:
+        if self.mode == "record":
+            return RecordingClient(client, self)
+        return ReplayClient(client, self)
+
+
+class RecordingClient(http_client.ClientWrapper):
+    def __init__(self, client: rnet.Client, cassette: Cassette):
+        super().__init__(client)
+        self._cassette = cassette
+
+    async def request(self, method: rnet.Method, url: str, **kwargs) -> rnet.Response:
+        started = time.perf_counter()
+        response = await self._client.request(method, url, **kwargs)
+        return RecordingResponse(response, self._cassette, {
+            "key": _key(method, url),
+            "url": urllib.parse.urlsplit(url)._replace(query="", fragment="").geturl(),
+            "status": response.status,
+            "headers": [[_encode(k), _encode(v)] for k, v in response.headers.items()],
+            "encoding": response.encoding,
+            "latency": time.perf_counter() - started,
+            "chunks": [],
+        })
+
+
+class RecordingResponse(http_client.ResponseWrapper):
+    def __init__(self, response: rnet.Response, cassette: Cassette, interaction: dict[str, typing.Any]):
+        super().__init__(response)
+        self._cassette = cassette
+        self._interaction = interaction
+        self._body: bytes | None = None
+        self._last = time.perf_counter()
+        self._saved = False
+
+    def record(self, chunk: bytes) -> None:
+        now = time.perf_counter()
+        self._interaction["chunks"].append([round(now - self._last, 6), _encode(chunk)])
+        self._last = now
+
+    def save(self) -> None:
+        if not self._saved:
+            self._saved = True
+            self._cassette.append(self._interaction)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.save()
+        return await super().__aexit__(exc_type, exc_val, exc_tb)
+
+    async def bytes(self) -> bytes:
+        if self._body is None:
+            self._body = await self._response.bytes()
+            self.record(self._body)
+        return self._body
+
+    async def text(self) -> str:
+        return (await self.bytes()).decode(self._response.encoding or "utf-8", "replace")
+
+    async def json(self) -> typing.Any:
+        return json.loads(await self.bytes())
+
+    def stream(self) -> rnet.Streamer:
+        return RecordingStreamer(self._response.stream(), self)
+
+
+class RecordingStreamer(http_client.StreamerWrapper):
+    def __init__(self, streamer: rnet.Streamer, response: RecordingResponse):
+        super().__init__(streamer)
+        self._recording = response
+
+    async def __anext__(self) -> bytes:
+        chunk = await self._streamer.__anext__()
+        self._recording.record(chunk)
+        return chunk
+
+
+class ReplayClient(http_client.ClientWrapper):
+    """不访问网络，cookie 等操作仍交给被包装的客户端"""
+
+    def __init__(self, client: rnet.Client, cassette: Cassette):
+        super().__init__(client)
+        self._cassette = cassette
+
+    async def request(self, method: rnet.Method, url: str, **kwargs) -> rnet.Response:
+        interaction = self._cassette.next(method, url)
+        await self._cassette.delay(interaction["latency"])
+        return ReplayResponse(interaction, self._cassette)
+
+
+class ReplayResponse:
+    def __init__(self, interaction: dict[str, typing.Any], cassette: Cassette):
+        self._interaction = interaction
+        self._cassette = cassette
+        self.url: str = interaction["url"]
+        self.status: int = interaction["status"]
+        self.ok = 200 <= self.status < 300
+        self.encoding: str = interaction.get("encoding") or "utf-8"
+        self.headers = rnet.HeaderMap()
+        for k, v in interaction["headers"]:
+            self.headers.append(k, v)
+
+    @property
+    def __class__(self):
+        return rnet.Response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def bytes(self) -> bytes:
+        await self._cassette.delay(sum(delay for delay, _ in self._interaction["chunks"]))
+        return b"".join(_decode(x) for _, x in self._interaction["chunks"])
+
+    async def text(self) -> str:
+        return (await self.bytes()).decode(self.encoding, "replace")
+
+    async def json(self) -> typing.Any:
+        return json.loads(await self.bytes())
+
+    def stream(self) -> rnet.Streamer:
+        return ReplayStreamer(self._interaction["chunks"], self._cassette)
+
+
+class ReplayStreamer:
+    def __init__(self, chunks: list[list], cassette: Cassette):
+        self._chunks = iter(chunks)
+        self._cassette = cassette
+
+    @property
+    def __class__(self):
+        return rnet.Streamer
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            delay, chunk = next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration from None
+        await self._cassette.delay(delay)
+        return _decode(chunk)
+
+
+# 同一文件的 cassette 在 worker 之间共享，回放时轮流使用同一份录制
+_CASSETTES: dict[str, Cassette] = {}
+
+
+def create(settings: dict[str, typing.Any] | None) -> Cassette | None:
+    """根据 worker 的 cassette 设置创建（或复用）cassette，没有设置时返回 None"""
+    if not settings or not settings.get("path"):
+        return None
+
+    path = settings["path"]
+    if path not in _CASSETTES:
+        _CASSETTES[path] = Cassette(path, settings.get("mode", "replay"), settings.get("speed", 1.0))
+    return _CASSETTES[path]
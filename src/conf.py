@@ -8,7 +8,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 with open("./example_settings.yaml", "r", encoding="utf-8") as f:
     settings = yaml.safe_load(f)
 
-if os.path.exists("../settings.yaml"):
+# 环境变量 LMPROXY_SETTINGS 可以指定其他配置文件（例如 benchmarks/profiles），此时不会自动创建
+if path := os.environ.get("LMPROXY_SETTINGS", None):
+    with open(path, "r", encoding="utf-8") as f:
+        settings.update(yaml.safe_load(f))
+elif os.path.exists("../settings.yaml"):
     with open("../settings.yaml", "r", encoding="utf-8") as f:
         settings.update(yaml.safe_load(f))
 else:
@@ -16,3 +20,8 @@ else:
         yaml.dump(settings, f)
 
 logging.config.dictConfig(settings.get("logging", {}))
+
+if settings.get("log_queue", {}).get("enabled", False):
+    import logs
+
+    logs.install_queue()
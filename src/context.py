@@ -1,8 +1,97 @@
 import copy
+import time
 import typing
 import dataclasses
+import collections.abc
 
-@dataclasses.dataclass
+
+class Metadata(collections.abc.MutableMapping):
+    """
+    请求的元数据，常用字段保存在 __slots__ 中，其余键（例如 worker 解析流时的临时状态）保存在 extra 中。
+    未设置的字段视为不存在，支持 dict 的访问方式
+    """
+
+    __slots__ = (
+        "task_id", "started", "worker", "worker_error", "usage",
+        "retry", "resumes", "timings", "stream_content", "extra",
+    )
+
+    task_id: str
+    # time.perf_counter() 时间
+    started: float
+    # 处理请求的 worker 名称
+    worker: str
+    # 最近一个 worker 的异常，所有 worker 都失败时作为 __cause__
+    worker_error: BaseException
+    usage: dict[str, typing.Any]
+    # retry.RetryPolicy
+    retry: typing.Any
+    # 续写次数
+    resumes: int
+    # profiler.Timings
+    timings: typing.Any
+    stream_content: "TextAccumulator"
+    extra: dict[str, typing.Any]
+
+    def __init__(self, data: typing.Mapping[str, typing.Any] | None = None, **kwargs: typing.Any) -> None:
+        self.extra = {}
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    def __getitem__(self, key: str) -> typing.Any:
+        if key in _METADATA_KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        if key in _METADATA_KEYS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _METADATA_KEYS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            del self.extra[key]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for key in _METADATA_FIELDS:
+            if hasattr(self, key):
+                yield key
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(hasattr(self, x) for x in _METADATA_FIELDS) + len(self.extra)
+
+    def __contains__(self, key: object) -> bool:
+        if key in _METADATA_KEYS:
+            return hasattr(self, key)
+        return key in self.extra
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        # 流式请求中每个块都会调用，不经过 __getitem__ 和异常
+        if key in _METADATA_KEYS:
+            return getattr(self, key, default)
+        return self.extra.get(key, default)
+
+    def __repr__(self) -> str:
+        return f"Metadata({dict(self)!r})"
+
+
+_METADATA_FIELDS = Metadata.__slots__[:-1]
+_METADATA_KEYS = frozenset(_METADATA_FIELDS)
+
+
+@dataclasses.dataclass(slots=True)
 class Response:
     body: (
         "DeltaType"
@@ -14,9 +103,14 @@ class Response:
     )
     status_code: int = 200
     headers: dict[str, str] = dataclasses.field(default_factory=dict)
-    metadata: dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    metadata: Metadata = dataclasses.field(default_factory=Metadata)
 
-@dataclasses.dataclass
+    def raw_headers(self) -> list[tuple[bytes, bytes]]:
+        """blacksheep 的响应头必须是 bytes，uvicorn 的 httptools 实现遇到 str 会直接断开连接"""
+        return [ (k.encode("latin-1"), v.encode("latin-1")) for k, v in self.headers.items() ]
+
+# diagnostics 使用弱引用跟踪正在处理的请求
+@dataclasses.dataclass(slots=True, weakref_slot=True)
 class Context:
     headers: dict[str, str]
     body: typing.Union["ChatCompletionPayload", "EmbeddingPayload"]
@@ -31,18 +125,36 @@ class Context:
     ) = None
     status_code: int = 200
     response_headers: dict[str, str] = dataclasses.field(default_factory=dict)
-    metadata: dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    metadata: Metadata = dataclasses.field(default_factory=Metadata)
+    # time.monotonic() 时间的截止时间，None 表示不限
+    deadline: float | None = None
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.metadata, Metadata):
+            self.metadata = Metadata(self.metadata)
 
     @property
     def task_id(self) -> str:
         return self.metadata.get("task_id", "")
 
+    def remaining(self) -> float | None:
+        """
+        距离截止时间的剩余秒数，None 表示不限
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
     @property
     def to_response(self) -> Response | None:
         if not self.response:
             return None
         
-        if isinstance(self.response, dict):
+        if isinstance(self.response, (dict, Text)):
             self.response["role"] = "assistant"
         return Response(self.response, self.status_code, self.response_headers, self.metadata)
 
@@ -52,9 +164,15 @@ class Context:
 
     def payload(self, settings: dict[str, typing.Any] = {}):
         """
-        复制 body
+        返回 body 的写时复制视图：顶层字典和 messages 列表是新的，
+        消息对象、图片等内容与 body 共享，不会每次尝试都深拷贝整个请求。
+        worker 可以任意增删顶层字段和 messages 中的元素，
+        但需要修改某条消息时应当替换为它的副本，不能原地修改
         """
-        body = copy.deepcopy(self.body)
+        body = dict(self.body)
+        if isinstance(messages := body.get("messages"), list):
+            body["messages"] = list(messages)
+
         if aliases := settings.get("aliases", {}):
             model = body.get("model", None)
             if model in aliases:
@@ -62,10 +180,11 @@ class Context:
         
         if overrides := settings.get("overrides", {}):
             for key, val in overrides.items():
-                if val is None and key in body[key]:
-                    del body[key]
-                elif val is not None:
-                    body[key] = val
+                if val is None:
+                    body.pop(key, None)
+                else:
+                    # 配置在请求之间共享，复制一份避免被 worker 修改
+                    body[key] = copy.deepcopy(val)
 
         return body
 
@@ -196,12 +315,227 @@ class EmbeddingPayload(typing.TypedDict, total=False):
     dimensions: int | None
 
 
-class Text(typing.TypedDict):
-    role: str | None = None
-    type: typing.Literal["text"] = "text"
-    content: str | None = None
-    reasoning_content: str | None = None
-    tool_calls: list[dict[str, typing.Any]] | None = None
+class Text(collections.abc.MutableMapping):
+    """
+    文本块，流式响应的每个块都会创建一个，使用 __slots__ 代替 dict 减少分配和内存。
+    支持 dict 的访问方式，中间件可以继续使用 chunk["content"]、chunk.get(...)；
+    role 和 tool_calls 为 None 时视为不存在（与之前不带这两个键的块输出相同），其余字段总是存在，不能添加其他键
+    """
+
+    __slots__ = ("role", "type", "content", "reasoning_content", "tool_calls")
+
+    def __init__(
+        self,
+        type: typing.Literal["text"] = "text",
+        content: str | list[str] | None = None,
+        reasoning_content: str | list[str] | None = None,
+        tool_calls: list[dict[str, typing.Any]] | dict[str, typing.Any] | None = None,
+        role: str | None = None,
+    ) -> None:
+        self.role = role
+        self.type = type
+        self.content = content
+        self.reasoning_content = reasoning_content
+        self.tool_calls = tool_calls
+
+    def __getitem__(self, key: str) -> typing.Any:
+        if key in _TEXT_KEYS:
+            value = getattr(self, key)
+            if value is not None or key not in _TEXT_OPTIONAL:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        if key not in _TEXT_KEYS:
+            raise KeyError(f"Text has no field '{key}'")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self[key] = None
+
+    def __iter__(self) -> typing.Iterator[str]:
+        if self.role is not None:
+            yield "role"
+        yield "type"
+        yield "content"
+        yield "reasoning_content"
+        if self.tool_calls is not None:
+            yield "tool_calls"
+
+    def __len__(self) -> int:
+        return len(_TEXT_FIELDS) - (self.role is None) - (self.tool_calls is None)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _TEXT_KEYS and (key not in _TEXT_OPTIONAL or getattr(self, key) is not None)
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        if key in _TEXT_KEYS:
+            value = getattr(self, key)
+            if value is not None or key not in _TEXT_OPTIONAL:
+                return value
+        return default
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        """JSON 编码等需要真正 dict 的地方使用"""
+        data = {"type": self.type, "content": self.content, "reasoning_content": self.reasoning_content}
+        if self.role is not None:
+            data = {"role": self.role, **data}
+        if self.tool_calls is not None:
+            data["tool_calls"] = self.tool_calls
+        return data
+
+    def __repr__(self) -> str:
+        return f"Text({self.to_dict()!r})"
+
+
+_TEXT_FIELDS = Text.__slots__
+_TEXT_KEYS = frozenset(_TEXT_FIELDS)
+# 为 None 时视为不存在的字段
+_TEXT_OPTIONAL = frozenset(("role", "tool_calls"))
+
+
+def to_json(obj: typing.Any) -> typing.Any:
+    """json.dumps 的 default，把 Text 和 Metadata 转为 dict"""
+    if isinstance(obj, Text):
+        return obj.to_dict()
+    if isinstance(obj, Metadata):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class TextAccumulator:
+    """
+    将流式的 Text 块合并为一条消息
+
+    内容按片段保存，读取时才拼接，避免长输出反复拼接字符串；
+    工具调用按 index 合并，只有 arguments 会流式传输。
+    window 大于 0 时只保留内容和推理内容末尾的 window 个字符
+    """
+
+    __slots__ = ("role", "window", "_content", "_reasoning", "_tool_calls", "_sizes")
+
+    def __init__(self, window: int = 0) -> None:
+        self.role: str | None = None
+        self.window = window
+        self._content: list[str] = []
+        self._reasoning: list[str] = []
+        # (工具调用, arguments 片段)
+        self._tool_calls: list[tuple[dict[str, typing.Any], list[str]]] = []
+        # 窗口模式下各片段列表的总长度
+        self._sizes = [0, 0]
+
+    def add(self, chunk: "DeltaType | None") -> None:
+        # 每个流式块都会调用，Text 直接读取属性，不经过 dict 兼容的方法
+        if isinstance(chunk, Text):
+            role, content, reasoning, calls = chunk.role, chunk.content, chunk.reasoning_content, chunk.tool_calls
+        elif chunk:
+            role, content, reasoning, calls = (
+                chunk.get("role", None),
+                chunk.get("content", None),
+                chunk.get("reasoning_content", None),
+                chunk.get("tool_calls", None),
+            )
+        else:
+            return
+
+        if self.role is None:
+            self.role = role
+
+        self._extend(self._content, content)
+        self._extend(self._reasoning, reasoning)
+        if self.window:
+            self._sizes[0] = self._trim(self._content, self._sizes[0], content)
+            self._sizes[1] = self._trim(self._reasoning, self._sizes[1], reasoning)
+
+        if isinstance(calls, dict):
+            calls = [calls]
+        for call in calls or []:
+            self._add_tool_call(call)
+
+    @staticmethod
+    def _extend(parts: list[str], delta: str | list[str] | None) -> None:
+        if not delta:
+            return
+        if isinstance(delta, list):
+            parts.extend(x for x in delta if x)
+        else:
+            parts.append(delta)
+
+    def _trim(self, parts: list[str], size: int, delta: str | list[str] | None) -> int:
+        if not delta:
+            return size
+
+        size += len(delta) if isinstance(delta, str) else sum(len(x) for x in delta if x)
+        # 超过两倍窗口时才截断，均摊拼接的开销
+        if size > self.window * 2:
+            parts[:] = ["".join(parts)[-self.window:]]
+            size = len(parts[0])
+        return size
+
+    def _add_tool_call(self, call: dict[str, typing.Any]) -> None:
+        function = call.get("function", None) or {}
+        arguments = function.get("arguments", None)
+        index = call.get("index", None)
+
+        if index is None or index >= len(self._tool_calls):
+            merged = dict(call)
+            if "function" in call:
+                merged["function"] = dict(function)
+            self._tool_calls.append((merged, [arguments] if arguments else []))
+            return
+
+        merged, fragments = self._tool_calls[index]
+        if arguments:
+            fragments.append(arguments)
+
+        # 补全首个片段中缺失的字段
+        for key, val in call.items():
+            if key != "function" and val and not merged.get(key, None):
+                merged[key] = val
+        if (name := function.get("name", None)) and not merged.setdefault("function", {}).get("name", None):
+            merged["function"]["name"] = name
+
+    @staticmethod
+    def _join(parts: list[str]) -> str | None:
+        if len(parts) > 1:
+            # 拼接后只保留一个片段，后续追加不会重复拼接
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else None
+
+    def _tail(self, parts: list[str]) -> str | None:
+        text = self._join(parts)
+        if text and self.window:
+            return text[-self.window:]
+        return text
+
+    @property
+    def content(self) -> str | None:
+        return self._tail(self._content)
+
+    @property
+    def reasoning_content(self) -> str | None:
+        return self._tail(self._reasoning)
+
+    @property
+    def tool_calls(self) -> list[dict[str, typing.Any]] | None:
+        if not self._tool_calls:
+            return None
+
+        calls = []
+        for call, fragments in self._tool_calls:
+            if "function" in call:
+                call["function"]["arguments"] = self._join(fragments) or call["function"].get("arguments", None)
+            calls.append(call)
+        return calls
+
+    def to_text(self) -> "Text":
+        return Text(
+            type="text",
+            content=self.content,
+            reasoning_content=self.reasoning_content,
+            tool_calls=self.tool_calls,
+            role=self.role or None,
+        )
 
 
 class Image(typing.TypedDict):
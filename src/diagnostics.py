@@ -0,0 +1,269 @@
+import gc
+import io
+import os
+import sys
+import time
+import typing
+import marshal
+import asyncio
+import logging
+import pstats
+import cProfile
+import threading
+import itertools
+import collections
+import tracemalloc
+import weakref
+import cache
+import attachments
+import context
+import proxies
+import resources
+
+logger = logging.getLogger(__name__)
+
+# 同一时间只允许一个 CPU 分析
+_busy = False
+
+
+class ProfilerBusyError(Exception): ...
+
+
+class StackSampler(threading.Thread):
+    """
+    在后台线程中定时采样目标线程的调用栈，汇总为 collapsed stack（可直接用于 flamegraph）。
+    目标线程不执行任何额外代码。
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: collections.Counter[str] = collections.Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id, None)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def _acquire() -> None:
+    global _busy
+    if _busy:
+        raise ProfilerBusyError("another profile is running")
+    _busy = True
+
+
+def _release() -> None:
+    global _busy
+    _busy = False
+
+
+async def sample_cpu(seconds: float, interval: float = 0.005) -> str:
+    """采样事件循环线程 seconds 秒，返回 collapsed stack"""
+    _acquire()
+    try:
+        sampler = StackSampler(threading.get_ident(), interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+        logger.info(f"cpu sampling finished, {sampler.samples} samples in {seconds}s")
+        return sampler.collapsed()
+    finally:
+        _release()
+
+
+async def profile_cpu(seconds: float) -> pstats.Stats:
+    """在事件循环线程上运行 cProfile seconds 秒，开销较大，只在需要精确调用次数时使用"""
+    _acquire()
+    try:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        return pstats.Stats(profile)
+    finally:
+        _release()
+
+
+def dump_stats(stats: pstats.Stats) -> bytes:
+    """与 pstats.Stats.dump_stats 写入的文件格式相同，可用 pstats/snakeviz 打开"""
+    return marshal.dumps(stats.stats)
+
+
+def format_stats(stats: pstats.Stats, sort: str = "cumulative", limit: int = 50) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# 正在处理的请求，只在 tracemalloc 运行时记录，用于按请求类型归因内存
+_requests: "weakref.WeakValueDictionary[str, context.Context]" = weakref.WeakValueDictionary()
+_snapshots: collections.OrderedDict[int, tracemalloc.Snapshot] = collections.OrderedDict()
+_snapshot_ids = itertools.count(1)
+MAX_SNAPSHOTS = 5
+
+
+def track(ctx: context.Context) -> None:
+    """由 Engine 在请求开始时调用，未开启内存跟踪时没有开销"""
+    if tracemalloc.is_tracing():
+        _requests[ctx.task_id] = ctx
+
+
+def memory_start(frames: int = 1) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc started with {frames} frames")
+
+
+def memory_stop() -> None:
+    tracemalloc.stop()
+    _requests.clear()
+    _snapshots.clear()
+    logger.info("tracemalloc stopped")
+
+
+def _attribution(limit: int) -> dict[str, typing.Any]:
+    """按请求类型汇总正在处理的请求持有的 body、响应和 metadata 大小"""
+    by_type: dict[str, dict[str, typing.Any]] = {}
+    for task_id, ctx in list(_requests.items()):
+        seen: set[int] = set()
+        size = cache.sizeof(ctx.body, seen) + cache.sizeof(ctx.response, seen) + cache.sizeof(ctx.metadata, seen)
+        group = by_type.setdefault(ctx.type, {"requests": 0, "bytes": 0, "largest": []})
+        group["requests"] += 1
+        group["bytes"] += size
+        group["largest"].append({"task_id": task_id, "model": ctx.model, "bytes": size})
+
+    for group in by_type.values():
+        group["largest"] = sorted(group["largest"], key=lambda x: x["bytes"], reverse=True)[:limit]
+    return by_type
+
+
+def _statistics(stats: list[tracemalloc.StatisticDiff] | list[tracemalloc.Statistic]) -> list[dict[str, typing.Any]]:
+    return [
+        {
+            "traceback": [str(frame) for frame in x.traceback],
+            "size": x.size,
+            "count": x.count,
+            **({"size_diff": x.size_diff, "count_diff": x.count_diff} if isinstance(x, tracemalloc.StatisticDiff) else {}),
+        }
+        for x in stats
+    ]
+
+
+def memory_snapshot(limit: int = 30, key: str = "lineno") -> dict[str, typing.Any]:
+    """
+    保存一个快照并返回占用最多的位置，以及按请求类型归因的内存
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    snapshot_id = next(_snapshot_ids)
+    _snapshots[snapshot_id] = snapshot
+    while len(_snapshots) > MAX_SNAPSHOTS:
+        _snapshots.popitem(last=False)
+
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "id": snapshot_id,
+        "time": time.time(),
+        "current": current,
+        "peak": peak,
+        "top": _statistics(snapshot.statistics(key)[:limit]),
+        "requests": _attribution(limit),
+    }
+
+
+def memory_diff(base: int, target: int | None = None, limit: int = 30, key: str = "lineno") -> dict[str, typing.Any]:
+    """比较两个快照，target 为空时与新快照比较"""
+    if base not in _snapshots:
+        raise KeyError(f"snapshot {base} not found, available: {list(_snapshots)}")
+
+    if target is None:
+        target = memory_snapshot(0, key)["id"]
+    if target not in _snapshots:
+        raise KeyError(f"snapshot {target} not found, available: {list(_snapshots)}")
+
+    return {
+        "base": base,
+        "target": target,
+        "top": _statistics(_snapshots[target].compare_to(_snapshots[base], key)[:limit]),
+        "requests": _attribution(limit),
+    }
+
+
+def _rss() -> int | None:
+    """当前 RSS（字节），只支持 Linux"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def objects(limit: int = 50, collect: bool = True) -> dict[str, typing.Any]:
+    """
+    按类型统计 gc 跟踪的存活对象（容器对象，不含 str/bytes/int），按协程统计 asyncio 任务，
+    以及可能无限增长的全局结构的大小，用于长时间运行时观察内存是否持续增长。limit 为 0 时返回全部类型
+    """
+    if collect:
+        gc.collect()
+
+    by_type = collections.Counter(f"{type(x).__module__}.{type(x).__qualname__}" for x in gc.get_objects())
+    tasks = asyncio.all_tasks()
+    by_coroutine = collections.Counter(
+        getattr(x.get_coro(), "__qualname__", type(x.get_coro()).__name__) for x in tasks
+    )
+    loop = asyncio.get_running_loop()
+
+    # 只统计已导入的宏模块，不为诊断而导入
+    variables = getattr(sys.modules.get("macros.variables"), "VARIABLES", {})
+    return {
+        "time": time.time(),
+        "rss": _rss(),
+        "objects": dict(by_type.most_common(limit or None)),
+        "tasks": len(tasks),
+        "tasks_by_coroutine": dict(by_coroutine.most_common(limit or None)),
+        "structures": {
+            "macro_variables": len(variables),
+            "ttl_cache_entries": {x.name: len(x) for x in cache.CACHES},
+            "tracked_requests": len(_requests),
+            "key_waiters": sum(len(x._waiters) for x in list(resources.MANAGERS)),
+            "proxy_waiters": sum(len(x._waiters) for x in list(proxies.MANAGERS)),
+            "attachments": {
+                "entries": len(attachments.STORE),
+                "memory": attachments.STORE.memory,
+                "disk": attachments.STORE.disk,
+            },
+            # 尚未触发的 call_later 回调（例如 key 冷却）
+            "timers": len(getattr(loop, "_scheduled", ())),
+        },
+    }
@@ -0,0 +1,168 @@
+import pickle
+import typing
+import asyncio
+import logging
+import weakref
+import tempfile
+import collections
+import collections.abc
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+
+class DrainBuffer(typing.Generic[T]):
+    """
+    在后台以上游的速度读取流并缓存，上游结束后即可释放 key 和代理，
+    下游按自己的速度读取。
+
+    内存中的块超过 max_memory 字节后，之后的块写入临时文件，
+    直到下游读完文件中的块为止；内存和文件合计超过 max_size 时暂停读取上游。
+    文件的序列化和读写在线程中进行，不阻塞事件循环。
+
+    stream() 返回的生成器结束、被关闭或者从未迭代就被丢弃时，都会中止上游并关闭临时文件。
+    """
+
+    def __init__(
+        self,
+        source: typing.AsyncIterator[T],
+        max_memory: int = 8 * 1024 * 1024,
+        max_size: int = 256 * 1024 * 1024,
+    ) -> None:
+        self._source = source
+        self._max_memory = max_memory
+        self._max_size = max_size
+
+        self._memory: collections.deque[tuple[T, int]] = collections.deque()
+        self._memory_size = 0
+
+        self._spill: typing.BinaryIO | None = None
+        # 文件操作按提交顺序依次执行，读取一定在对应的写入之后
+        self._io = asyncio.Lock()
+        self._spilling = False
+        # 已提交写入的块数，在写入完成前就计入
+        self._spill_count = 0
+        self._spill_size = 0
+        self._read_offset = 0
+
+        self._done = False
+        self._error: BaseException | None = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._task = asyncio.create_task(self._drain())
+
+    @staticmethod
+    def _sizeof(chunk: T) -> int:
+        # 只估算字符串和字节的大小
+        if isinstance(chunk, collections.abc.Mapping):
+            return sum(len(x) for x in chunk.values() if isinstance(x, (str, bytes)))
+        if isinstance(chunk, (str, bytes)):
+            return len(chunk)
+        return 0
+
+    async def _drain(self) -> None:
+        try:
+            async for chunk in self._source:
+                while self._memory_size + self._spill_size >= self._max_size:
+                    self._writable.clear()
+                    await self._writable.wait()
+
+                await self._put(chunk)
+                self._readable.set()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._readable.set()
+
+    async def _put(self, chunk: T) -> None:
+        size = self._sizeof(chunk)
+        if not self._spilling and self._memory_size + size <= self._max_memory:
+            self._memory.append((chunk, size))
+            self._memory_size += size
+            return
+
+        # 开始写入文件后，为保证顺序，之后的块都写入文件
+        self._spilling = True
+        self._spill_count += 1
+        self._spill_size += size
+        async with self._io:
+            if self._spill is None:
+                self._spill = await asyncio.to_thread(tempfile.TemporaryFile, prefix="lmproxy-drain-")
+                logger.debug(f"drain buffer spill to disk after {self._memory_size} bytes")
+            await asyncio.to_thread(self._write, self._spill, chunk, size)
+
+    @staticmethod
+    def _write(file: typing.BinaryIO, chunk: T, size: int) -> None:
+        data = pickle.dumps((chunk, size), protocol=pickle.HIGHEST_PROTOCOL)
+        file.seek(0, 2)
+        file.write(len(data).to_bytes(4, "little"))
+        file.write(data)
+
+    @staticmethod
+    def _read(file: typing.BinaryIO, offset: int, truncate: bool) -> tuple[T, int, int]:
+        file.seek(offset)
+        length = int.from_bytes(file.read(4), "little")
+        chunk, size = pickle.loads(file.read(length))
+        # 文件读完后清空，之后的块回到内存缓存
+        if truncate:
+            file.seek(0)
+            file.truncate()
+        return chunk, size, length
+
+    async def _get(self) -> T:
+        if self._memory:
+            chunk, size = self._memory.popleft()
+            self._memory_size -= size
+            return chunk
+
+        self._spill_count -= 1
+        # 没有已提交的写入时才能清空文件
+        truncate = not self._spill_count
+        async with self._io:
+            chunk, size, length = await asyncio.to_thread(self._read, self._spill, self._read_offset, truncate)
+        self._spill_size -= size
+        if truncate:
+            # 等待读取期间提交的写入排在清空之后，仍在文件中
+            self._read_offset = 0
+            self._spilling = bool(self._spill_count)
+        else:
+            self._read_offset += 4 + length
+        return chunk
+
+    def close(self) -> None:
+        """中止上游并关闭临时文件，可以重复调用"""
+        if not self._task.done():
+            try:
+                self._task.cancel()
+            except RuntimeError:
+                # 事件循环已经关闭
+                pass
+        if self._spill is not None:
+            self._spill.close()
+
+    def stream(self) -> typing.AsyncGenerator[T, None]:
+        generator = self._stream()
+        # 生成器从未迭代时 finally 不会执行，被丢弃时由 finalize 清理
+        weakref.finalize(generator, self.close)
+        return generator
+
+    async def _stream(self) -> typing.AsyncGenerator[T, None]:
+        try:
+            while True:
+                if self._memory or self._spill_count:
+                    yield await self._get()
+                    self._writable.set()
+                    continue
+
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+
+                self._readable.clear()
+                await self._readable.wait()
+        finally:
+            # 下游提前结束时中止上游
+            self.close()
@@ -1,5 +1,8 @@
+import math
+import time
 import typing
 import uuid
+import contextlib
 import inspect
 import logging
 import context
@@ -8,6 +11,12 @@ import middleware
 import worker
 import proxies
 import error
+import diagnostics
+import logs
+import loopmonitor
+import metrics
+import profiler
+import attachments
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +24,10 @@ logger = logging.getLogger(__name__)
 class Engine:
     def __init__(self, settings: dict[str, typing.Any]):
         self.settings = settings
+        profiler.configure(settings.get("profiler", {}))
+        metrics.configure(settings.get("metrics", {}))
+        logs.configure(settings.get("access_log", {}))
+        attachments.configure(settings.get("attachments", {}))
         self.middleware = middleware.MiddlewareManager(settings.get("middleware", {}), self)
         self.retries = retry.RetryFactory(settings.get("retry", {}), self.middleware)
         self.proxies = proxies.ProxyFactory(settings.get("proxy", {}))
@@ -76,24 +89,73 @@ class Engine:
         callee: typing.Callable[[context.Context], typing.Any],
     ) -> context.Response:
         task_id = ctx.metadata["task_id"] = uuid.uuid4().hex
+        if ctx.deadline is None:
+            ctx.deadline = self._deadline(ctx)
+        timings = profiler.start(ctx)
+        started = ctx.metadata["started"] = time.perf_counter()
+        diagnostics.track(ctx)
+        loopmonitor.label(ctx)
 
         try:
             await self.middleware.process_request(ctx)
-            logger.debug(ctx.body.get("messages", None))
+            logger.debug("%s messages: %s", task_id, ctx.body.get("messages", None))
 
             async for attempt in self.retries(ctx):
                 async with attempt:
-                    logger.info(f"{task_id} start attempt {attempt.attempt_number} stream={ctx.body.get('stream', False)}")
+                    logger.info("%s start attempt %s stream=%s", task_id, attempt.attempt_number, ctx.body.get("stream", False))
                     response = await self._create_response(ctx, await callee(ctx))
 
                     await self.middleware.process_response(ctx)
 
                     if response:
+                        if profiler.SERVER_TIMING and timings is not None:
+                            response.headers["Server-Timing"] = timings.server_timing()
+                        # 流式请求在最后一个块之后记录
+                        if not inspect.isasyncgen(response.body):
+                            self._finished(ctx, time.perf_counter() - started)
                         return response
 
         except error.TerminationRequest as e:
             logger.info(f"{task_id} request terminated")
             return e.response
+        except Exception as e:
+            self._finished(ctx, time.perf_counter() - started, exc=e)
+            raise
+
+    def _finished(
+        self,
+        ctx: context.Context,
+        elapsed: float,
+        ttft: float | None = None,
+        exc: BaseException | None = None,
+    ) -> None:
+        metrics.request_finished(ctx, elapsed, ttft, exc)
+        logs.access(ctx, elapsed, ttft, exc)
+
+    def _deadline(self, ctx: context.Context) -> float | None:
+        """
+        请求的截止时间，优先使用请求头，其次是模型配置，最后是默认值
+        """
+        settings = self.settings.get("deadline", {})
+        timeout = settings.get("models", {}).get(ctx.model, settings.get("default", 0))
+
+        if header := ctx.headers.get(settings.get("header", "x-request-timeout"), None):
+            try:
+                value = float(header)
+            except ValueError:
+                value = math.nan
+
+            # 请求头只能缩短服务端的限制，不能放宽或取消
+            if not math.isfinite(value) or value <= 0:
+                logger.warning(f"{ctx.task_id} invalid timeout header: {header}")
+            elif timeout and timeout > 0:
+                timeout = min(value, timeout)
+            else:
+                timeout = value
+
+        if not timeout or timeout <= 0:
+            return None
+        return time.monotonic() + timeout
 
     async def _create_response(
         self,
@@ -103,7 +165,7 @@ class Engine:
         if inspect.isasyncgen(result):
             ctx.response = await self._stream_warpper(ctx, result)
             return ctx.to_response
-        elif isinstance(result, (str, bytes, list, int, dict)):
+        elif isinstance(result, (str, bytes, list, int, dict, context.Text)):
             ctx.response = result
             return ctx.to_response
 
@@ -114,15 +176,61 @@ class Engine:
         ctx: context.Context,
         streamer: typing.AsyncGenerator[context.DeltaType, None]
     ) -> typing.AsyncGenerator[context.DeltaType, None]:
+        stream_content = self._stream_content()
+        batch_size = self.middleware.chunk_batch
+
         async def generate():
-            async for chunk in streamer:
-                if chunk["type"] == "text":
-                    self.concat_chunks(ctx, chunk)
+            started = ctx.metadata.get("started", time.perf_counter())
+            ttft = None
+            failure = None
+            metrics.STREAMS.inc()
+            try:
+                async for delta in stream():
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    yield delta
+            except BaseException as e:
+                # 包括客户端断开时的 GeneratorExit
+                failure = e
+                raise
+            finally:
+                metrics.STREAMS.dec()
+                self._finished(ctx, time.perf_counter() - started, ttft, failure)
 
+        async def stream():
+            nonlocal streamer
+            batch : list[context.DeltaType] = []
+            done = False
+            while not done:
                 try:
-                    if not await self.middleware.process_chunk(ctx, chunk):
-                        logger.info(f"{ctx.task_id} chunk blocked")
+                    chunk = await anext(streamer)
+                except StopAsyncIteration:
+                    done = True
+                except Exception as e:
+                    # 流式传输中途出错，尝试续写
+                    if (resumed := await self._resume(ctx, e)) is None:
+                        raise
+                    streamer = resumed
+                    continue
+
+                if not done:
+                    if stream_content and chunk["type"] == "text":
+                        self.concat_chunks(ctx, chunk)
+
+                    # 没有中间件处理流式块时直接转发
+                    if not self.middleware.has_chunk_hooks:
+                        yield chunk
+                        continue
+
+                    batch.append(chunk)
+                    if len(batch) < batch_size:
                         continue
+
+                if not batch:
+                    break
+
+                try:
+                    passed = await self.middleware.process_chunks(ctx, batch)
                 except error.TerminationRequest as e:
                     logger.info(f"{ctx.task_id} request terminated")
                     if inspect.isasyncgen(e.response.body):
@@ -137,47 +245,117 @@ class Engine:
                         raise RuntimeError(f"TerminationRequest {ctx.task_id} response is not a stream") from e
                     
                     break
-                
-                yield chunk
+
+                if len(passed) < len(batch):
+                    logger.info(f"{ctx.task_id} {len(batch) - len(passed)} chunk blocked")
+
+                batch = []
+                for delta in passed:
+                    yield delta
         
         return generate()
     
-    def concat_chunks(self, ctx: context.Context, chunk: context.DeltaType) -> context.DeltaType:
-        if not chunk:
+    def _stream_content(self) -> bool | int:
+        """
+        是否需要累积流式内容，续写需要完整内容，否则按中间件的需求
+        """
+        if self.settings.get("resume", {}).get("enabled", False):
+            return True
+        return self.middleware.stream_content
+
+    async def _resume(
+        self, ctx: context.Context, exc: Exception
+    ) -> typing.AsyncGenerator[context.DeltaType, None] | None:
+        """
+        将已生成的内容作为 assistant 消息重新请求，返回续写的流，无法续写时返回 None
+        """
+        settings = self.settings.get("resume", {})
+        if not settings.get("enabled", False) or ctx.type != "text":
             return None
-        
-        if ctx.metadata.get("stream_content", None) is None:
-            ctx.metadata["stream_content"] = chunk
-            return chunk
-        
-        # 不考虑多个响应
-        combined : context.DeltaType = ctx.metadata["stream_content"]
 
-        if chunk["content"]:
-            if combined.get("content", None) is None:
-                combined["content"] = chunk["content"]
-            else:
-                combined["content"] += chunk["content"]
-        
-        if chunk["reasoning_content"]:
-            if combined.get("reasoning_content", None) is None:
-                combined["reasoning_content"] = chunk["reasoning_content"]
-            else:
-                combined["reasoning_content"] += chunk["reasoning_content"]
-        
-        if calls := chunk.get("tool_calls"):
-            if combined.get("tool_calls", None) is None:
-                combined["tool_calls"] = calls
+        resumes = ctx.metadata.get("resumes", 0)
+        if resumes >= settings.get("max_resumes", 1):
+            return None
+
+        policy = retry.get_policy(ctx)
+        if policy is not None and not policy.should_retry(exc):
+            return None
+
+        ctx.metadata["resumes"] = resumes + 1
+        accumulator : context.TextAccumulator | None = getattr(ctx.metadata, "stream_content", None)
+        partial = accumulator.content if accumulator is not None else None
+        # 客户端已经收到中断前的推理内容，续写重新生成的推理内容不再转发
+        reasoned = accumulator is not None and bool(accumulator.reasoning_content)
+        logger.warning(f"{ctx.task_id} stream interrupted after {len(partial or '')} chars, resuming: {exc}")
+
+        messages = list(ctx.body.get("messages", []))
+        if partial:
+            message = {"role": "assistant", "content": partial}
+            prompt = settings.get("prompt", "")
+            if settings.get("prefix", False):
+                # 前缀续写，例如 DeepSeek 的 prefix completion，前缀消息必须是最后一条
+                message["prefix"] = True
+                if prompt:
+                    messages.append({"role": "user", "content": prompt})
+                messages.append(message)
             else:
-                tool_calls = combined["tool_calls"]
-                for call in calls:
-                    index : int = call.get("index", 0)
-                    if index >= len(tool_calls):
-                        tool_calls.append(call)
-                    elif tool_calls[index]["function"].get("arguments", None) is None:
-                        tool_calls[index]["function"]["arguments"] = call["function"]["arguments"]
-                    else:
-                        # 只有 arguments 才会流式传输
-                        tool_calls[index]["function"]["arguments"] += call["function"]["arguments"]
-        
-        return combined
+                messages.append(message)
+                if prompt:
+                    messages.append({"role": "user", "content": prompt})
+
+        # 共享 metadata，续写的用量和 worker 信息写回原请求
+        resume_ctx = context.Context(
+            headers=ctx.headers,
+            body={**ctx.body, "messages": messages},
+            type=ctx.type,
+            metadata=ctx.metadata,
+            deadline=ctx.deadline,
+        )
+
+        try:
+            # 从刚刚中断的 worker 的下一个开始
+            result = await self.workers.generate_text(resume_ctx, ctx.metadata.get("worker", None))
+        except Exception:
+            logger.warning(f"{ctx.task_id} resume failed", exc_info=True)
+            return None
+
+        if inspect.isasyncgen(result):
+            stream = result
+        else:
+            async def single():
+                yield result
+
+            stream = single()
+
+        return self._skip_reasoning(stream) if reasoned else stream
+
+    @staticmethod
+    async def _skip_reasoning(
+        stream: typing.AsyncGenerator[context.DeltaType, None],
+    ) -> typing.AsyncGenerator[context.DeltaType, None]:
+        """
+        去掉续写流中的推理内容，只剩推理内容的块直接丢弃
+        """
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                if isinstance(chunk, (context.Text, dict)) and chunk.get("type") == "text" and chunk.get("reasoning_content"):
+                    chunk["reasoning_content"] = None
+                    if not chunk.get("content") and not chunk.get("tool_calls"):
+                        continue
+                yield chunk
+
+    def concat_chunks(self, ctx: context.Context, chunk: context.DeltaType) -> context.TextAccumulator | None:
+        if chunk is None:
+            return None
+
+        # 不考虑多个响应；每个块都会调用，直接读取 metadata 的属性
+        accumulator : context.TextAccumulator | None = getattr(ctx.metadata, "stream_content", None)
+        if accumulator is None:
+            # 只需要末尾内容时保留有限的窗口
+            window = self._stream_content()
+            accumulator = ctx.metadata.stream_content = context.TextAccumulator(
+                0 if window is True else int(window)
+            )
+
+        accumulator.add(chunk)
+        return accumulator
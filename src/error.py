@@ -1,6 +1,8 @@
+import typing
 import logging
 import contextlib
 import context
+import metrics
 
 
 class WorkerError(Exception): ...
@@ -15,6 +17,34 @@ class WorkerNoAvaliableError(WorkerError): ...
 class WorkerUnsupportedError(WorkerError): ...
 
 
+class DeadlineExceededError(WorkerError): ...
+
+
+class WorkerStalledError(WorkerError): ...
+
+
+class UpstreamStatusError(WorkerError):
+    """上游返回了非 2xx 状态码"""
+
+    def __init__(self, status: int, message: str = "") -> None:
+        super().__init__(message or f"ERROR: {status}")
+        self.status = status
+
+
+def status_code(status: typing.Any) -> int:
+    """将 rnet.StatusCode 之类的对象转换为 int，无法识别时返回 0"""
+    if isinstance(status, int):
+        return status
+
+    if as_int := getattr(status, "as_int", None):
+        return as_int()
+
+    try:
+        return int(str(status).split()[0])
+    except (ValueError, IndexError):
+        return 0
+
+
 class TerminationRequest(Exception):
     def __init__(self, response: context.Response) -> None:
         self.response = response
@@ -34,7 +64,12 @@ def worker_handler(ctx: context.Context, logger: logging.Logger, worker: str = "
             f"{worker} unavaliable: {e} for model {ctx.model}",
             extra={"context": ctx},
         )
+        if not isinstance(e, NotImplementedError):
+            # 记录失败原因，由 WorkerManager 决定是否切换到下一个 worker
+            ctx.metadata["worker_error"] = e
+            metrics.worker_error(ctx, getattr(worker, "name", worker), e)
     except Exception as e:
+        metrics.worker_error(ctx, getattr(worker, "name", worker), e)
         logger.critical(
             f"{worker} error: {e} for model {ctx.model}",
             exc_info=True,
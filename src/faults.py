@@ -0,0 +1,243 @@
+"""
+上游故障注入，用于在压力下观察重试、熔断和故障切换
+
+在 worker 上设置 faults 后，Worker.client() 返回的客户端会按配置的概率：
+在请求前增加延迟、抛出连接重置、直接返回 429/5xx、在流中途断开连接，或把响应拆成小块慢速输出。
+故障在真实请求（或 cassette 回放）之外注入，可以和 benchmarks/upstreams 中的模拟上游一起使用。
+"""
+import re
+import json
+import random
+import typing
+import asyncio
+import logging
+import http_client
+import rnet
+import rnet.exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class Latency:
+    """请求前的额外延迟（秒）"""
+
+    def __init__(self, settings: dict[str, typing.Any]):
+        # fixed、uniform（min 到 max）、exponential（均值为 mean）或 lognormal（中位数为 mean）
+        self.distribution: str = settings.get("distribution", "fixed")
+        self.mean: float = settings.get("mean", 0)
+        self.sigma: float = settings.get("sigma", 0.5)
+        self.min: float = settings.get("min", 0)
+        self.max: float = settings.get("max", 60)
+        # 增加延迟的请求比例
+        self.rate: float = settings.get("rate", 1.0)
+        if self.distribution not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"未知的延迟分布 '{self.distribution}'")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.rate < 1 and rng.random() >= self.rate:
+            return 0
+        if self.distribution == "uniform":
+            value = rng.uniform(self.min, self.max)
+        elif self.distribution == "exponential":
+            value = rng.expovariate(1 / self.mean) if self.mean > 0 else 0
+        elif self.distribution == "lognormal":
+            value = self.mean * rng.lognormvariate(0, self.sigma)
+        else:
+            value = self.mean
+        return min(max(value, self.min), self.max)
+
+
+class FaultInjector:
+    def __init__(self, settings: dict[str, typing.Any]):
+        self.rng = random.Random(settings.get("seed", None))
+        # 只对匹配该正则的 URL 注入，默认全部
+        self.match = re.compile(settings["match"]) if settings.get("match") else None
+        self.latency = Latency(settings["latency"]) if settings.get("latency") else None
+        # 发送请求前抛出连接重置的概率
+        self.reset_rate: float = settings.get("reset_rate", 0)
+        # 状态码到概率，例如 {429: 0.05, 503: 0.02}，不访问上游直接返回
+        self.status_rates: dict[int, float] = {int(k): v for k, v in settings.get("status", {}).items()}
+        # 429 响应的 retry-after 头（秒），0 不设置
+        self.retry_after: int = settings.get("retry_after", 0)
+        # 读取响应体时断开连接的概率，流式响应在 disconnect_after 范围内的随机块数之后断开
+        self.disconnect_rate: float = settings.get("disconnect_rate", 0)
+        self.disconnect_after: tuple[int, int] = tuple(settings.get("disconnect_after", [0, 32]))
+        # 慢速输出的概率、每个小块前的延迟（秒）和小块大小（字节，0 不拆分）
+        drip = settings.get("drip", {})
+        self.drip_rate: float = drip.get("rate", 0)
+        self.drip_delay: float = drip.get("delay", 0.05)
+        self.drip_size: int = drip.get("size", 0)
+
+    def applies(self, url: str) -> bool:
+        return self.match is None or self.match.search(url) is not None
+
+    def status(self) -> int | None:
+        value = self.rng.random()
+        for status, rate in self.status_rates.items():
+            if value < rate:
+                return status
+            value -= rate
+        return None
+
+    def wrap(self, client: rnet.Client) -> rnet.Client:
+        return FaultClient(client, self)
+
+
+class FaultClient(http_client.ClientWrapper):
+    def __init__(self, client: rnet.Client, injector: FaultInjector):
+        super().__init__(client)
+        self._injector = injector
+
+    async def request(self, method: rnet.Method, url: str, **kwargs) -> rnet.Response:
+        injector = self._injector
+        if not injector.applies(url):
+            return await self._client.request(method, url, **kwargs)
+
+        rng = injector.rng
+        if injector.latency is not None and (delay := injector.latency.sample(rng)) > 0:
+            await asyncio.sleep(delay)
+
+        if rng.random() < injector.reset_rate:
+            logger.debug(f"Injected connection reset for {url}")
+            raise rnet.exceptions.ConnectionResetError(f"injected connection reset by peer: {url}")
+
+        if status := injector.status():
+            logger.debug(f"Injected {status} for {url}")
+            return StatusResponse(url, status, injector.retry_after)
+
+        response = await self._client.request(method, url, **kwargs)
+        disconnect = None
+        if rng.random() < injector.disconnect_rate:
+            disconnect = rng.randint(*injector.disconnect_after)
+        drip = rng.random() < injector.drip_rate
+        if disconnect is None and not drip:
+            return response
+        return FaultResponse(response, injector, url, disconnect, drip)
+
+
+class FaultResponse(http_client.ResponseWrapper):
+    def __init__(self, response: rnet.Response, injector: FaultInjector, url: str, disconnect: int | None, drip: bool):
+        super().__init__(response)
+        self._injector = injector
+        self._url = url
+        # 断开前允许输出的块数，None 表示不断开
+        self._disconnect = disconnect
+        self._drip = drip
+
+    def _disconnected(self) -> rnet.exceptions.BodyError:
+        logger.debug(f"Injected disconnect for {self._url}")
+        return rnet.exceptions.BodyError(f"injected disconnect while reading body: {self._url}")
+
+    async def bytes(self) -> bytes:
+        if self._disconnect is not None:
+            raise self._disconnected()
+        if self._drip:
+            await asyncio.sleep(self._injector.drip_delay)
+        return await self._response.bytes()
+
+    async def text(self) -> str:
+        return (await self.bytes()).decode(self._response.encoding or "utf-8", "replace")
+
+    async def json(self) -> typing.Any:
+        return json.loads(await self.bytes())
+
+    def stream(self) -> rnet.Streamer:
+        return FaultStreamer(self._response.stream(), self)
+
+
+class FaultStreamer(http_client.StreamerWrapper):
+    def __init__(self, streamer: rnet.Streamer, response: FaultResponse):
+        super().__init__(streamer)
+        self._fault = response
+        self._count = 0
+        self._pending: list[bytes] = []
+
+    async def __anext__(self) -> bytes:
+        fault = self._fault
+        if fault._disconnect is not None and self._count >= fault._disconnect:
+            raise fault._disconnected()
+        self._count += 1
+
+        if not fault._drip:
+            return await self._streamer.__anext__()
+
+        injector = fault._injector
+        if not self._pending:
+            chunk = await self._streamer.__anext__()
+            size = injector.drip_size or len(chunk) or 1
+            self._pending = [chunk[i:i + size] for i in range(0, len(chunk), size)][::-1] or [chunk]
+        await asyncio.sleep(injector.drip_delay)
+        return self._pending.pop()
+
+
+class StatusResponse:
+    """注入的错误响应，不访问上游"""
+
+    def __init__(self, url: str, status: int, retry_after: int = 0):
+        self.url = url
+        self.status = status
+        self.ok = False
+        self.encoding = "utf-8"
+        self.headers = rnet.HeaderMap()
+        self.headers.append("content-type", "application/json")
+        if status == 429 and retry_after:
+            self.headers.append("retry-after", str(retry_after))
+        self._body = json.dumps({
+            "error": {"message": f"injected {status}", "type": "injected_fault", "code": status},
+        }).encode("utf-8")
+
+    @property
+    def __class__(self):
+        return rnet.Response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def bytes(self) -> bytes:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode("utf-8")
+
+    async def json(self) -> typing.Any:
+        return json.loads(self._body)
+
+    def stream(self) -> rnet.Streamer:
+        return StatusStreamer(self._body)
+
+
+class StatusStreamer:
+    def __init__(self, body: bytes):
+        self._body: bytes | None = body
+
+    @property
+    def __class__(self):
+        return rnet.Streamer
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self._body is None:
+            raise StopAsyncIteration
+        body, self._body = self._body, None
+        return body
+
+
+def create(settings: dict[str, typing.Any] | None) -> FaultInjector | None:
+    """根据 worker 的 faults 设置创建故障注入器，没有设置或未启用时返回 None"""
+    if not settings or not settings.get("enabled", True):
+        return None
+    return FaultInjector(settings)
@@ -41,3 +41,104 @@ class ClientOptions(typing.TypedDict, total=False):
     brotli: typing.Optional[bool]
     deflate: typing.Optional[bool]
     zstd: typing.Optional[bool]
+
+
+class ClientWrapper:
+    """
+    包装 rnet.Client 以拦截请求（录制、回放、故障注入）。
+    所有请求方法都经过 request()，其他属性（cookie 等）交给被包装的客户端
+    """
+
+    def __init__(self, client: rnet.Client):
+        self._client = client
+
+    # 让 workers 中的 isinstance 断言和类型检查同样适用于包装后的对象
+    @property
+    def __class__(self):
+        return rnet.Client
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self._client, name)
+
+    async def request(self, method: rnet.Method, url: str, **kwargs) -> rnet.Response:
+        return await self._client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.GET, url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.POST, url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.PUT, url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.PATCH, url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.DELETE, url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.HEAD, url, **kwargs)
+
+    async def options(self, url: str, **kwargs) -> rnet.Response:
+        return await self.request(rnet.Method.OPTIONS, url, **kwargs)
+
+
+class ResponseWrapper:
+    """
+    包装 rnet.Response，默认把所有操作交给被包装的响应，子类覆盖需要拦截的部分
+    """
+
+    def __init__(self, response: rnet.Response):
+        self._response = response
+
+    @property
+    def __class__(self):
+        return rnet.Response
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self._response, name)
+
+    async def __aenter__(self):
+        await self._response.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return await self._response.__aexit__(exc_type, exc_val, exc_tb)
+
+    async def text(self) -> str:
+        return await self._response.text()
+
+    async def json(self) -> typing.Any:
+        return await self._response.json()
+
+    async def bytes(self) -> bytes:
+        return await self._response.bytes()
+
+    def stream(self) -> rnet.Streamer:
+        return StreamerWrapper(self._response.stream())
+
+
+class StreamerWrapper:
+    """包装 rnet.Streamer，子类覆盖 __anext__ 以拦截每个块"""
+
+    def __init__(self, streamer: rnet.Streamer):
+        self._streamer = streamer
+
+    @property
+    def __class__(self):
+        return rnet.Streamer
+
+    async def __aenter__(self):
+        await self._streamer.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return await self._streamer.__aexit__(exc_type, exc_val, exc_tb)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        return await self._streamer.__anext__()
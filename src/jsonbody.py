@@ -0,0 +1,75 @@
+"""
+上游请求体的序列化
+
+worker 在每个请求开始时把请求体编码为 bytes，之后的 key 重试、代理切换都复用同一份字节，
+不再由 rnet 在每次尝试时重新编码 json=body；安装了 orjson 时使用它编码。
+需要在每次尝试时变化的字段（例如 z.ai 的 chat_id）由 Template 在编码结果中留出位置，只编码这些字段。
+"""
+import re
+import json
+import uuid
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_TYPE = "application/json"
+
+
+def dumps(obj: typing.Any) -> bytes:
+    """编码为紧凑的 UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson 不支持的内容（超过 64 位的整数、非字符串的键等）交给标准库
+            pass
+    try:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    except UnicodeEncodeError:
+        # 客户端发来的孤立代理项无法编码为 UTF-8，改为 \uXXXX 转义，仍然是有效的 JSON
+        return json.dumps(obj, separators=(",", ":")).encode("ascii")
+
+
+def headers(base: dict[str, str]) -> dict[str, str]:
+    """复制请求头，没有设置 Content-Type 时补上"""
+    result = base.copy()
+    if not any(k.lower() == "content-type" for k in result):
+        result["Content-Type"] = CONTENT_TYPE
+    return result
+
+
+class Template:
+    """
+    只编码一次的请求体，fields 中的顶层字段在 render() 时替换为每次尝试的值
+    """
+
+    def __init__(self, body: dict[str, typing.Any], fields: typing.Iterable[str] = ()):
+        self.fields = tuple(fields)
+        # 编码结果按占位字段切开：bytes 原样输出，str 为字段名
+        self._parts: list[bytes | str] = []
+        if not self.fields:
+            self._parts.append(dumps(body))
+            return
+
+        markers: dict[bytes, str] = {}
+        placeholder = dict(body)
+        for field in self.fields:
+            marker = f"lmproxy-template-{uuid.uuid4().hex}"
+            placeholder[field] = marker
+            markers[dumps(marker)] = field
+
+        data = dumps(placeholder)
+        position = 0
+        for match in re.finditer(b"|".join(re.escape(x) for x in markers), data):
+            self._parts.append(data[position:match.start()])
+            self._parts.append(markers[match.group()])
+            position = match.end()
+        self._parts.append(data[position:])
+
+    def render(self, **values: typing.Any) -> bytes:
+        if not self.fields:
+            return self._parts[0]
+        return b"".join(x if isinstance(x, bytes) else dumps(values[x]) for x in self._parts)
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import reprlib
+import typing
+import logging
+import threading
+import logging.handlers
+import context
+
+logger = logging.getLogger(__name__)
+
+
+# 不可变的参数可以留到后台线程再格式化
+_SCALARS = (str, int, float, bool, bytes, type(None))
+
+# 容器参数的快照只保留有限的层数和长度，很大的请求体也只做固定量的工作
+_REPR = reprlib.Repr()
+_REPR.maxlevel = 4
+_REPR.maxstring = _REPR.maxother = 200
+_REPR.maxlist = _REPR.maxtuple = _REPR.maxdict = _REPR.maxset = 20
+
+
+def _snapshot(value: typing.Any) -> typing.Any:
+    return value if isinstance(value, _SCALARS) else _REPR.repr(value)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    在调用线程中不格式化消息，%-参数留到后台线程写入时才格式化。
+    参数中的容器（例如请求的 messages）立即替换为限制了长度的 repr：按引用保存的容器在写入前可能被中间件修改，
+    也会让很大的请求体一直存活到后台线程处理完这条记录
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if not args:
+            return record
+
+        # 单个 dict 参数（%(name)s 格式）本身就是调用者的容器
+        if isinstance(args, dict):
+            record.args = { k: _snapshot(v) for k, v in args.items() }
+        elif not all(isinstance(x, _SCALARS) for x in args):
+            record.args = tuple(_snapshot(x) for x in args)
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 logger 名称前缀采样，例如 {"middlewares.tools": 0.1} 只保留 10% 的记录，
+    WARNING 及以上总是保留
+    """
+
+    def __init__(self, rates: dict[str, float] | None = None) -> None:
+        super().__init__()
+        # 最长前缀优先
+        self.rates = sorted((rates or {}).items(), key=lambda x: len(x[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+_listeners: list[logging.handlers.QueueListener] = []
+
+
+def install_queue() -> None:
+    """
+    将已配置的 handler 移到后台线程，logger 只把记录放入队列。
+    每个 handler 一个队列和线程，共享同一 handler 的 logger 共享队列。
+    """
+    loggers = [logging.getLogger()] + [
+        x for x in logging.root.manager.loggerDict.values()
+        if isinstance(x, logging.Logger) and x.handlers
+    ]
+
+    replaced: dict[logging.Handler, logging.Handler] = {}
+    for target in loggers:
+        for handler in list(target.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                continue
+
+            if handler not in replaced:
+                q: queue.SimpleQueue = queue.SimpleQueue()
+                proxy = LazyQueueHandler(q)
+                proxy.setLevel(handler.level)
+                listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+                listener.start()
+                _listeners.append(listener)
+                replaced[handler] = proxy
+
+            target.removeHandler(handler)
+            target.addHandler(replaced[handler])
+
+    atexit.register(stop_queue)
+
+
+def stop_queue() -> None:
+    while _listeners:
+        _listeners.pop().stop()
+
+
+class AccessLog:
+    """
+    在后台线程中按批写入 JSONL 访问日志。
+    记录在采样通过后才构建，序列化和写入都在后台线程完成；队列满时丢弃记录。
+    """
+
+    def __init__(
+        self,
+        filename: str = "../logs/access.jsonl",
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        sample: dict[str, float] | None = None,
+    ) -> None:
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.sample = sample or {}
+        self.dropped = 0
+        self._queue: queue.Queue[dict[str, typing.Any] | None] = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _rate(self, ctx: context.Context, exc: BaseException | None) -> float:
+        if exc is not None:
+            return self.sample.get("error", 1.0)
+        return self.sample.get(ctx.type, self.sample.get("default", 1.0))
+
+    def record(
+        self,
+        ctx: context.Context,
+        elapsed: float,
+        ttft: float | None = None,
+        exc: BaseException | None = None,
+    ) -> None:
+        rate = self._rate(ctx, exc)
+        if rate < 1 and random.random() >= rate:
+            return
+
+        timings = ctx.metadata.get("timings", None)
+        entry = {
+            "time": time.time(),
+            "task_id": ctx.task_id,
+            "type": ctx.type,
+            "model": ctx.model,
+            "stream": bool(ctx.body.get("stream", False)),
+            "worker": ctx.metadata.get("worker", None),
+            "status": "ok" if exc is None else exc.__class__.__name__,
+            "error": None if exc is None else str(exc),
+            "duration": elapsed,
+            "ttft": ttft,
+            "resumes": ctx.metadata.get("resumes", 0),
+            "usage": ctx.metadata.get("usage", None),
+            # 复制一份，避免后台线程序列化时被修改
+            "timings": dict(timings.spans) if timings is not None else None,
+        }
+
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.filename, "a", encoding="utf-8") as f:
+            closed = False
+            while not closed:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if entry is None:
+                        closed = True
+                        break
+                    batch.append(entry)
+
+                if batch:
+                    f.write("".join(
+                        json.dumps(x, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                        for x in batch
+                    ))
+                    f.flush()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+_access: AccessLog | None = None
+
+
+def configure(settings: dict[str, typing.Any]) -> None:
+    global _access
+    if _access is not None or not settings.get("enabled", False):
+        return
+
+    _access = AccessLog(
+        settings.get("filename", "../logs/access.jsonl"),
+        settings.get("batch_size", 100),
+        settings.get("flush_interval", 1.0),
+        settings.get("max_queue", 10000),
+        settings.get("sample", {}),
+    )
+
+
+def access(
+    ctx: context.Context,
+    elapsed: float,
+    ttft: float | None = None,
+    exc: BaseException | None = None,
+) -> None:
+    if _access is not None:
+        _access.record(ctx, elapsed, ttft, exc)
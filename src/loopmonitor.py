@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import typing
+import asyncio
+import logging
+import threading
+import traceback
+import context
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 由 start 设置，关闭时 label 不做任何事
+ENABLED = False
+
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Block(typing.NamedTuple):
+    where: str
+    task: str | None
+    stack: str
+
+
+class LoopMonitor:
+    """
+    事件循环上的心跳协程记录调度延迟；监视线程发现心跳超时时，
+    抓取事件循环线程当时的调用栈和正在运行的任务，心跳恢复后报告阻塞时长。
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, stack_limit: int = 30) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread = 0
+        self._beat = time.monotonic()
+        self._captured_beat = 0.0
+        self._block: Block | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+
+            lag = max(0.0, now - expected)
+            metrics.LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report(lag)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(min(self.interval, self.threshold) / 2):
+            beat = self._beat
+            if beat == self._captured_beat or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+
+            # 每次阻塞只抓取一次，尽量靠近阻塞开始的位置
+            self._captured_beat = beat
+            self._block = self._capture()
+
+    def _capture(self) -> Block | None:
+        frame = sys._current_frames().get(self._loop_thread, None)
+        if frame is None:
+            return None
+
+        # 最内层的本项目代码，例如 middlewares/regex.py:RegexMiddleware.process_request
+        where = "unknown"
+        current = frame
+        while current is not None:
+            filename = current.f_code.co_filename
+            if filename.startswith(_SOURCE_DIR) and not filename.endswith(__file__):
+                where = f"{os.path.relpath(filename, _SOURCE_DIR)}:{current.f_code.co_qualname}"
+                break
+            current = current.f_back
+
+        task = asyncio.current_task(self._loop)
+        return Block(
+            where,
+            task.get_name() if task is not None else None,
+            "".join(traceback.format_stack(frame, self.stack_limit)),
+        )
+
+    def _report(self, lag: float) -> None:
+        block, self._block = self._block, None
+        if block is None:
+            metrics.LOOP_BLOCKED.inc("unknown")
+            logger.warning("event loop blocked for %.3fs", lag)
+            return
+
+        metrics.LOOP_BLOCKED.inc(block.where)
+        logger.warning(
+            "event loop blocked for %.3fs in %s (task %s)\n%s",
+            lag, block.where, block.task, block.stack,
+        )
+
+
+_monitor: LoopMonitor | None = None
+
+
+def start(settings: dict[str, typing.Any]) -> None:
+    """在事件循环启动后调用"""
+    global _monitor, ENABLED
+    if _monitor is not None or not settings.get("enabled", True):
+        return
+
+    _monitor = LoopMonitor(
+        settings.get("interval", 0.1),
+        settings.get("threshold", 0.25),
+        settings.get("stack_limit", 30),
+    )
+    _monitor.start()
+    ENABLED = True
+
+
+async def stop() -> None:
+    global _monitor, ENABLED
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
+    ENABLED = False
+
+
+def label(ctx: context.Context) -> None:
+    """将当前任务命名为请求类型和 task_id，阻塞报告中可以看到是哪个请求"""
+    if ENABLED and (task := asyncio.current_task()) is not None:
+        task.set_name(f"{ctx.type}:{ctx.task_id}")
@@ -1,11 +1,18 @@
+import hmac
+import math
 import time
 import json
 import random
+import typing
 import logging
 import inspect
 import blacksheep
 import engine
+import metrics
+import diagnostics
+import loopmonitor
 import conf
+import context
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +22,155 @@ app.add_cors_policy("lmproxy", allow_methods="GET,POST,OPTIONS", allow_origins="
 _engine = engine.Engine(conf.settings)
 
 
+async def on_start(application: blacksheep.Application) -> None:
+    loopmonitor.start(conf.settings.get("loop_monitor", {}))
+
+
+async def on_stop(application: blacksheep.Application) -> None:
+    await loopmonitor.stop()
+
+
+app.on_start += on_start
+app.on_stop += on_stop
+
+
+@blacksheep.get("/metrics")
+async def metrics_endpoint(request: blacksheep.Request) -> blacksheep.Response:
+    if not metrics.ENABLED:
+        return blacksheep.not_found()
+
+    return blacksheep.Response(
+        200,
+        None,
+        blacksheep.Content(b"text/plain; version=0.0.4; charset=utf-8", metrics.render().encode("utf-8")),
+    )
+
+
+def _admin(request: blacksheep.Request) -> blacksheep.Response | None:
+    """校验管理接口的 token，未配置 token 时管理接口不可用"""
+    token = conf.settings.get("admin", {}).get("token", "")
+    if not token:
+        return blacksheep.not_found()
+
+    header = (request.get_first_header(b"authorization") or b"").decode()
+    if not hmac.compare_digest(header.removeprefix("Bearer ").encode(), token.encode()):
+        return blacksheep.unauthorized()
+    return None
+
+
+def _query(request: blacksheep.Request, name: str, default: str) -> str:
+    return request.query.get(name, [default])[0]
+
+
+def _seconds(request: blacksheep.Request) -> float:
+    """无法解析时抛出 ValueError"""
+    max_seconds = conf.settings.get("admin", {}).get("max_seconds", 300)
+    seconds = float(_query(request, "seconds", "10"))
+    if not math.isfinite(seconds):
+        raise ValueError(f"invalid seconds: {seconds}")
+    return min(max(seconds, 0.1), max_seconds)
+
+
+@blacksheep.post("/admin/profile/cpu")
+async def profile_cpu(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    try:
+        seconds = _seconds(request)
+        limit = int(_query(request, "limit", "50"))
+    except ValueError as e:
+        return blacksheep.bad_request(str(e))
+
+    format = _query(request, "format", "collapsed")
+    try:
+        if format == "collapsed":
+            interval = conf.settings.get("admin", {}).get("sample_interval", 0.005)
+            return blacksheep.text(await diagnostics.sample_cpu(seconds, interval))
+
+        stats = await diagnostics.profile_cpu(seconds)
+    except diagnostics.ProfilerBusyError as e:
+        return blacksheep.Response(409, None, blacksheep.Content(b"text/plain", str(e).encode()))
+
+    if format == "pstats":
+        return blacksheep.Response(
+            200,
+            [(b"Content-Disposition", b'attachment; filename="lmproxy.pstats"')],
+            blacksheep.Content(b"application/octet-stream", diagnostics.dump_stats(stats)),
+        )
+
+    try:
+        return blacksheep.text(diagnostics.format_stats(stats, _query(request, "sort", "cumulative"), limit))
+    except KeyError as e:
+        # 未知的排序字段
+        return blacksheep.bad_request(str(e))
+
+
+@blacksheep.post("/admin/memory/start")
+async def memory_start(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    try:
+        diagnostics.memory_start(int(_query(request, "frames", "1")))
+    except ValueError as e:
+        return blacksheep.bad_request(str(e))
+    return blacksheep.json({"tracing": True})
+
+
+@blacksheep.post("/admin/memory/stop")
+async def memory_stop(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    diagnostics.memory_stop()
+    return blacksheep.json({"tracing": False})
+
+
+@blacksheep.get("/admin/memory/snapshot")
+async def memory_snapshot(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    try:
+        return blacksheep.json(
+            diagnostics.memory_snapshot(int(_query(request, "limit", "30")), _query(request, "key", "lineno"))
+        )
+    except (ValueError, RuntimeError) as e:
+        return blacksheep.bad_request(str(e))
+
+
+@blacksheep.get("/admin/memory/diff")
+async def memory_diff(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    target = _query(request, "target", "")
+    try:
+        return blacksheep.json(
+            diagnostics.memory_diff(
+                int(_query(request, "base", "0")),
+                int(target) if target else None,
+                int(_query(request, "limit", "30")),
+                _query(request, "key", "lineno"),
+            )
+        )
+    except (KeyError, ValueError, RuntimeError) as e:
+        return blacksheep.bad_request(str(e))
+
+
+@blacksheep.get("/admin/objects")
+async def objects(request: blacksheep.Request) -> blacksheep.Response:
+    if denied := _admin(request):
+        return denied
+
+    try:
+        limit = int(_query(request, "limit", "50"))
+    except ValueError as e:
+        return blacksheep.bad_request(str(e))
+    return blacksheep.json(diagnostics.objects(limit, _query(request, "collect", "1") != "0"))
+
+
 @blacksheep.get("/v1/models")
 @blacksheep.get("/models")
 async def models(request: blacksheep.Request) -> blacksheep.Response:
@@ -47,6 +203,28 @@ async def models(request: blacksheep.Request) -> blacksheep.Response:
     )
 
 
+def _dumps(data: typing.Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=context.to_json)
+
+
+def _sse_chunk(data: dict) -> bytes:
+    """编码一个 SSE 事件"""
+    return f"data: {_dumps(data)}\n\n".encode("utf-8")
+
+
+def _sse_delta(id: int, model: str, delta: context.DeltaType) -> bytes:
+    """
+    编码一个流式块，每个块都会调用。外层结构直接拼接，只有 delta 需要 JSON 编码，
+    model 是已经编码好的 JSON 字符串
+    """
+    if isinstance(delta, context.Text):
+        delta = delta.to_dict()
+    return (
+        f'data: {{"id":{id},"object":"chat.completion.chunk","created":{int(time.time())},'
+        f'"model":{model},"choices":[{{"index":0,"delta":{_dumps(delta)}}}]}}\n\n'
+    ).encode("utf-8")
+
+
 @blacksheep.post("/v1/chat/completions")
 @blacksheep.post("/chat/completions")
 async def chat_completions(request: blacksheep.Request) -> blacksheep.Response:
@@ -54,10 +232,11 @@ async def chat_completions(request: blacksheep.Request) -> blacksheep.Response:
     result = await _engine.generate_text(
         payload, {k.decode(): v.decode() for k, v in request.headers.items()}
     )
+    # 中间件直接返回的完整响应（没有 type 的 dict）原样输出
     if isinstance(result.body, dict) and not result.body.get("type", None):
         return blacksheep.Response(
             result.status_code,
-            list(result.headers.items()),
+            result.raw_headers(),
             blacksheep.JSONContent(result.body),
         )
 
@@ -65,25 +244,12 @@ async def chat_completions(request: blacksheep.Request) -> blacksheep.Response:
 
         async def generate():
             id = random.randint(0x10000000, 0xFFFFFFFF)
+            model = _dumps(payload.get("model", "unknown"))
             async for delta in result.body:
-                data = json.dumps(
-                    {
-                        "id": id,
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": payload.get("model", "unknown"),
-                        "choices": [{
-                            "index": 0,
-                            "delta": delta,
-                        }],
-                    },
-                    ensure_ascii=False,
-                    separators=(",", ":"),
-                )
-                yield f"data: {data}\n\n".encode("utf-8")
+                yield _sse_delta(id, model, delta)
             
             if usage := result.metadata.get("usage", None):
-                data = json.dumps(
+                yield _sse_chunk(
                     {
                         "id": id,
                         "object": "chat.completion.chunk",
@@ -98,23 +264,20 @@ async def chat_completions(request: blacksheep.Request) -> blacksheep.Response:
                         }],
                         "usage": usage,
                         "worker": result.metadata.get("worker", "unknown"),
-                    },
-                    ensure_ascii=False,
-                    separators=(",", ":"),
+                    }
                 )
-                yield f"data: {data}\n\n".encode("utf-8")
 
             yield b"data: [DONE]\n\n"
 
         return blacksheep.Response(
             result.status_code,
-            list(result.headers.items()),
+            result.raw_headers(),
             blacksheep.StreamedContent(b"text/event-stream", generate),
         )
 
     return blacksheep.Response(
         result.status_code,
-        list(result.headers.items()),
+        result.raw_headers(),
         blacksheep.JSONContent(
             {
                 "id": random.randint(0x10000000, 0xFFFFFFFF),
@@ -124,7 +287,7 @@ async def chat_completions(request: blacksheep.Request) -> blacksheep.Response:
                 "choices": [
                     {
                         "index": 0,
-                        "message": result.body,
+                        "message": result.body.to_dict() if isinstance(result.body, context.Text) else result.body,
                         "finish_reason": "stop",
                     }
                 ],
@@ -146,7 +309,7 @@ async def embeddings(request: blacksheep.Request) -> blacksheep.Response:
     if isinstance(result.body, list):
         return blacksheep.Response(
             result.status_code,
-            list(result.headers.items()),
+            result.raw_headers(),
             blacksheep.JSONContent(
                 {
                     "object": "embedding",
@@ -158,6 +321,6 @@ async def embeddings(request: blacksheep.Request) -> blacksheep.Response:
 
     return blacksheep.Response(
         result.status_code,
-        list(result.headers.items()),
+        result.raw_headers(),
         blacksheep.JSONContent(result.body),
     )
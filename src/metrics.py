@@ -0,0 +1,305 @@
+import typing
+import logging
+import itertools
+import cache
+import context
+import profiler
+import resources
+import proxies
+
+logger = logging.getLogger(__name__)
+
+# 由 configure 根据配置设置
+ENABLED = True
+# 可以作为 model 标签的模型，即 worker 配置或上游返回的模型；
+# 请求中的其他名称统一记为 OTHER_MODEL，客户端不能制造任意多的时间序列
+MODELS: set[str] = set()
+OTHER_MODEL = "other"
+
+Labels = tuple[str, ...]
+
+
+class Counter:
+    """
+    按标签值累加的计数器，只在事件循环线程中更新，无需加锁
+    """
+
+    type = "counter"
+
+    __slots__ = ("name", "help", "labels", "values")
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[Labels, float] = {}
+        if not labels:
+            self.values[()] = 0
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self) -> typing.Iterator[tuple[str, Labels, tuple[str, ...], float]]:
+        for values, value in self.values.items():
+            yield self.name, self.labels, values, value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    __slots__ = ()
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels: str, value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - value
+
+
+class Histogram:
+    """
+    按标签值分组的直方图，每组使用 profiler.Histogram
+    """
+
+    type = "histogram"
+
+    __slots__ = ("name", "help", "labels", "buckets", "values")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Labels = (),
+        buckets: typing.Sequence[float] = profiler.DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values: dict[Labels, profiler.Histogram] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if (histogram := self.values.get(labels, None)) is None:
+            histogram = self.values[labels] = profiler.Histogram(self.buckets)
+        histogram.observe(value)
+
+    def samples(self) -> typing.Iterator[tuple[str, Labels, tuple[str, ...], float]]:
+        for values, histogram in self.values.items():
+            yield from _histogram_samples(self.name, self.labels, values, histogram)
+
+
+def _histogram_samples(
+    name: str, labels: Labels, values: tuple[str, ...], histogram: profiler.Histogram
+) -> typing.Iterator[tuple[str, Labels, tuple[str, ...], float]]:
+    bucket_labels = (*labels, "le")
+    for le, count in zip(
+        [*(str(x) for x in histogram.buckets), "+Inf"],
+        itertools.accumulate(histogram.counts),
+    ):
+        yield f"{name}_bucket", bucket_labels, (*values, le), count
+    yield f"{name}_sum", labels, values, histogram.sum
+    yield f"{name}_count", labels, values, histogram.count
+
+
+REQUESTS = Counter(
+    "lmproxy_requests_total",
+    "Requests by worker, model, type and status (ok or error class)",
+    ("worker", "model", "type", "status"),
+)
+WORKER_ERRORS = Counter(
+    "lmproxy_worker_errors_total",
+    "Failed worker attempts by error class",
+    ("worker", "model", "error"),
+)
+WORKER_STALLS = Counter(
+    "lmproxy_worker_stalls_total",
+    "Streams aborted by first-chunk or inter-chunk timeouts",
+    ("worker",),
+)
+TTFT = Histogram(
+    "lmproxy_time_to_first_token_seconds",
+    "Time from request to first streamed chunk",
+    ("worker", "model"),
+)
+LATENCY = Histogram(
+    "lmproxy_request_duration_seconds",
+    "Time from request to last chunk or response",
+    ("worker", "model", "type"),
+)
+TOKENS = Counter(
+    "lmproxy_tokens_total",
+    "Tokens reported by upstream usage",
+    ("worker", "model", "kind"),
+)
+TOKENS_PER_SECOND = Histogram(
+    "lmproxy_tokens_per_second",
+    "Completion tokens per second after the first token",
+    ("worker", "model"),
+    (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500, 1000),
+)
+STREAMS = Gauge(
+    "lmproxy_streams_in_flight",
+    "Streaming responses currently being sent",
+)
+KEYS = Gauge(
+    "lmproxy_keys",
+    "Keys in each worker key pool",
+    ("pool",),
+)
+KEYS_IN_USE = Gauge(
+    "lmproxy_keys_in_use",
+    "Keys currently acquired from each worker key pool",
+    ("pool",),
+)
+KEY_WAIT = "lmproxy_key_wait_seconds"
+PROXIES = Gauge(
+    "lmproxy_proxies_available",
+    "Proxies currently available in each proxy pool",
+    ("pool",),
+)
+PROXY_WAIT = "lmproxy_proxy_wait_seconds"
+LOOP_LAG = Histogram(
+    "lmproxy_event_loop_lag_seconds",
+    "Delay of a scheduled wakeup on the event loop",
+    (),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_BLOCKED = Counter(
+    "lmproxy_event_loop_blocked_total",
+    "Event loop stalls over the monitor threshold by innermost lmproxy frame",
+    ("where",),
+)
+STAGES = "lmproxy_stage_seconds"
+CACHE_REQUESTS = "lmproxy_cache_requests_total"
+CACHE_EVICTIONS = "lmproxy_cache_evictions_total"
+CACHE_ENTRIES = "lmproxy_cache_entries"
+CACHE_BYTES = "lmproxy_cache_bytes"
+
+REGISTRY: list[Counter | Histogram] = [
+    REQUESTS,
+    WORKER_ERRORS,
+    WORKER_STALLS,
+    TTFT,
+    LATENCY,
+    TOKENS,
+    TOKENS_PER_SECOND,
+    STREAMS,
+    KEYS,
+    KEYS_IN_USE,
+    PROXIES,
+    LOOP_LAG,
+    LOOP_BLOCKED,
+]
+
+
+def configure(settings: dict[str, typing.Any]) -> None:
+    global ENABLED
+    ENABLED = settings.get("enabled", True)
+
+
+def add_models(models: typing.Iterable[str]) -> None:
+    MODELS.update(models)
+
+
+def _model(ctx: context.Context) -> str:
+    return ctx.model if ctx.model in MODELS else OTHER_MODEL
+
+
+def worker_error(ctx: context.Context, worker: str, exc: BaseException) -> None:
+    if ENABLED:
+        WORKER_ERRORS.inc(worker, _model(ctx), exc.__class__.__name__)
+
+
+def request_finished(
+    ctx: context.Context,
+    elapsed: float,
+    ttft: float | None = None,
+    exc: BaseException | None = None,
+) -> None:
+    """
+    记录一个请求的结果，流式请求在最后一个块发送后调用
+    """
+    if not ENABLED:
+        return
+
+    worker = ctx.metadata.get("worker", "none")
+    model = _model(ctx)
+    if exc is not None:
+        REQUESTS.inc(worker, model, ctx.type, exc.__class__.__name__)
+        return
+
+    REQUESTS.inc(worker, model, ctx.type, "ok")
+    LATENCY.observe(elapsed, worker, model, ctx.type)
+    if ttft is not None:
+        TTFT.observe(ttft, worker, model)
+
+    if usage := ctx.metadata.get("usage", None):
+        prompt = usage.get("prompt_tokens", 0) or 0
+        completion = usage.get("completion_tokens", 0) or 0
+        TOKENS.inc(worker, model, "prompt", value=prompt)
+        TOKENS.inc(worker, model, "completion", value=completion)
+
+        generating = elapsed - (ttft or 0)
+        if completion and generating > 0:
+            TOKENS_PER_SECOND.observe(completion / generating, worker, model)
+
+
+def _collect() -> typing.Iterator[tuple[str, str, str, typing.Iterable]]:
+    """抓取时才读取资源池和代理池的状态，请求路径上不做额外工作"""
+    for manager in list(resources.MANAGERS):
+        KEYS.set(manager.name, value=manager.size)
+        KEYS_IN_USE.set(manager.name, value=manager.in_use)
+    for manager in list(proxies.MANAGERS):
+        PROXIES.set(manager.name, value=manager.available)
+
+    for metric in REGISTRY:
+        yield metric.name, metric.type, metric.help, metric.samples()
+
+    yield KEY_WAIT, "histogram", "Time spent waiting for a key", itertools.chain.from_iterable(
+        _histogram_samples(KEY_WAIT, ("pool",), (x.name,), x.wait)
+        for x in list(resources.MANAGERS)
+    )
+    yield PROXY_WAIT, "histogram", "Time spent waiting for a proxy", itertools.chain.from_iterable(
+        _histogram_samples(PROXY_WAIT, ("pool",), (x.name,), x.wait)
+        for x in list(proxies.MANAGERS)
+    )
+    caches = list(cache.CACHES)
+    yield CACHE_REQUESTS, "counter", "ttl_cache lookups by result (hit, stale, miss, coalesced)", (
+        (CACHE_REQUESTS, ("cache", "result"), (x.name, result), value)
+        for x in caches
+        for result, value in x.counts.items()
+    )
+    yield CACHE_EVICTIONS, "counter", "ttl_cache entries evicted by the size bound", (
+        (CACHE_EVICTIONS, ("cache",), (x.name,), x.evictions) for x in caches
+    )
+    yield CACHE_ENTRIES, "gauge", "ttl_cache entries", (
+        (CACHE_ENTRIES, ("cache",), (x.name,), len(x)) for x in caches
+    )
+    yield CACHE_BYTES, "gauge", "Estimated bytes held by ttl_cache (only with max_bytes)", (
+        (CACHE_BYTES, ("cache",), (x.name,), x.bytes) for x in caches
+    )
+    if profiler.ENABLED:
+        yield STAGES, "histogram", "Time spent in each profiled stage", itertools.chain.from_iterable(
+            _histogram_samples(STAGES, ("stage",), (name,), histogram)
+            for name, histogram in list(profiler.STAGES.items())
+        )
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """Prometheus 文本格式"""
+    lines = []
+    for name, type, help, samples in _collect():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        for sample, labels, values, value in samples:
+            if labels:
+                pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(labels, values))
+                lines.append(f"{sample}{{{pairs}}} {value}")
+            else:
+                lines.append(f"{sample} {value}")
+    lines.append("")
+    return "\n".join(lines)
@@ -2,6 +2,7 @@ import typing
 import logging
 import context
 import loader
+import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -9,9 +10,14 @@ if typing.TYPE_CHECKING:
     import engine
 
 class Middleware:
+    # 是否需要 ctx.metadata["stream_content"] 中累积的流式内容：
+    # True 为完整内容，正整数为只需要末尾的若干字符，False 为不需要
+    stream_content: bool | int = False
+
     def __init__(self, settings: dict[str, typing.Any], engine: "engine.Engine") -> None:
         self.settings = settings
         self.engine = engine
+        self.stream_content = settings.get("stream_content", self.stream_content)
 
     async def process_request(self, ctx: context.Context) -> typing.Literal[False] | None:
         """
@@ -31,6 +37,15 @@ class Middleware:
         """
         ...
 
+    async def process_chunks(
+        self, ctx: context.Context, chunks: list[context.DeltaType]
+    ) -> list[context.DeltaType] | None:
+        """
+        批量处理流式块，覆盖此方法后不再调用 process_chunk
+        返回继续传递的块，None 表示不变
+        """
+        ...
+
     async def process_error(
         self, ctx: context.Context, error: Exception, attempt: int
     ) -> typing.Literal[True] | None:
@@ -46,15 +61,62 @@ class Middleware:
         return f"Middleware({self.settings.get('name', self.__class__.__name__)})"
 
 
+HOOKS = ("process_request", "process_response", "process_chunk", "process_chunks", "process_error")
+
+
+def overrides(middleware: Middleware, hook: str) -> bool:
+    """中间件是否覆盖了基类的空实现"""
+    return getattr(type(middleware), hook) is not getattr(Middleware, hook)
+
+
 class MiddlewareManager:
     def __init__(self, settings: dict[str, typing.Any], engine: "engine.Engine") -> None:
         self.settings = settings
         self.middlewares: list[Middleware] = []
         self._engine = engine
+        # 所有中间件对累积流式内容的需求，含义同 Middleware.stream_content
+        self.stream_content: bool | int = False
+        # 每次调用流式块钩子前累积的块数
+        self.chunk_batch: int = max(1, settings.get("chunk_batch", 1))
+        # 各钩子实际需要调用的方法，跳过未覆盖的空实现
+        self._hooks: dict[str, list[typing.Callable]] = { x: [] for x in HOOKS }
+        # (是否批量, 方法)，按中间件顺序
+        self._chunk_hooks: list[tuple[bool, typing.Callable]] = []
         self._setup_middlewares()
 
     def add_middleware(self, middleware: Middleware) -> None:
         self.middlewares.append(middleware)
+        self._compile()
+
+    def _compile(self) -> None:
+        self._hooks = {
+            hook: [ self._hook(x, hook) for x in self.middlewares if overrides(x, hook) ]
+            for hook in HOOKS
+        }
+
+        self._chunk_hooks = []
+        for middleware in self.middlewares:
+            if overrides(middleware, "process_chunks"):
+                self._chunk_hooks.append((True, self._hook(middleware, "process_chunks")))
+            elif overrides(middleware, "process_chunk"):
+                self._chunk_hooks.append((False, self._hook(middleware, "process_chunk")))
+
+        requires = [ x.stream_content for x in self.middlewares if x.stream_content ]
+        if any(x is True for x in requires):
+            self.stream_content = True
+        else:
+            self.stream_content = max(requires, default=False)
+
+    def _hook(self, middleware: Middleware, hook: str) -> typing.Callable:
+        # 只在启用性能分析时包装，关闭时没有额外开销
+        if profiler.ENABLED:
+            name = middleware.settings.get("name", middleware.__class__.__name__)
+            return profiler.timed(f"middleware.{name}.{hook}", getattr(middleware, hook))
+        return getattr(middleware, hook)
+
+    @property
+    def has_chunk_hooks(self) -> bool:
+        return bool(self._chunk_hooks)
 
     def _setup_middlewares(self) -> None:
         middlewares = []
@@ -73,30 +135,48 @@ class MiddlewareManager:
 
         middlewares.sort(key=lambda x: x[0], reverse=True)
         self.middlewares = [middleware[1] for middleware in middlewares]
+        self._compile()
         logger.info(f"middlewares: {self.middlewares}")
 
     async def process_request(self, ctx: context.Context) -> bool | None:
-        for middleware in self.middlewares:
-            if (await middleware.process_request(ctx)) is False:
+        for hook in self._hooks["process_request"]:
+            if (await hook(ctx)) is False:
                 return False
         return True
 
     async def process_response(self, ctx: context.Context) -> bool | None:
-        for middleware in self.middlewares:
-            if (await middleware.process_response(ctx)) is False:
+        for hook in self._hooks["process_response"]:
+            if (await hook(ctx)) is False:
                 return False
         return True
     
     async def process_chunk(self, ctx: context.Context, chunk: context.DeltaType) -> bool | None:
-        for middleware in self.middlewares:
-            if (await middleware.process_chunk(ctx, chunk)) is False:
-                return False
-        return True
+        return bool(await self.process_chunks(ctx, [chunk]))
+
+    async def process_chunks(
+        self, ctx: context.Context, chunks: list[context.DeltaType]
+    ) -> list[context.DeltaType]:
+        """
+        返回未被阻止的块
+        """
+        for batched, hook in self._chunk_hooks:
+            if batched:
+                if (result := await hook(ctx, chunks)) is not None:
+                    chunks = result
+            else:
+                chunks = [ x for x in chunks if (await hook(ctx, x)) is not False ]
+
+            if not chunks:
+                break
+        return chunks
 
     async def process_error(
         self, ctx: context.Context, error: Exception, attempt: int
-    ) -> bool | None:
-        for middleware in self.middlewares:
-            if await middleware.process_error(ctx, error, attempt):
-                return False
-        return True
+    ) -> bool:
+        """
+        有中间件认领该异常时返回 True，调用方停止重试并抛出
+        """
+        for hook in self._hooks["process_error"]:
+            if await hook(ctx, error, attempt):
+                return True
+        return False
@@ -94,7 +94,7 @@ class InjectMiddleware(middleware.Middleware):
                 messages.insert(order, new_message)
         
         if self.settings.get("debug", False):
-            logger.info(f"Inserted messages: {messages}")
+            logger.info("Inserted messages: %s", messages)
     
     def _to_content_list(self, content: str | list[ContentPart]) -> list[ContentPart]:
         """Helper function to normalize content to a list of ContentParts."""
@@ -9,6 +9,51 @@ import error
 
 logger = logging.getLogger(__name__)
 
+OPEN_TAG, CLOSE_TAG = "<tool_calls>", "</tool_calls>"
+
+
+class ToolCallScanner:
+    """
+    在流式正文中增量查找 <tool_calls>...</tool_calls>
+
+    每个块只检查新内容和上一块末尾不足一个标签长度的字符，不读取累积的完整内容
+    """
+
+    __slots__ = ("_tail", "_parts", "_size")
+
+    def __init__(self) -> None:
+        self._tail = ""
+        # 开始标签之后的内容，None 表示尚未遇到开始标签
+        self._parts: list[str] | None = None
+        self._size = 0
+
+    @property
+    def opened(self) -> bool:
+        return self._parts is not None
+
+    def feed(self, text: str) -> str | None:
+        """
+        返回两个标签之间的内容，尚未遇到结束标签时返回 None
+        """
+        if self._parts is None:
+            text = self._tail + text
+            start = text.find(OPEN_TAG)
+            if start < 0:
+                self._tail = text[-(len(OPEN_TAG) - 1):]
+                return None
+            self._parts, self._tail = [], ""
+            text = text[start + len(OPEN_TAG):]
+
+        scan = self._tail + text
+        end = scan.find(CLOSE_TAG)
+        self._parts.append(text)
+        if end < 0:
+            self._size += len(text)
+            self._tail = scan[-(len(CLOSE_TAG) - 1):]
+            return None
+        return "".join(self._parts)[:self._size - len(self._tail) + end]
+
+
 class ToolCallMiddleware(middleware.Middleware):
     async def process_request(self, ctx: context.Context) -> bool | None:
         if ctx.type != "text":
@@ -19,13 +64,13 @@ class ToolCallMiddleware(middleware.Middleware):
         
         aleady_exists = set([ x["function"]["name"] for x in ctx.body["tools"] ])
         ctx.body["tools"].extend([ x for x in tool.OPENAI_TOOLS if x["function"]["name"] not in aleady_exists ])
-        logger.info(f"tools definetions: {ctx.body['tools']}")
+        logger.debug("tools definetions: %s", ctx.body["tools"])
 
     async def process_response(self, ctx: context.Context) -> bool | None:
         if ctx.type != "text" or ctx.stream:
             return
         
-        if not isinstance(ctx.response, dict) or ctx.response.get("type", None) != "text":
+        if not isinstance(ctx.response, (dict, context.Text)) or ctx.response.get("type", None) != "text":
             return
         
         tool_calls = self.get_tool_calls(ctx)
@@ -46,12 +91,23 @@ class ToolCallMiddleware(middleware.Middleware):
         if ctx.type != "text" or not ctx.stream or chunk["type"] != "text":
             return
         
-        tool_calls = self.get_tool_calls(ctx)
-        if not tool_calls:
-            if "<tool_calls>" in ctx.metadata.get("stream_content", ""):
-                return False
-            return
-        
+        if not (tool_calls := chunk.get("tool_calls", None)):
+            content = chunk.get("content", None)
+            if isinstance(content, list):
+                content = "".join(content)
+
+            scanner : ToolCallScanner | None = ctx.metadata.get("tool_call_scanner", None)
+            if scanner is None:
+                scanner = ctx.metadata["tool_call_scanner"] = ToolCallScanner()
+
+            body = scanner.feed(content) if content else None
+            if body is None:
+                # 工具调用内容不发送给客户端
+                return False if scanner.opened else None
+            tool_calls = json.loads(body)
+        elif isinstance(tool_calls, dict):
+            tool_calls = [tool_calls]
+
         results = await tool.execute_tool_calls(tool_calls, tool.AVAILABLE_FUNCTIONS)
         ctx.body["messages"].extend(results)
         
@@ -63,16 +119,15 @@ class ToolCallMiddleware(middleware.Middleware):
         raise error.TerminationRequest(response)
     
     def get_tool_calls(self, ctx: context.Context) -> list[dict[str, typing.Any]]:
-        tool_calls = ctx.response.get("tool_calls", [])
+        if isinstance(ctx.response, (dict, context.Text)):
+            tool_calls, content = ctx.response.get("tool_calls", None), ctx.response.get("content", None)
+        else:
+            return []
+
         if tool_calls:
             return tool_calls
         
-        content = ctx.response.get("content", "")
-        if match := re.search(r"<tool_calls>([\s\S]*?)</tool_calls>", content):
-            return json.loads(match.group(1))
-        
-        content = ctx.metadata.get("stream_content", "")
-        if match := re.search(r"<tool_calls>([\s\S]*?)</tool_calls>", content):
+        if match := re.search(rf"{OPEN_TAG}([\s\S]*?){CLOSE_TAG}", content or ""):
             return json.loads(match.group(1))
         
         return []
@@ -0,0 +1,139 @@
+import re
+import time
+import bisect
+import typing
+import functools
+import contextlib
+import contextvars
+import context
+
+# 由 configure 根据配置设置，关闭时 span 返回空上下文，中间件钩子也不会被包装
+ENABLED = False
+SERVER_TIMING = False
+
+# 秒
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    """
+    固定桶的直方图，只在事件循环线程中更新，无需加锁
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# 各阶段耗时的进程级直方图
+STAGES: dict[str, Histogram] = {}
+
+
+class Timings:
+    """
+    单个请求各阶段的累计耗时（秒）
+    """
+
+    __slots__ = ("spans",)
+
+    def __init__(self) -> None:
+        self.spans: dict[str, float] = {}
+
+    def add(self, name: str, elapsed: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f"{re.sub(r'[^A-Za-z0-9.!#$%&*+^_`|~-]', '_', name)};dur={elapsed * 1000:.2f}"
+            for name, elapsed in self.spans.items()
+        )
+
+
+# 没有 ctx 的地方（资源池、代理池）通过 contextvar 找到当前请求
+_current: contextvars.ContextVar[Timings | None] = contextvars.ContextVar("timings", default=None)
+
+
+def configure(settings: dict[str, typing.Any]) -> None:
+    global ENABLED, SERVER_TIMING
+    ENABLED = settings.get("enabled", False)
+    SERVER_TIMING = ENABLED and settings.get("server_timing", False)
+
+
+def start(ctx: context.Context) -> Timings | None:
+    """开始记录一个请求，同一个 ctx 重复调用时沿用已有记录"""
+    if not ENABLED:
+        return None
+
+    timings = ctx.metadata.get("timings", None)
+    if timings is None:
+        timings = ctx.metadata["timings"] = Timings()
+    _current.set(timings)
+    return timings
+
+
+class Span:
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str, timings: Timings | None) -> None:
+        self.name = name
+        self.timings = timings
+        self.started = 0.0
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        elapsed = time.perf_counter() - self.started
+        if self.timings is not None:
+            self.timings.add(self.name, elapsed)
+
+        if (histogram := STAGES.get(self.name, None)) is None:
+            histogram = STAGES[self.name] = Histogram()
+        histogram.observe(elapsed)
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name: str, ctx: context.Context | None = None) -> Span | contextlib.nullcontext:
+    """
+    记录一段代码的耗时，提供 ctx 时记录到该请求，否则记录到当前 contextvar 中的请求
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+
+    timings = ctx.metadata.get("timings", None) if ctx is not None else _current.get()
+    return Span(name, timings)
+
+
+def timed(name: str, hook: typing.Callable[..., typing.Awaitable]) -> typing.Callable[..., typing.Awaitable]:
+    """包装第一个参数为 ctx 的异步钩子"""
+
+    @functools.wraps(hook)
+    async def wrapper(ctx: context.Context, *args, **kwargs):
+        with span(name, ctx):
+            return await hook(ctx, *args, **kwargs)
+
+    return wrapper
+
+
+def summary() -> dict[str, dict[str, typing.Any]]:
+    return {
+        name: {
+            "count": histogram.count,
+            "sum": histogram.sum,
+            "buckets": dict(zip([*histogram.buckets, float("inf")], histogram.counts)),
+        }
+        for name, histogram in STAGES.items()
+    }
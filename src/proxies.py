@@ -1,11 +1,18 @@
+import time
 import typing
+import weakref
 import asyncio
 import logging
 import collections
 import loader
+import profiler
 import rnet
 
 
+# 所有存活的代理管理器，供 metrics 抓取时读取状态
+MANAGERS: "weakref.WeakSet[ProxyManager]" = weakref.WeakSet()
+
+
 class ProxyError(Exception):
     """在代理使用中抛出此异常，将导致当前代理被丢弃"""
 
@@ -33,9 +40,19 @@ class ProxyManager:
         repeat: int = 1,  # <--- 新增参数: 每个初始代理的重复次数
         timeout: float = 10.0,
         *args,
+        name: str = "",
+        separator: str = "\n",
+        renew_wait: float = 1.0,
+        max_renew_wait: float = 30.0,
         **kwargs,
     ):
         self.renew_url = url
+        self.name = name or url
+        # 更新地址返回的代理之间的分隔符
+        self._separator = separator
+        # 更新失败或者代理不够分时，再次更新前的等待时间（秒），每次翻倍，最多 max_renew_wait
+        self._renew_wait = renew_wait
+        self._max_renew_wait = max_renew_wait
 
         if repeat < 1:
             raise ValueError("repeat 参数必须大于等于 1")
@@ -45,62 +62,113 @@ class ProxyManager:
         self._available_proxies = collections.deque(effective_initial_pool)
         # -----------------------
 
-        self._condition = asyncio.Condition()
+        # 按先后顺序排队的等待者，归还的代理直接交给其中一个
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
         self._is_renewing = False
         self._timeout = timeout
+        # 获取代理的等待时间
+        self.wait = profiler.Histogram()
+        MANAGERS.add(self)
+
+    @property
+    def available(self) -> int:
+        return len(self._available_proxies)
 
     async def renew(self) -> list[str]:
         if not self.renew_url:
             return []
         
         client = rnet.Client()
-        async with client.get(self.renew_url) as response:
+        async with await client.get(self.renew_url) as response:
             assert isinstance(response, rnet.Response)
             content = await response.text()
-            return content.split(self._separator)
+            return [x.strip() for x in content.split(self._separator) if x.strip()]
 
     async def _get_or_wait_for_proxy(self) -> str:
-        async with self._condition:
-            while True:
-                if self._available_proxies:
-                    proxy = self._available_proxies.popleft()
-                    return proxy
-                if not self._is_renewing:
-                    self._is_renewing = True
-                    asyncio.create_task(self._renew_and_notify())
-                await self._condition.wait()
+        # 归还的代理会先交给等待者，所以池中有代理时一定没有人在排队
+        if self._available_proxies:
+            return self._available_proxies.popleft()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        # 没有更新地址时只能等其他请求归还代理
+        if self.renew_url and not self._is_renewing:
+            self._is_renewing = True
+            asyncio.create_task(self._renew_and_notify())
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # 被取消（包括 acquire 超时）时代理已经交了过来，转交给下一个等待者
+            if future.done() and not future.cancelled():
+                self._put(future.result())
+            raise
+
+    def _put(self, proxy: str):
+        """将代理直接交给最早的等待者，没有等待者时放回池中"""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(proxy)
+                return
+        self._available_proxies.append(proxy)
+
+    def _has_waiters(self) -> bool:
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        return any(not x.done() for x in self._waiters)
 
     async def _renew_and_notify(self):
+        wait = self._renew_wait
         try:
-            new_proxies = await self.renew()
-        except Exception:
-            logging.error("Proxy renew failed", exc_info=True)
-            new_proxies = []
-        
-        async with self._condition:
-            if new_proxies:
-                self._available_proxies.extend(new_proxies)
+            while True:
+                try:
+                    new_proxies = await self.renew()
+                except Exception:
+                    logging.error("Proxy renew failed", exc_info=True)
+                    new_proxies = []
+
+                for proxy in new_proxies:
+                    self._put(proxy)
+
+                # 更新失败或者代理不够分时，仍在排队的等待者需要再次更新，否则要等到超时
+                if not self._has_waiters():
+                    return
+                if new_proxies:
+                    wait = self._renew_wait
+                await asyncio.sleep(wait)
+                wait = min(wait * 2, self._max_renew_wait)
+                if not self._has_waiters():
+                    return
+        finally:
             self._is_renewing = False
-            self._condition.notify_all()
 
     async def _release_proxy(self, proxy: str, discard: bool = False):
-        async with self._condition:
-            if not discard:
-                self._available_proxies.append(proxy)
-            if self._available_proxies:
-                self._condition.notify()
+        if not discard:
+            self._put(proxy)
 
     def __await__(self):
         raise TypeError("必须使用 'async with ProxyManager(...) as proxy'")
 
-    async def __aenter__(self):
+    async def acquire(self, timeout: float | None = None) -> ProxyContext:
+        """
+        获取一个代理，timeout 不会超过管理器配置的超时时间
+        """
+        if timeout is None or (self._timeout is not None and self._timeout < timeout):
+            timeout = self._timeout
+
         try:
-            proxy = await asyncio.wait_for(
-                self._get_or_wait_for_proxy(), timeout=self._timeout
-            )
+            started = time.perf_counter()
+            with profiler.span("proxy.wait"):
+                proxy = await asyncio.wait_for(
+                    self._get_or_wait_for_proxy(), timeout=timeout
+                )
+            self.wait.observe(time.perf_counter() - started)
             return ProxyContext(self, proxy)
         except asyncio.TimeoutError:
-            raise asyncio.TimeoutError(f"获取代理超时，超过 {self._timeout}s")
+            raise asyncio.TimeoutError(f"获取代理超时，超过 {timeout}s")
+
+    async def __aenter__(self):
+        return await self.acquire()
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
@@ -120,6 +188,9 @@ class DummyProxyManager:
         """不执行任何操作，返回空列表"""
         return []
 
+    async def acquire(self, timeout: float | None = None) -> "DummyProxyContext":
+        return DummyProxyContext()
+
     async def __aenter__(self):
         # 返回一个哑上下文对象
         return DummyProxyContext()
@@ -170,7 +241,7 @@ class ProxyFactory:
         if not cls:
             raise ValueError(f"代理管理器 '{name}' 未找到 class '{cls}'")
 
-        self.instance[name] = cls(**manager)
+        self.instance[name] = cls(**{"name": name, **manager})
         return self.instance[name]
 
     def __call__(self, name: str):
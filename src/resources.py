@@ -1,16 +1,28 @@
+import time
+import typing
+import weakref
 import logging
 import asyncio
+import collections
 from typing import List, Any, Optional, AsyncIterator, Type, Tuple
+import profiler
+
+if typing.TYPE_CHECKING:
+    import retry
 
 logger = logging.getLogger(__name__)
 
+# 所有存活的资源管理器，供 metrics 抓取时读取状态
+MANAGERS: "weakref.WeakSet[ResourceManager]" = weakref.WeakSet()
+
 class NoMoreResourceError(Exception):
     ...
 
 class ResourceManager:
     def __init__(self, resources: List[Any], 
                  cooldown_time: float = 0,
-                 default_timeout: Optional[float] = None):
+                 default_timeout: Optional[float] = None,
+                 name: str = ""):
         """
         初始化资源管理器
         
@@ -18,23 +30,38 @@ class ResourceManager:
             resources: 资源列表
             cooldown_time: 资源使用后释放的冷却时间（秒）。默认为0，表示无冷却。
             default_timeout: 默认获取资源的超时时间（秒），None 表示无限等待
+            name: 资源池名称，用于指标
         """
         if not resources:
             raise ValueError("资源列表不能为空")
         self._resources = list(resources)
         self._available = set(range(len(self._resources)))
-        self._condition = asyncio.Condition()
-        self._lock = asyncio.Lock()
+        # 按先后顺序排队的等待者：(future, 已经试过的资源下标)，释放的资源直接交给其中一个
+        self._waiters: collections.deque[Tuple[asyncio.Future, Optional[set]]] = collections.deque()
         self._default_timeout = default_timeout
         self._cooldown_time = cooldown_time
         self._next_index = 0
+        self.name = name or f"pool-{id(self):x}"
+        # 获取资源的等待时间
+        self.wait = profiler.Histogram()
+        MANAGERS.add(self)
+
+    @property
+    def size(self) -> int:
+        return len(self._resources)
+
+    @property
+    def in_use(self) -> int:
+        """已被获取或处于冷却中的资源数"""
+        return len(self._resources) - len(self._available)
 
     async def get_retying(
         self,
         stop: int = 3, 
         wait: float = 1.5, 
         exceptions: List[Type[BaseException]] | tuple[Type[BaseException]] = [ Exception ], 
-        timeout: Optional[float] = None
+        timeout: Optional[float] = None,
+        policy: Optional["retry.RetryPolicy"] = None,
     ) -> AsyncIterator['RetryAttemptContext']:
         """
         获取资源锁，支持对特定异常进行重试。
@@ -46,12 +73,16 @@ class ResourceManager:
             exceptions: 一个异常类型列表。当 `with` 块内抛出这些类型的异常时，才会触发重试。
                         如果抛出其他异常，重试将中止，异常会向外传播。默认为 [Exception]，即对所有标准异常重试。
             timeout: 获取每个资源的超时时间（秒）。None 表示使用默认超时。
+            policy: 请求级的重试策略。提供时由它决定失败后是否换下一个资源（错误分类、时间预算、全局令牌桶），
+                    401/403/429 之类单个 key 的错误总是换下一个资源；次数只受 `stop` 限制，不消耗请求的重试次数。
+                    用指数退避代替固定的 `wait`，等待资源的时间也不会超过请求的剩余时间。
 
         Yields:
             一个内部的异步上下文管理器，用于当前尝试。
 
         Raises:
-            NoMoreResourceError: 如果所有资源都已尝试过，或者在等待新资源时超时，或者所有尝试都因可重试异常而失败。
+            NoMoreResourceError: 如果所有资源都已尝试过，或者在等待新资源时超时，或者所有尝试都因可重试异常而失败，
+                                 或者重试策略拒绝了下一次尝试。
             Any: 如果在 `with` 块内发生了不在 `exceptions` 列表中的异常，该异常将被重新抛出。
 
         Examples:
@@ -75,13 +106,28 @@ class ResourceManager:
         last_exception = None
 
         for attempt_num in range(stop):
-            if attempt_num > 0 and wait > 0:
-                await asyncio.sleep(wait)
+            if attempt_num > 0:
+                if policy is not None:
+                    if not policy.should_rotate(last_exception):
+                        raise NoMoreResourceError(f"Retry aborted after {attempt_num} attempts.") from last_exception
+                    await policy.backoff(wait, attempt_num)
+                elif wait > 0:
+                    await asyncio.sleep(wait)
+
+            acquire_timeout = effective_timeout
+            if policy is not None and (remaining := policy.remaining()) is not None:
+                # 请求已到截止时间，不再等待资源
+                if remaining <= 0:
+                    raise NoMoreResourceError("Deadline exceeded before acquiring a resource.") from last_exception
+                acquire_timeout = remaining if acquire_timeout is None else min(acquire_timeout, remaining)
 
-            resource, index = await self._acquire_new_untried_resource(tried_indices, effective_timeout)
+            started = time.perf_counter()
+            with profiler.span("keys.wait"):
+                resource, index = await self._acquire_new_untried_resource(tried_indices, acquire_timeout)
+            self.wait.observe(time.perf_counter() - started)
             tried_indices.add(index)
             
-            attempt_context = RetryAttemptContext(self, resource, retryable_exceptions_tuple)
+            attempt_context = RetryAttemptContext(self, resource, index, retryable_exceptions_tuple)
             
             yield attempt_context
             
@@ -99,104 +145,96 @@ class ResourceManager:
 
     async def _acquire_new_untried_resource(self, tried_indices: set, timeout: Optional[float]) -> Tuple[Any, int]:
         """内部方法：获取一个尚未尝试过的可用资源"""
-        async with self._lock:
-            while True:
-                # 1. 寻找一个可用的、新的资源
-                n = len(self._resources)
-                start_search = self._next_index
-                found_index = -1
-                for i in range(n):
-                    idx = (start_search + i) % n
-                    if idx in self._available and idx not in tried_indices:
-                        found_index = idx
-                        break
-                
-                if found_index != -1:
-                    # 2. 找到了，获取它
-                    self._available.remove(found_index)
-                    self._next_index = (found_index + 1) % n
-                    return self._resources[found_index], found_index
-
-                # 3. 如果没找到，检查是否所有资源都试过了
-                if len(tried_indices) == len(self._resources):
-                    raise NoMoreResourceError("All available resources have been tried.")
-                    
-                # 4. 如果还有未尝试的资源但它们当前都不可用，则等待
-                async with self._condition:
-                    try:
-                        await asyncio.wait_for(self._condition.wait(), timeout)
-                    except asyncio.TimeoutError:
-                        raise NoMoreResourceError(f"Timed out after {timeout}s waiting for a new resource.") from None
+        index = self._take(tried_indices)
+        if index is None:
+            if len(tried_indices) >= len(self._resources):
+                raise NoMoreResourceError("All available resources have been tried.")
+            index = await self._wait(tried_indices, timeout)
+            if index is None:
+                raise NoMoreResourceError(f"Timed out after {timeout}s waiting for a new resource.")
+        return self._resources[index], index
 
     def get(self, timeout: Optional[float] = None):
         effective_timeout = timeout if timeout is not None else self._default_timeout
         return ResourceLock(self, effective_timeout)
 
-    def _get_resource_round_robin(self) -> Any:
-        if not self._available: return None
+    def _take(self, tried_indices: Optional[set] = None) -> Optional[int]:
+        """轮询取出一个可用且没有试过的资源下标，没有则返回 None"""
+        if not self._available:
+            return None
         n = len(self._resources)
         start_index = self._next_index
         for i in range(n):
             current_index = (start_index + i) % n
-            if current_index in self._available:
+            if current_index in self._available and (not tried_indices or current_index not in tried_indices):
                 self._available.remove(current_index)
                 self._next_index = (current_index + 1) % n
-                return self._resources[current_index]
+                return current_index
         return None
 
-    def _release_resource(self, resource: Any) -> bool:
+    async def _wait(self, tried_indices: Optional[set], timeout: Optional[float]) -> Optional[int]:
+        """排队等待释放的资源被直接交给自己，超时返回 None"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((future, tried_indices))
         try:
-            idx = self._resources.index(resource)
-            if idx not in self._available:
-                self._available.add(idx)
-                return True
-        except ValueError:
-            pass
-        return False
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # 超时的同时资源已经交了过来
+            if future.done() and not future.cancelled():
+                return future.result()
+            return None
+        except asyncio.CancelledError:
+            # 被取消时资源已经交了过来，转交给下一个等待者
+            if future.done() and not future.cancelled():
+                self._release_index(future.result())
+            raise
 
-    async def _acquire_resource(self, timeout: Optional[float] = None) -> Any:
-        async with self._lock:
-            while True:
-                resource = self._get_resource_round_robin()
-                if resource is not None:
-                    return resource
-                async with self._condition:
-                    try:
-                        await asyncio.wait_for(self._condition.wait(), timeout)
-                    except asyncio.TimeoutError:
-                        resource = self._get_resource_round_robin()
-                        return resource
-
-    async def _release_and_notify(self, resource: Any):
+    async def _acquire_resource(self, timeout: Optional[float] = None) -> Optional[int]:
+        # 释放的资源会先交给能用它的等待者，所以仍在可用集合中的资源不会是从排队者手里抢来的
+        index = self._take()
+        if index is not None:
+            return index
+        return await self._wait(None, timeout)
+
+    def _release_index(self, index: int):
+        """
+        将资源直接交给最早的、没有试过它的等待者；没有这样的等待者时放回可用集合。
+        不经过锁，也不会唤醒无关的等待者
+        """
+        waiters = self._waiters
+        while waiters and waiters[0][0].done():
+            waiters.popleft()
+        for i, (future, tried_indices) in enumerate(waiters):
+            if future.done() or (tried_indices and index in tried_indices):
+                continue
+            del waiters[i]
+            future.set_result(index)
+            return
+        self._available.add(index)
+
+    async def _release_and_notify(self, index: int):
         if self._cooldown_time > 0:
-            asyncio.create_task(self._cooldown_and_release(resource))
+            asyncio.get_running_loop().call_later(self._cooldown_time, self._release_index, index)
         else:
-            async with self._lock:
-                if self._release_resource(resource):
-                    async with self._condition:
-                        self._condition.notify(1)
-
-    async def _cooldown_and_release(self, resource: Any):
-        await asyncio.sleep(self._cooldown_time)
-        async with self._lock:
-            if self._release_resource(resource):
-                async with self._condition:
-                    self._condition.notify(1)
+            self._release_index(index)
 
 class ResourceLock:
     def __init__(self, manager: ResourceManager, timeout: Optional[float] = None):
         self._manager = manager
         self._timeout = timeout
-        self._resource = None
+        self._index = None
     async def __aenter__(self):
-        self._resource = await self._manager._acquire_resource(self._timeout)
-        if self._resource is None:
+        started = time.perf_counter()
+        with profiler.span("keys.wait"):
+            self._index = await self._manager._acquire_resource(self._timeout)
+        self._manager.wait.observe(time.perf_counter() - started)
+        if self._index is None:
             raise asyncio.TimeoutError("获取资源超时")
-        return self._resource
+        return self._manager._resources[self._index]
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._resource is not None:
-            await self._manager._release_and_notify(self._resource)
-            self._resource = None
+        if self._index is not None:
+            await self._manager._release_and_notify(self._index)
+            self._index = None
 
 
 class RetryAttemptContext:
@@ -204,9 +242,10 @@ class RetryAttemptContext:
     一个内部上下文管理器，用于处理单次重试。
     它的 __aexit__ 方法包含了决定是否继续重试的关键逻辑。
     """
-    def __init__(self, manager: 'ResourceManager', resource: Any, retryable_exceptions: Tuple[Type[BaseException], ...]):
+    def __init__(self, manager: 'ResourceManager', resource: Any, index: int, retryable_exceptions: Tuple[Type[BaseException], ...]):
         self._manager = manager
         self._resource = resource
+        self._index = index
         self._retryable_exceptions = retryable_exceptions
         
         # 状态标志
@@ -218,8 +257,7 @@ class RetryAttemptContext:
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         # 必须先释放资源，无论成功与否
-        if self._resource is not None:
-            await self._manager._release_and_notify(self._resource)
+        await self._manager._release_and_notify(self._index)
 
         if exc_type is None:
             self.succeeded = True
@@ -1,7 +1,172 @@
+import time
 import typing
+import random
 import asyncio
+import logging
 import context
 import middleware
+import error
+
+logger = logging.getLogger(__name__)
+
+
+class RetryBudget:
+    """
+    进程级的重试令牌桶，限制重试流量占正常流量的比例
+
+    每个新请求存入 ratio 个令牌，每次重试取出 1 个令牌，
+    令牌不足时不再重试，避免上游故障时重试流量成倍放大
+    """
+
+    def __init__(self, ratio: float = 0.1, capacity: float = 10) -> None:
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+
+    def deposit(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class RetryPolicy:
+    """
+    单个请求的重试策略
+
+    engine 重试和 worker 切换消耗请求的重试次数；worker 内切换 key 只受 get_retying 的 stop 限制，
+    不消耗请求的次数，一个不稳定的 worker 不会用完切换到其他 worker 的机会。三者共用同一份时间预算
+    """
+
+    def __init__(
+        self,
+        settings: dict[str, typing.Any],
+        budget: RetryBudget,
+        ctx: context.Context,
+    ) -> None:
+        self.settings = settings
+        self.budget = budget
+        self.context = ctx
+        self.max_retries: int = settings.get("max_retries", 6)
+        self.timeout: float = settings.get("timeout", 0)
+        self.max_wait_time: float = settings.get("max_wait_time", 30)
+        self.jitter: float = settings.get("jitter", 0.5)
+        # 5xx 总是可重试，4xx 只重试这里列出的状态码
+        self.retry_status: set[int] = set(settings.get("retry_status", [429]))
+        # 单个 key 的错误（失效、无权限、限流），换一个 key 或 worker 可能成功，但整个请求重试没有意义
+        self.rotate_status: set[int] = set(settings.get("rotate_status", [401, 403, 429]))
+        self.retries = 0
+        self.rotations = 0
+        self.started = time.monotonic()
+        self.error: Exception | None = None
+
+    def remaining(self) -> float | None:
+        """剩余的时间预算（秒），同时受请求截止时间限制，None 表示不限"""
+        remaining = self.context.remaining()
+        if self.timeout:
+            budget = self.timeout - (time.monotonic() - self.started)
+            remaining = budget if remaining is None else min(remaining, budget)
+        return remaining
+
+    @staticmethod
+    def status(exc: BaseException | None) -> int | None:
+        """沿着异常链找到上游返回的状态码，没有时返回 None"""
+        seen = set()
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            if isinstance(exc, error.UpstreamStatusError):
+                return exc.status
+            exc = exc.__cause__
+        return None
+
+    def retryable(self, exc: BaseException | None) -> bool:
+        """沿着异常链判断错误是否值得重试"""
+        seen = set()
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            if isinstance(exc, error.UpstreamStatusError):
+                return exc.status >= 500 or exc.status in self.retry_status
+            if isinstance(exc, (error.TerminationRequest, error.WorkerUnsupportedError, error.DeadlineExceededError)):
+                return False
+            exc = exc.__cause__
+        return True
+
+    def should_rotate(self, exc: Exception | None) -> bool:
+        """
+        worker 内是否换下一个 key 重试，次数由调用者限制，不消耗请求的重试次数。
+        rotate_status 中的状态码只说明这个 key 不可用，不检查是否可重试，也不消耗重试令牌
+        """
+        self.error = exc
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            logger.info(f"{self.context.task_id} retry time budget exhausted")
+            return False
+
+        if self.status(exc) not in self.rotate_status:
+            if not self.retryable(exc):
+                logger.debug(f"{self.context.task_id} not retryable: {exc}")
+                return False
+            if not self.budget.withdraw():
+                logger.warning(f"{self.context.task_id} global retry budget exhausted")
+                return False
+
+        self.rotations += 1
+        return True
+
+    def should_retry(self, exc: Exception, failover: bool = False) -> bool:
+        """
+        判断是否允许再次尝试，允许时会消耗一次重试次数和一个重试令牌。
+        failover 为 True 时表示切换到其他 worker，rotate_status 中的状态码（例如 key 全部失效）也允许切换
+        """
+        self.error = exc
+        if not self.retryable(exc) and not (failover and self.status(exc) in self.rotate_status):
+            logger.debug(f"{self.context.task_id} not retryable: {exc}")
+            return False
+
+        if self.max_retries and self.retries >= self.max_retries:
+            logger.info(f"{self.context.task_id} retry limit {self.max_retries} reached")
+            return False
+
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            logger.info(f"{self.context.task_id} retry time budget exhausted")
+            return False
+
+        if not self.budget.withdraw():
+            logger.warning(f"{self.context.task_id} global retry budget exhausted")
+            return False
+
+        self.retries += 1
+        return True
+
+    def delay(self, base: float, attempt: int | None = None) -> float:
+        """指数退避加随机抖动，不超过剩余时间预算；attempt 默认为请求已经重试的次数"""
+        if base <= 0:
+            return 0
+
+        if attempt is None:
+            attempt = self.retries
+        delay = min(self.max_wait_time, base * 2 ** max(attempt - 1, 0))
+        delay *= 1 - self.jitter * random.random()
+
+        remaining = self.remaining()
+        if remaining is not None:
+            delay = min(delay, max(remaining, 0))
+        return delay
+
+    async def backoff(self, base: float, attempt: int | None = None) -> None:
+        if delay := self.delay(base, attempt):
+            await asyncio.sleep(delay)
+
+
+def get_policy(ctx: context.Context | None) -> RetryPolicy | None:
+    if ctx is None:
+        return None
+    return ctx.metadata.get("retry", None)
 
 
 class AttemptManager:
@@ -37,7 +202,7 @@ class AttemptManager:
             return False  # 不重试，抛出异常
 
         # 否则继续下一次迭代（重试）
-        await asyncio.sleep(self.retrying.settings.get("wait_time", 0))
+        await self.retrying.policy.backoff(self.retrying.settings.get("wait_time", 0))
         return True  # 吞掉异常，继续循环
 
     @property
@@ -55,10 +220,12 @@ class Retrying:
         settings: dict[str, typing.Any],
         middleware: middleware.MiddlewareManager,
         ctx: context.Context,
+        budget: RetryBudget,
     ) -> None:
         self.settings = settings
         self.middleware = middleware
         self.context = ctx
+        self.policy = ctx.metadata["retry"] = RetryPolicy(settings, budget, ctx)
         self._done = False
         self._attempt_number = 0
         self.error: Exception | None = None
@@ -75,8 +242,10 @@ class Retrying:
         self._attempt_number += 1
         return AttemptManager(self, self._attempt_number)
 
-    async def retry_if(self, _: Exception):
-        return self._attempt_number < self.settings.get("max_attempts", 3)
+    async def retry_if(self, exc: Exception):
+        if self._attempt_number >= self.settings.get("max_attempts", 3):
+            return False
+        return self.policy.should_retry(exc)
 
 
 class RetryFactory:
@@ -85,9 +254,11 @@ class RetryFactory:
     ) -> None:
         self.settings = settings
         self.middleware = middleware
+        self.budget = RetryBudget(**settings.get("budget", {}))
 
     def create(self, ctx: context.Context) -> Retrying:
-        return Retrying(self.settings, self.middleware, ctx)
+        self.budget.deposit()
+        return Retrying(self.settings, self.middleware, ctx, self.budget)
 
     def __call__(self, ctx: context.Context) -> Retrying:
         return self.create(ctx)
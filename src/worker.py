@@ -1,3 +1,4 @@
+import math
 import typing
 import inspect
 import asyncio
@@ -8,6 +9,12 @@ import context
 import loader
 import error
 import cache
+import cassette
+import retry
+import drain
+import faults
+import metrics
+import profiler
 import proxies
 import http_client
 import rnet
@@ -26,6 +33,13 @@ class Worker:
         self.aliases: dict[str, str] = settings.get("aliases", {})
         self.client_args: http_client.ClientOptions = {}
         self.name : str = settings.get("name", self.__class__.__name__)
+        self.priority : int = settings.get("priority", 100)
+        # 首块超时和块间停顿的次数，同优先级下停顿越多越靠后
+        self.stalls : int = 0
+        # 录制或回放上游流量，未设置时为 None
+        self.cassette = cassette.create(settings.get("cassette", None))
+        # 故障注入，未设置时为 None
+        self.faults = faults.create(settings.get("faults", None))
 
         # 初始列表总是允许
         self._initial_available_models = set(self.available_models)
@@ -62,21 +76,46 @@ class Worker:
     async def _client_created(self, client: rnet.Client):
         ...
 
+    async def _raise_for_status(self, response: rnet.Response, url: str = "") -> None:
+        if not response.ok:
+            raise error.UpstreamStatusError(
+                error.status_code(response.status),
+                f"ERROR: {response.status} {await response.text()} of {url}",
+            )
+
     @contextlib.asynccontextmanager
-    async def client(self) -> typing.AsyncGenerator[rnet.Client, None]:
-        async with self.proxies as proxies:
-            async with proxies as proxy:
-                args = dict(
-                    proxies=[rnet.Proxy.all(proxy)] if proxy else None,
-                    impersonate=rnet.Impersonate.Firefox139,
-                    cookie_store=True,
-                    allow_redirects=True,
-                    max_redirects=9,
-                )
-                args.update(self.client_args)
-                client = rnet.Client(**args)
-                await self._client_created(client)
-                yield client
+    async def client(self, ctx: context.Context | None = None) -> typing.AsyncGenerator[rnet.Client, None]:
+        """
+        创建 rnet 客户端，提供 ctx 时代理等待和请求超时都不会超过请求的截止时间
+        """
+        remaining = ctx.remaining() if ctx is not None else None
+        if remaining is not None and remaining <= 0:
+            raise error.DeadlineExceededError(f"Deadline exceeded for {ctx.task_id}")
+
+        async with await self.proxies.acquire(remaining) as proxy:
+            args = dict(
+                proxies=[rnet.Proxy.all(proxy)] if proxy else None,
+                impersonate=rnet.Impersonate.Firefox139,
+                cookie_store=True,
+                allow_redirects=True,
+                max_redirects=9,
+            )
+            args.update(self.client_args)
+
+            if ctx is not None and (remaining := ctx.remaining()) is not None:
+                if remaining <= 0:
+                    raise error.DeadlineExceededError(f"Deadline exceeded for {ctx.task_id}")
+                timeout = max(1, math.ceil(remaining))
+                args["timeout"] = min(args["timeout"], timeout) if args.get("timeout") else timeout
+
+            client = rnet.Client(**args)
+            if self.cassette is not None:
+                client = self.cassette.wrap(client)
+            # 故障在录制和回放之外注入，录制的总是上游的真实响应
+            if self.faults is not None:
+                client = self.faults.wrap(client)
+            await self._client_created(client)
+            yield client
     
     def __str__(self):
         return f"Worker({self.name})"
@@ -111,27 +150,82 @@ class WorkerManager:
 
         workers.sort(key=lambda x: x[0], reverse=True)
         self.workers = [worker[1] for worker in workers]
+        metrics.add_models(itertools.chain.from_iterable(x.available_models for x in self.workers))
         logger.info(f"workers: {self.workers}")
 
-    @cache.ttl_cache(300)
+    def _ordered_workers(self, start_after: str | None = None) -> list[Worker]:
+        # 稳定排序，只在相同优先级内按停顿次数调整顺序
+        workers = sorted(self.workers, key=lambda x: (-x.priority, x.stalls))
+        # 从指定 worker 的下一个开始，它自己排在最后
+        for i, worker in enumerate(workers):
+            if worker.name == start_after:
+                return workers[i + 1:] + workers[:i + 1]
+        return workers
+
+    def _stream_timeouts(self, worker: Worker, ctx: context.Context) -> tuple[float | None, float | None]:
+        """
+        返回 (首块超时, 块间超时)，模型配置优先于 worker 配置，最后是全局默认值
+        """
+        model = self.settings.get("stream_timeouts", {}).get(ctx.model, {})
+        first_chunk = model.get(
+            "first_chunk",
+            worker.settings.get("first_chunk_timeout", self.settings.get("first_chunk_timeout", None)),
+        )
+        chunk = model.get(
+            "chunk",
+            worker.settings.get("chunk_timeout", self.settings.get("chunk_timeout", None)),
+        )
+        return first_chunk or None, chunk or None
+
+    def _failover(self, ctx: context.Context) -> bool:
+        """
+        上一个 worker 失败后是否允许切换到下一个 worker，由请求的重试策略和截止时间决定
+
+        只对支持该模型的 worker 调用，跳过的 worker 不消耗重试次数和预算
+        """
+        if ctx.expired:
+            logger.info(f"{ctx.task_id} deadline exceeded, stop failover")
+            return False
+
+        exc = ctx.metadata.get("worker_error", None)
+        if exc is None:
+            return True
+
+        policy = retry.get_policy(ctx)
+        if policy is not None and not policy.should_retry(exc, failover=True):
+            return False
+
+        del ctx.metadata["worker_error"]
+        return True
+
+    @cache.ttl_cache(300, stale=3600)
     async def models(self) -> list[str]:
         models = await asyncio.gather(*[ x.models() for x in self.workers ])
-        [
-            (x.available_models.clear(), x.available_models.extend(models[i]))
-            for i, x in enumerate(self.workers)
-        ]
+        # Worker.models() 可能直接返回 available_models 本身，不能先 clear
+        for i, x in enumerate(self.workers):
+            x.available_models[:] = models[i]
         avaliable_models = sorted(set(itertools.chain.from_iterable(models)), key=lambda x: x.lower())
+        metrics.add_models(avaliable_models)
         logger.info(f"available models: { { x.name: x.available_models for x in self.workers } }")
         return avaliable_models
 
-    async def generate_text(self, ctx: context.Context) -> context.Text:
+    async def generate_text(self, ctx: context.Context, start_after: str | None = None) -> context.Text:
+        """
+        Args:
+            start_after: 从这个 worker 的下一个开始尝试，续写时跳过刚刚失败的 worker
+        """
         # 必须使用函数，否则会发生错误
         async def generate():
-            for worker in self.workers:
-                with error.worker_handler(ctx, logger, worker):
+            ctx.metadata.pop("worker_error", None)
+            for worker in self._ordered_workers(start_after):
+                with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                     if not await worker.supports_model(ctx.model, "text"):
                         continue
 
+                    # 先跳过不支持该模型的 worker，它们不消耗重试次数和预算
+                    if not self._failover(ctx):
+                        break
+
                     logger.debug(f"worker: {worker}, model: {ctx.model}, type: text")
                     result = await worker.generate_text(ctx)
 
@@ -139,76 +233,138 @@ class WorkerManager:
                     if not inspect.isasyncgen(result):
                         ctx.metadata["worker"] = worker.name
                         return result
-                    
-                    # 等待第一个结果或者异常
-                    first_chunk = await anext(result, None)  # noqa: F821
-
-                    # 流式开始时未发生异常
-                    async def continue_generate():
-                        if first_chunk is not None:
-                            yield first_chunk
-
-                            # 因为已经发送了第一个块，所以之后的异常由外部处理
-                            async for chunk in result:
-                                yield chunk
-                    
+
+                    first_chunk_timeout, chunk_timeout = self._stream_timeouts(worker, ctx)
+
+                    # 等待第一个结果或者异常，超时则切换到下一个 worker
+                    try:
+                        first_chunk = await asyncio.wait_for(anext(result, None), first_chunk_timeout)  # noqa: F821
+                    except asyncio.TimeoutError:
+                        await self._stalled(worker, result)
+                        raise error.WorkerStalledError(f"no first chunk in {first_chunk_timeout}s") from None
+
+                    worker.stalls = max(0, worker.stalls - 1)
                     ctx.metadata["worker"] = worker.name
-                    return continue_generate()
+                    stream = self._continue_stream(worker, result, first_chunk, chunk_timeout)
+
+                    # 上游读取与客户端读取解耦，上游结束后立即释放 key 和代理
+                    settings = worker.settings.get("drain", self.settings.get("drain", {}))
+                    if settings.get("enabled", False):
+                        return drain.DrainBuffer(
+                            stream,
+                            settings.get("max_memory", 8 * 1024 * 1024),
+                            settings.get("max_size", 256 * 1024 * 1024),
+                        ).stream()
+
+                    return stream
 
-            raise error.WorkerError(f"No avaliable workers for {ctx.model}")
+            raise error.WorkerError(f"No avaliable workers for {ctx.model}") from ctx.metadata.pop("worker_error", None)
         
         return await generate()
 
+    async def _continue_stream(
+        self,
+        worker: Worker,
+        result: typing.AsyncGenerator[context.DeltaType, None],
+        first_chunk: context.DeltaType | None,
+        chunk_timeout: float | None,
+    ) -> typing.AsyncGenerator[context.DeltaType, None]:
+        # 流式开始时未发生异常
+        if first_chunk is None:
+            return
+
+        yield first_chunk
+
+        # 因为已经发送了第一个块，所以之后的异常由外部处理
+        while True:
+            try:
+                chunk = await asyncio.wait_for(anext(result), chunk_timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                # 中止上游以释放 key 和代理
+                await self._stalled(worker, result)
+                raise error.WorkerStalledError(f"{worker} no chunk in {chunk_timeout}s") from None
+
+            yield chunk
+
+    async def _stalled(self, worker: Worker, result: typing.AsyncGenerator[context.DeltaType, None]) -> None:
+        worker.stalls += 1
+        metrics.WORKER_STALLS.inc(worker.name)
+        logger.warning(f"{worker} stalled, total stalls: {worker.stalls}")
+        with contextlib.suppress(Exception):
+            await result.aclose()
+
     async def generate_image(self, ctx: context.Context) -> context.Image:
+        ctx.metadata.pop("worker_error", None)
         for worker in self.workers:
-            with error.worker_handler(ctx, logger, worker):
+            with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                 if not await worker.supports_model(ctx.model, "text"):
                     continue
+
+                if not self._failover(ctx):
+                    break
                 
                 logger.debug(f"model: {ctx.model}, worker: {worker}, type: image")
                 return await worker.generate_image(ctx)
 
-        raise error.WorkerError("No avaliable workers")
+        raise error.WorkerError("No avaliable workers") from ctx.metadata.pop("worker_error", None)
 
     async def generate_audio(self, ctx: context.Context) -> context.Audio:
+        ctx.metadata.pop("worker_error", None)
         for worker in self.workers:
-            with error.worker_handler(ctx, logger, worker):
+            with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                 if not await worker.supports_model(ctx.model, "text"):
                     continue
 
+                if not self._failover(ctx):
+                    break
+
                 logger.debug(f"model: {ctx.model}, worker: {worker}, type: audio")
                 return await worker.generate_audio(ctx)
 
-        raise error.WorkerError("No avaliable workers")
+        raise error.WorkerError("No avaliable workers") from ctx.metadata.pop("worker_error", None)
 
     async def generate_embedding(self, ctx: context.Context) -> context.Embedding:
+        ctx.metadata.pop("worker_error", None)
         for worker in self.workers:
-            with error.worker_handler(ctx, logger, worker):
+            with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                 if not await worker.supports_model(ctx.model, "text"):
                     continue
 
+                if not self._failover(ctx):
+                    break
+
                 logger.debug(f"model: {ctx.model}, worker: {worker}, type: embedding")
                 return await worker.generate_embedding(ctx)
 
-        raise error.WorkerError("No avaliable workers")
+        raise error.WorkerError("No avaliable workers") from ctx.metadata.pop("worker_error", None)
 
     async def generate_video(self, ctx: context.Context) -> context.Video:
+        ctx.metadata.pop("worker_error", None)
         for worker in self.workers:
-            with error.worker_handler(ctx, logger, worker):
+            with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                 if not await worker.supports_model(ctx.model, "text"):
                     continue
 
+                if not self._failover(ctx):
+                    break
+
                 logger.debug(f"model: {ctx.model}, worker: {worker}, type: video")
                 return await worker.generate_video(ctx)
 
-        raise error.WorkerError("No avaliable workers")
+        raise error.WorkerError("No avaliable workers") from ctx.metadata.pop("worker_error", None)
 
     async def count_tokens(self, ctx: context.Context) -> context.CountTokens:
+        ctx.metadata.pop("worker_error", None)
         for worker in self.workers:
-            with error.worker_handler(ctx, logger, worker):
+            with error.worker_handler(ctx, logger, worker), profiler.span(f"worker.{worker.name}", ctx):
                 if not await worker.supports_model(ctx.model, "text"):
                     continue
 
+                if not self._failover(ctx):
+                    break
+
                 logger.debug(f"model: {ctx.model}, worker: {worker}, type: count_tokens")
                 return await worker.count_tokens(ctx)
 
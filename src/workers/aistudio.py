@@ -10,6 +10,8 @@ import proxies
 import context
 import error
 import resources
+import retry
+import jsonbody
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,7 @@ RETRY_EXCEPTIONS = [
     rnet.exceptions.UpgradeError,
     rnet.exceptions.DNSResolverError,
     AssertionError,
+    error.UpstreamStatusError,
 ]
 
 class AiStudioWorker(worker.Worker):
@@ -29,23 +32,25 @@ class AiStudioWorker(worker.Worker):
         self._filters : list[re.Pattern] = [ re.compile(f)  for f in settings.get("filters", []) ]
         self.max_retries = settings.get("max_retries", 3)
         self.wait_time = settings.get("wait_time", 3)
+        self.headers: dict[str, str] = settings.get("headers", {})
 
         self.api_keys = settings.get("api_keys", [])
         key = settings.get("api_key")
         if key is not None:
             self.api_keys.append(key)
         self._resources = resources.ResourceManager(
-            self.api_keys, **settings.get("key_manager", {})
+            self.api_keys, **{"name": self.name, **settings.get("key_manager", {})}
         )
 
+        self.base_url: str = settings.get("base_url", "https://generativelanguage.googleapis.com").rstrip("/")
         self.models_url: str = settings.get(
-            "models_url", "https://generativelanguage.googleapis.com/v1beta/models?key={key}"
+            "models_url", f"{self.base_url}/v1beta/models?key={{key}}"
         )
         self.completions_url: str = settings.get(
-            "completions_url", "https://generativelanguage.googleapis.com/v1beta/{model}:{method}?key={key}"
+            "completions_url", f"{self.base_url}/v1beta/{{model}}:{{method}}?key={{key}}"
         )
         self.embedding_url: str = settings.get(
-            "embedding_url", "https://generativelanguage.googleapis.com/v1beta/{model}:embedContent?key={key}"
+            "embedding_url", f"{self.base_url}/v1beta/{{model}}:embedContent?key={{key}}"
         )
     
     async def models(self) -> list[str]:
@@ -96,29 +101,29 @@ class AiStudioWorker(worker.Worker):
     
     async def streaming(self, ctx: context.Context) -> context.Text:
         async def generate() -> typing.AsyncGenerator[str, None]:
+            body = await self.convert_to_gemini(ctx.payload(self.settings))
+            template = await self._prepare_payload(body, True, ctx)
             async for attempt in self._resources.get_retying(
                 self.max_retries, 
                 self.wait_time, 
-                RETRY_EXCEPTIONS
+                RETRY_EXCEPTIONS,
+                policy=retry.get_policy(ctx),
             ):
                 try:
                     async with attempt as api_key:
                         if api_key is None:
                             raise error.WorkerOverloadError("No API keys available")
                         
-                        headers = self.headers.copy()
+                        headers = jsonbody.headers(self.headers)
                         url = self.completions_url.format(model=ctx.model, method="streamGenerateContent", key=api_key)
-                        body = self.convert_to_gemini(ctx.payload(self.settings))
-                        await self._prepare_payload(headers, body, api_key, True, ctx)
+                        body = await self._prepare_request(headers, template, api_key, ctx)
 
-                        async with self.client() as client:
+                        async with self.client(ctx) as client:
                             async with await client.post(
-                                url, json=body, headers=headers
+                                url, body=body, headers=headers
                             ) as response:
                                 assert isinstance(response, rnet.Response)
-                                assert response.ok, (
-                                    f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                                )
+                                await self._raise_for_status(response, self.completions_url)
 
                                 async with response.stream() as streamer:
                                     assert isinstance(streamer, rnet.Streamer)
@@ -154,29 +159,29 @@ class AiStudioWorker(worker.Worker):
         return generate()
 
     async def no_streaming(self, ctx: context.Context) -> context.Text:
+        body = await self.convert_to_gemini(ctx.payload(self.settings))
+        template = await self._prepare_payload(body, False, ctx)
         async for attempt in self._resources.get_retying(
             self.max_retries, 
             self.wait_time, 
-            RETRY_EXCEPTIONS
+            RETRY_EXCEPTIONS,
+            policy=retry.get_policy(ctx),
         ):
             try:
                 async with attempt as api_key:
                     if api_key is None:
                         raise error.WorkerOverloadError("No API keys available")
 
-                    headers = self.headers.copy()
+                    headers = jsonbody.headers(self.headers)
                     url = self.completions_url.format(model=ctx.model, method="generateContent", key=api_key)
-                    body = self.convert_to_gemini(ctx.payload(self.settings))
-                    await self._prepare_payload(headers, body, api_key, False, ctx)
+                    body = await self._prepare_request(headers, template, api_key, ctx)
 
-                    async with self.client() as client:
+                    async with self.client(ctx) as client:
                         async with await client.post(
-                            url, json=body, headers=headers
+                            url, body=body, headers=headers
                         ) as response:
                             assert isinstance(response, rnet.Response)
-                            assert response.ok, (
-                                f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                            )
+                            await self._raise_for_status(response, self.completions_url)
 
                             data = await response.json()
                             return await self._parse_response(data, ctx)
@@ -196,31 +201,34 @@ class AiStudioWorker(worker.Worker):
         yield task.result()
 
     async def to_no_streaming(self, response: typing.AsyncGenerator[context.Text, None]) -> context.Text:
-        content = context.Text(type="text", content="", reasoning_content="", tool_calls=[])
+        accumulator = context.TextAccumulator()
         async for chunk in response:
-            if delta := chunk.get("content", None):
-                content["content"] += delta
-            if delta := chunk.get("reasoning_content", None):
-                content["reasoning_content"] += delta
-            if delta := chunk.get("tool_calls", None):
-                content["tool_calls"].extend(delta)
-
-        content.update({
-            "content": content["content"] if content["content"] else None,
-            "reasoning_content": content["reasoning_content"] if content["reasoning_content"] else None,
-            "tool_calls": content["tool_calls"] if content["tool_calls"] else None,
-        })
-        return content
+            accumulator.add(chunk)
+
+        return accumulator.to_text()
 
     async def _prepare_payload(
         self,
-        headers: dict[str, str],
         body: dict[str, typing.Any],
-        api_key: str,
         streaming: bool | None,
         ctx: context.Context,
-    ) -> None:
-        ...
+    ) -> jsonbody.Template:
+        """
+        每个请求调用一次，编码后的请求体在每次尝试中复用
+        """
+        return jsonbody.Template(body)
+
+    async def _prepare_request(
+        self,
+        headers: dict[str, str],
+        template: jsonbody.Template,
+        api_key: str,
+        ctx: context.Context,
+    ) -> bytes:
+        """
+        每次尝试调用，key 在 URL 中，这里只需返回请求体
+        """
+        return template.render()
 
     async def _parse_response(self, data: "GenerateContentResponse", ctx: context.Context) -> context.Text:
         def iter_text():
@@ -296,20 +304,20 @@ class AiStudioWorker(worker.Worker):
                 {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "OFF"},
             ],
             "generationConfig": {
-                "candidateCount": payload["n"] or 1,
-                "maxOutputTokens": payload["max_tokens"],
-                "temperature": payload["temperature"],
-                "topP": payload["top_p"],
-                "topK": payload["top_k"],
-                "frequencyPenalty": payload["frequency_penalty"],
-                "presencePenalty": payload["presence_penalty"],
-                "responseLogprobs": payload["logprobs"],
-                "logprobs": payload["top_logprobs"],
+                "candidateCount": payload.get("n") or 1,
+                "maxOutputTokens": payload.get("max_tokens"),
+                "temperature": payload.get("temperature"),
+                "topP": payload.get("top_p"),
+                "topK": payload.get("top_k"),
+                "frequencyPenalty": payload.get("frequency_penalty"),
+                "presencePenalty": payload.get("presence_penalty"),
+                "responseLogprobs": payload.get("logprobs"),
+                "logprobs": payload.get("top_logprobs"),
                 "thinkingConfig": {
                     "includeThoughts": True,
                     "thinkingBudget": thinkingBudget,
                 },
-                "seed": payload["seed"],
+                "seed": payload.get("seed"),
             },
             "contents": contents,
         }
@@ -322,10 +330,15 @@ class AiStudioWorker(worker.Worker):
         return None
     
     async def generate_embedding(self, ctx: context.Context) -> context.Embedding:
+        body = jsonbody.dumps({
+            "content": [ { "parts": [{ "text": ctx.body["input"] }] if isinstance(ctx.body["input"], str) else [ { "text": s } for s in ctx.body["input"] ] } ],
+            "outputDimensionality": ctx.body.get("dimensions")
+        })
         async for attempt in self._resources.get_retying(
             self.max_retries, 
             self.wait_time, 
-            RETRY_EXCEPTIONS
+            RETRY_EXCEPTIONS,
+            policy=retry.get_policy(ctx),
         ):
             try:
                 async with attempt as api_key:
@@ -333,20 +346,14 @@ class AiStudioWorker(worker.Worker):
                         raise error.WorkerOverloadError("No API keys available")
 
                     url = self.embedding_url.format(key=api_key, model=ctx.model)
-                    headers = self.headers.copy()
-                    body = {
-                        "content": [ { "parts": [{ "text": ctx.body["input"] }] if isinstance(ctx.body["input"], str) else [ { "text": s } for s in ctx.body["input"] ] } ],
-                        "outputDimensionality": ctx.body.get("dimensions")
-                    }
+                    headers = jsonbody.headers(self.headers)
 
-                    async with self.client() as client:
+                    async with self.client(ctx) as client:
                         async with await client.post(
-                            url, json=body, headers=headers
+                            url, body=body, headers=headers
                         ) as response:
                             assert isinstance(response, rnet.Response)
-                            assert response.ok, (
-                                f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                            )
+                            await self._raise_for_status(response, self.embedding_url)
 
                             data = await response.json()
                             return { "type": "embedding", "content": data["values"] }
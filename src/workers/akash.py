@@ -15,25 +15,26 @@ class AkashWorker(worker.Worker):
         self, settings: dict[str, typing.Any], proxies: proxies.ProxyFactory
     ) -> None:
         super().__init__(settings, proxies)
+        self.base_url: str = settings.get("base_url", "https://chat.akash.network").rstrip("/")
         self.headers = {
-            "referer": "https://chat.akash.network/",
+            "referer": f"{self.base_url}/",
         }
         self.api_keys = settings.get("api_keys", [])
         key = settings.get("api_key")
         if key is not None:
             self.api_keys.append(key)
         self._resources = resources.ResourceManager(
-            self.api_keys, **settings.get("key_manager", {})
+            self.api_keys, **{"name": self.name, **settings.get("key_manager", {})}
         )
 
     async def _client_created(self, client: rnet.Client) -> bool:
         async with self._resources.get() as session:
             if session:
-                client.set_cookie("https://chat.akash.network/", rnet.Cookie(name="appSession", value=session))
+                client.set_cookie(f"{self.base_url}/", rnet.Cookie(name="appSession", value=session))
                 print(f"Use session cookie: {session[:len(session) // 9]}...")
 
             async with await client.get(
-                "https://chat.akash.network/api/auth/session/", headers=self.headers
+                f"{self.base_url}/api/auth/session/", headers=self.headers
             ) as response:
                 assert isinstance(response, rnet.Response)
                 assert response.ok, f"ERROR: {response.status} {await response.text()}"
@@ -46,7 +47,7 @@ class AkashWorker(worker.Worker):
 
         async with self.client() as client:
             async with await client.get(
-                "https://chat.akash.network/api/models/", headers=self.headers
+                f"{self.base_url}/api/models/", headers=self.headers
             ) as response:
                 assert isinstance(response, rnet.Response)
                 assert response.ok, f"ERROR: {response.status} {await response.text()}"
@@ -65,9 +66,9 @@ class AkashWorker(worker.Worker):
 
     async def generate_text(self, ctx: context.Context) -> context.Text:
         async def generate():
-            async with self.client() as client:
+            async with self.client(ctx) as client:
                 async with await client.post(
-                    "https://chat.akash.network/api/chat/",
+                    f"{self.base_url}/api/chat/",
                     json=ctx.payload(self.settings),
                     headers=self.headers,
                 ) as response:
@@ -120,19 +121,11 @@ class AkashWorker(worker.Worker):
         if ctx.body.get("stream", False):
             return generate()
 
-        data = context.Text(type="text", content="", reasoning_content="", tool_calls=None)
+        accumulator = context.TextAccumulator()
         async for chunk in generate():
-            if delta := chunk.get("content", None):
-                data["content"] += delta
-            if delta := chunk.get("reasoning_content", None):
-                data["reasoning_content"] += delta
-        
-        data.update({
-            "content": data["content"] if data["content"] else None,
-            "reasoning_content": data["reasoning_content"] if data["reasoning_content"] else None,
-        })
-
-        return data
+            accumulator.add(chunk)
+
+        return accumulator.to_text()
 
     async def generate_image(self, ctx: context.Context) -> context.Image:
         payload = {
@@ -149,11 +142,11 @@ Negative prompt: {ctx.body.get("negative_prompt", "")}
             ],
         }
 
-        async with self.client() as client:
+        async with self.client(ctx) as client:
             job_id = None
             # start generate
             async with await client.post(
-                "https://chat.akash.network/api/chat/",
+                f"{self.base_url}/api/chat/",
                 json=payload,
                 headers=self.headers,
             ) as response:
@@ -181,7 +174,7 @@ Negative prompt: {ctx.body.get("negative_prompt", "")}
             # wait for done
             while True:
                 async with await client.get(
-                    f"https://chat.akash.network/api/image-status/?ids={job_id}",
+                    f"{self.base_url}/api/image-status/?ids={job_id}",
                     headers=self.headers,
                 ) as response:
                     assert isinstance(response, rnet.Response)
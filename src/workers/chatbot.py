@@ -1,12 +1,12 @@
 import uuid
 import json
 import typing
-import base64
 import rnet
 import worker
 import proxies
 import context
 import error
+import attachments
 
 
 class ChatbotWorker(worker.Worker):
@@ -15,8 +15,9 @@ class ChatbotWorker(worker.Worker):
     ) -> None:
         settings.setdefault("streaming", True)
         super().__init__(settings, proxies)
+        self.base_url: str = settings.get("base_url", "https://demo.chat-sdk.dev").rstrip("/")
         self.headers = {
-            "referer": "https://demo.chat-sdk.dev/",
+            "referer": f"{self.base_url}/",
         }
 
     async def _client_created(self, client: rnet.Client) -> bool:
@@ -25,7 +26,7 @@ class ChatbotWorker(worker.Worker):
 
         # 刷新 cookie
         async with await client.get(
-            "https://demo.chat-sdk.dev/api/auth/session",
+            f"{self.base_url}/api/auth/session",
             headers=self.headers,
         ) as response:
             assert isinstance(response, rnet.Response)
@@ -36,13 +37,13 @@ class ChatbotWorker(worker.Worker):
             data = await response.json()
             assert data is not None, "ERROR: invalid cookie"
 
-        self.update_cookie(client.get_cookies("https://demo.chat-sdk.dev/"))
+        self.update_cookie(client.get_cookies(f"{self.base_url}/"))
         return True
     
     async def create_cookie(self, client: rnet.Client) -> bool:
         # 获取 cookie
         async with await client.get(
-            "https://demo.chat-sdk.dev/",
+            f"{self.base_url}/",
             headers=self.headers,
             allow_redirects=True,
             max_redirects=16,
@@ -52,7 +53,7 @@ class ChatbotWorker(worker.Worker):
                 raise error.WorkerOverloadError(f"ERROR: {response.status} Too Many Requests")
 
             assert response.ok, f"ERROR on fetch cookie: {response.status} {await response.text()}"
-            self.update_cookie(client.get_cookies("https://demo.chat-sdk.dev/"))
+            self.update_cookie(client.get_cookies(f"{self.base_url}/"))
             return True
 
     async def models(self) -> list[str]:
@@ -73,7 +74,7 @@ class ChatbotWorker(worker.Worker):
             "id": str(uuid.uuid4()),
             "message": {
                 "id": str(uuid.uuid4()),
-                "parts": await self.formatting_messages(ctx.body.get("messages", [])),
+                "parts": await self.formatting_messages(ctx.body.get("messages", []), ctx),
                 "role": "user",
             },
             "selectedChatModel": self.aliases.get(ctx.model, "chat-model"),
@@ -81,12 +82,12 @@ class ChatbotWorker(worker.Worker):
         }
 
         headers = self.headers.copy()
-        headers["referer"] = f"https://demo.chat-sdk.dev/chat/{payload['id']}"
+        headers["referer"] = f"{self.base_url}/chat/{payload['id']}"
 
         async def generate():
-            async with self.client() as client:
+            async with self.client(ctx) as client:
                 async with await client.post(
-                    "https://demo.chat-sdk.dev/api/chat",
+                    f"{self.base_url}/api/chat",
                     json=payload,
                     headers=headers,
                 ) as response:
@@ -97,7 +98,7 @@ class ChatbotWorker(worker.Worker):
                     assert response.ok, (
                         f"ERROR: {response.status} {await response.text()}"
                     )
-                    self.update_cookie(client.get_cookies("https://demo.chat-sdk.dev/"))
+                    self.update_cookie(client.get_cookies(f"{self.base_url}/"))
                     
                     async with response.stream() as streamer:
                         assert isinstance(streamer, rnet.Streamer)
@@ -124,28 +125,14 @@ class ChatbotWorker(worker.Worker):
         if ctx.body.get("stream", False):
             return generate()
 
-        data = context.Text(
-            type="text", content="", reasoning_content="", tool_calls=None
-        )
+        accumulator = context.TextAccumulator()
         async for chunk in generate():
-            if delta := chunk.get("content", None):
-                data["content"] += delta
-            if delta := chunk.get("reasoning_content", None):
-                data["reasoning_content"] += delta
-
-        data.update(
-            {
-                "content": data["content"] if data["content"] else None,
-                "reasoning_content": data["reasoning_content"]
-                if data["reasoning_content"]
-                else None,
-            }
-        )
+            accumulator.add(chunk)
 
-        return data
+        return accumulator.to_text()
 
     async def formatting_messages(
-        self, messages: list[context.Message]
+        self, messages: list[context.Message], ctx: context.Context | None = None
     ) -> list[dict[str, typing.Any]]:
         texts = []
         images = []
@@ -159,39 +146,15 @@ class ChatbotWorker(worker.Worker):
                     elif isinstance(part, dict):
                         if part.get("type", None) == "text":
                             texts.append(part["text"])
-                        elif part.get("type", None) == "image":
+                        elif part.get("type", None) in ("image_url", "image"):
                             images.append(part["image_url"]["url"])
 
-        # 上传图片
+        # 从最后一张开始上传，直到成功一张为止
         url, mime_type = None, None
-        if images:
-            for image in reversed(images):
-                file_data, mime_type = self.parse_file(image)
-                if not file_data or not mime_type:
-                    continue
-
-                async with await self.client() as client:
-                    assert isinstance(client, rnet.Client)
-                    async with await client.post(
-                        "https://demo.chat-sdk.dev/api/files/upload",
-                        multipart=rnet.Multipart(
-                            rnet.Part(
-                                name="file",
-                                filename=f"image.{mime_type.split('/')[-1]}",
-                                content=file_data,
-                                content_type=mime_type,
-                            )
-                        ),
-                        headers=self.headers,
-                    ) as response:
-                        assert isinstance(response, rnet.Response)
-                        if not response.ok:
-                            continue
-
-                        data = await response.json()
-                        url = data.get("url", None)
-                        if url:
-                            break
+        for image in reversed(images):
+            url, mime_type = await self.upload_file(image, ctx)
+            if url:
+                break
 
         results = []
         if url and mime_type:
@@ -214,16 +177,49 @@ class ChatbotWorker(worker.Worker):
 
         return results
 
-    def parse_file(self, file_url: str) -> tuple[str, bytes] | tuple[None, None]:
+    async def upload_file(
+        self, file_url: str, ctx: context.Context | None = None
+    ) -> tuple[str, str] | tuple[None, None]:
+        """
+        返回可以在消息中引用的 URL 和 MIME 类型；data: URL 上传后的 URL 按图片内容缓存，
+        之后的请求重复发送同一张图片时不再解码和上传
+        """
         if file_url.startswith("http"):
-            return [file_url, f"image/{file_url.split('.')[-1]}"]
+            return file_url, f"image/{file_url.split('.')[-1]}"
+
+        attachment = attachments.STORE.find(file_url)
+        if attachment is None:
+            return None, None
+
+        key = f"{self.name}.upload"
+        if (url := attachment.derived(key)) is not None:
+            return url, attachment.mime_type
+
+        async def upload() -> str | None:
+            # 只在真正上传时读取字节，load() 在图片已被淘汰时重新解码
+            content = attachments.STORE.load(attachment, file_url)
+            async with self.client(ctx) as client:
+                async with await client.post(
+                    f"{self.base_url}/api/files/upload",
+                    multipart=rnet.Multipart(
+                        rnet.Part(
+                            name="file",
+                            filename=f"image.{attachment.extension}",
+                            content=content,
+                            content_type=attachment.mime_type,
+                        )
+                    ),
+                    headers=self.headers,
+                ) as response:
+                    assert isinstance(response, rnet.Response)
+                    if not response.ok:
+                        return None
 
-        if file_url.startswith("data:"):
-            b64_prefix = file_url.find(";base64,")
-            mime_type = file_url[5:b64_prefix]
-            return [base64.b64decode(file_url[b64_prefix + 8 :]), mime_type]
+                    data = await response.json()
+                    return data.get("url", None)
 
-        return [None, None]
+        url = await attachments.STORE.derive(attachment, key, upload)
+        return (url, attachment.mime_type) if url else (None, None)
 
     async def _parse_response(self, data: dict[str, typing.Any], ctx: context.Context) -> context.Text:
         text = None
@@ -12,8 +12,9 @@ class K2ThinkWorker(worker.Worker):
         self, settings: dict[str, typing.Any], proxies: proxies.ProxyFactory
     ) -> None:
         super().__init__(settings, proxies)
+        self.base_url: str = settings.get("base_url", "https://www.k2think.ai").rstrip("/")
         self.headers = {
-            "referer": "https://www.k2think.ai/guest",
+            "referer": f"{self.base_url}/guest",
         }
         self.aliases = {
             "K2-Think": "MBZUAI-IFM/K2-Think",
@@ -24,7 +25,7 @@ class K2ThinkWorker(worker.Worker):
 
         async with self.client() as client:
             async with await client.get(
-                "https://www.k2think.ai/api/guest/models", headers=self.headers
+                f"{self.base_url}/api/guest/models", headers=self.headers
             ) as response:
                 assert isinstance(response, rnet.Response)
                 assert response.ok, f"ERROR: {response.status} {await response.text()}"
@@ -45,9 +46,9 @@ class K2ThinkWorker(worker.Worker):
             payload["params"] = {}
             payload["stream"] = True
 
-            async with self.client() as client:
+            async with self.client(ctx) as client:
                 async with await client.post(
-                    "https://www.k2think.ai/api/guest/chat/completions",
+                    f"{self.base_url}/api/guest/chat/completions",
                     json=payload,
                     headers=self.headers,
                 ) as response:
@@ -94,14 +95,11 @@ class K2ThinkWorker(worker.Worker):
         if ctx.body.get("stream", False):
             return generate()
 
-        data = context.Text(type="text", content="", reasoning_content="", tool_calls=None)
+        accumulator = context.TextAccumulator()
         async for chunk in generate():
-            if delta := chunk.get("content", None):
-                data["content"] += delta
-            if delta := chunk.get("reasoning_content", None):
-                data["reasoning_content"] += delta
+            accumulator.add(chunk)
 
-        return data
+        return accumulator.to_text()
     
     def _parse_content(self, content: str) -> tuple[str, str]:
         content = re.sub(r"<summary>[\s\S]*?</summary>", "", content)
@@ -2,6 +2,7 @@ import typing
 import logging
 import proxies
 import context
+import jsonbody
 from . import openai
 
 logger = logging.getLogger(__name__)
@@ -11,12 +12,14 @@ class LongchatWorker(openai.OpenAiWorker):
     def __init__(
         self, settings: dict[str, typing.Any], proxies: proxies.ProxyFactory
     ) -> None:
+        base_url = settings.get("base_url", "https://longcat.chat").rstrip("/")
         settings.setdefault(
-            "completions_url", "https://longcat.chat/api/v1/chat-completion-oversea"
+            "completions_url", f"{base_url}/api/v1/chat-completion-oversea"
         )
         settings.setdefault("streaming", True)
         super().__init__(settings, proxies)
-        self.headers = {"Referer": "https://longcat.chat/t"}
+        self.base_url = base_url
+        self.headers = {"Referer": f"{self.base_url}/t"}
 
     async def models(self) -> list[str]:
         return [
@@ -36,12 +39,10 @@ class LongchatWorker(openai.OpenAiWorker):
 
     async def _prepare_payload(
         self,
-        headers: dict[str, str],
         body: dict[str, typing.Any],
-        api_key: str,
         streaming: bool,
         ctx: context.Context,
-    ) -> None:
+    ) -> jsonbody.Template:
         body["stream"] = streaming
 
         body["searchEnabled"] = int("-search" in body["model"])
@@ -57,10 +58,20 @@ class LongchatWorker(openai.OpenAiWorker):
             content += f"{message['role']}: {message['content']}"
 
         body["content"] = content
+        return jsonbody.Template(body)
 
+    async def _prepare_request(
+        self,
+        headers: dict[str, str],
+        template: jsonbody.Template,
+        api_key: str,
+        ctx: context.Context,
+    ) -> bytes:
         if api_key:
             headers["Cookie"] = f"passport_token_key={api_key}"
 
+        return template.render()
+
     async def _parse_response(
         self, data: dict[str, typing.Any], ctx: context.Context
     ) -> context.Text:
@@ -10,6 +10,8 @@ import proxies
 import context
 import error
 import resources
+import retry
+import jsonbody
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,7 @@ RETRY_EXCEPTIONS = [
     rnet.exceptions.UpgradeError,
     rnet.exceptions.DNSResolverError,
     AssertionError,
+    error.UpstreamStatusError,
 ]
 
 class OpenAiWorker(worker.Worker):
@@ -43,7 +46,7 @@ class OpenAiWorker(worker.Worker):
         if key is not None:
             self.api_keys.append(key)
         self._resources = resources.ResourceManager(
-            self.api_keys, **settings.get("key_manager", {})
+            self.api_keys, **{"name": self.name, **settings.get("key_manager", {})}
         )
         self._filters : list[re.Pattern] = [ re.compile(f)  for f in settings.get("filters", []) ]
         self.max_retries = settings.get("max_retries", 3)
@@ -106,28 +109,27 @@ class OpenAiWorker(worker.Worker):
 
     async def streaming(self, ctx: context.Context) -> context.Text:
         async def generate() -> typing.AsyncGenerator[str, None]:
+            template = await self._prepare_payload(ctx.payload(self.settings), True, ctx)
             async for attempt in self._resources.get_retying(
                 self.max_retries, 
                 self.wait_time, 
-                RETRY_EXCEPTIONS
+                RETRY_EXCEPTIONS,
+                policy=retry.get_policy(ctx),
             ):
                 try:
                     async with attempt as api_key:
                         if api_key is None:
                             raise error.WorkerOverloadError("No API keys available")
                         
-                        headers = self.headers.copy()
-                        body = ctx.payload(self.settings)
-                        await self._prepare_payload(headers, body, api_key, True, ctx)
+                        headers = jsonbody.headers(self.headers)
+                        body = await self._prepare_request(headers, template, api_key, ctx)
 
-                        async with self.client() as client:
+                        async with self.client(ctx) as client:
                             async with await client.post(
-                                self.completions_url, json=body, headers=headers
+                                self.completions_url, body=body, headers=headers
                             ) as response:
                                 assert isinstance(response, rnet.Response)
-                                assert response.ok, (
-                                    f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                                )
+                                await self._raise_for_status(response, self.completions_url)
 
                                 async with response.stream() as streamer:
                                     assert isinstance(streamer, rnet.Streamer)
@@ -163,28 +165,27 @@ class OpenAiWorker(worker.Worker):
         return generate()
 
     async def no_streaming(self, ctx: context.Context) -> context.Text:
+        template = await self._prepare_payload(ctx.payload(self.settings), False, ctx)
         async for attempt in self._resources.get_retying(
             self.max_retries, 
             self.wait_time, 
-            RETRY_EXCEPTIONS
+            RETRY_EXCEPTIONS,
+            policy=retry.get_policy(ctx),
         ):
             try:
                 async with attempt as api_key:
                     if api_key is None:
                         raise error.WorkerOverloadError("No API keys available")
 
-                    headers = self.headers.copy()
-                    body = ctx.payload(self.settings)
-                    await self._prepare_payload(headers, body, api_key, False, ctx)
+                    headers = jsonbody.headers(self.headers)
+                    body = await self._prepare_request(headers, template, api_key, ctx)
 
-                    async with self.client() as client:
+                    async with self.client(ctx) as client:
                         async with await client.post(
-                            self.completions_url, json=body, headers=headers
+                            self.completions_url, body=body, headers=headers
                         ) as response:
                             assert isinstance(response, rnet.Response)
-                            assert response.ok, (
-                                f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                            )
+                            await self._raise_for_status(response, self.completions_url)
 
                             data = await response.json()
                             return await self._parse_response(data, ctx)
@@ -204,36 +205,41 @@ class OpenAiWorker(worker.Worker):
         yield task.result()
 
     async def to_no_streaming(self, response: typing.AsyncGenerator[context.Text, None]) -> context.Text:
-        content = context.Text(type="text", content="", reasoning_content="", tool_calls=[])
+        accumulator = context.TextAccumulator()
         async for chunk in response:
-            if delta := chunk.get("content", None):
-                content["content"] += delta
-            if delta := chunk.get("reasoning_content", None):
-                content["reasoning_content"] += delta
-            if delta := chunk.get("tool_calls", None):
-                content["tool_calls"].extend(delta)
-
-        content.update({
-            "content": content["content"] if content["content"] else None,
-            "reasoning_content": content["reasoning_content"] if content["reasoning_content"] else None,
-            "tool_calls": content["tool_calls"] if content["tool_calls"] else None,
-        })
-        return content
+            accumulator.add(chunk)
+
+        return accumulator.to_text()
 
     async def _prepare_payload(
         self,
-        headers: dict[str, str],
         body: dict[str, typing.Any],
-        api_key: str,
         streaming: bool | None,
         ctx: context.Context,
-    ) -> None:
+    ) -> jsonbody.Template:
+        """
+        每个请求调用一次，修改请求体并编码，之后的每次尝试复用编码结果
+        """
+        if streaming is not None:
+            body["stream"] = streaming
+
+        return jsonbody.Template(body)
+
+    async def _prepare_request(
+        self,
+        headers: dict[str, str],
+        template: jsonbody.Template,
+        api_key: str,
+        ctx: context.Context,
+    ) -> bytes:
+        """
+        每次尝试调用，设置和 key 相关的请求头并返回请求体
+        """
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
             logger.debug(f"Using API key: {api_key[:len(api_key) // 3]}...")
-        
-        if streaming is not None:
-            body["stream"] = streaming
+
+        return template.render()
 
     async def _parse_response(self, data: dict[str, typing.Any], ctx: context.Context) -> context.Text:
         if choices := data.get("choices", []):
@@ -253,28 +259,27 @@ class OpenAiWorker(worker.Worker):
                 f"Model {ctx.model} not available"
             )
         
+        template = await self._prepare_payload(ctx.payload(self.settings), False, ctx)
         async for attempt in self._resources.get_retying(
             self.max_retries, 
             self.wait_time, 
-            RETRY_EXCEPTIONS
+            RETRY_EXCEPTIONS,
+            policy=retry.get_policy(ctx),
         ):
             try:
                 async with attempt as api_key:
                     if api_key is None:
                         raise error.WorkerOverloadError("No API keys available")
 
-                    headers = self.headers.copy()
-                    body = ctx.payload(self.settings)
-                    await self._prepare_payload(headers, body, api_key, False, ctx)
+                    headers = jsonbody.headers(self.headers)
+                    body = await self._prepare_request(headers, template, api_key, ctx)
 
-                    async with self.client() as client:
+                    async with self.client(ctx) as client:
                         async with await client.post(
-                            self.embedding_url, json=body, headers=headers
+                            self.embedding_url, body=body, headers=headers
                         ) as response:
                             assert isinstance(response, rnet.Response)
-                            assert response.ok, (
-                                f"ERROR: {response.status} {await response.text()} of {self.completions_url}"
-                            )
+                            await self._raise_for_status(response, self.embedding_url)
 
                             data = await response.json()
                             return { "type": "embedding", "content": data.get("embedding", []) }
@@ -5,6 +5,7 @@ import proxies
 import context
 import error
 import resources
+import retry
 from . import openai
 import rnet
 
@@ -13,10 +14,13 @@ class PollinationsWorker(openai.OpenAiWorker):
     def __init__(
         self, settings: dict[str, typing.Any], proxies: proxies.ProxyFactory
     ) -> None:
-        settings.setdefault("completions_url", "https://text.pollinations.ai/openai")
+        text_base_url = settings.get("text_base_url", "https://text.pollinations.ai").rstrip("/")
+        settings.setdefault("completions_url", f"{text_base_url}/openai")
         settings.setdefault("streaming", None)
 
         super().__init__(settings, proxies)
+        self.text_base_url = text_base_url
+        self.image_base_url: str = settings.get("image_base_url", "https://image.pollinations.ai").rstrip("/")
         self.image_models: list[str] = []
         self.text_models: list[str] = []
         self.max_retries = settings.get("max_retries", 3)
@@ -27,13 +31,13 @@ class PollinationsWorker(openai.OpenAiWorker):
 
         async with self.client() as client:
             async with await client.get(
-                "https://image.pollinations.ai/models"
+                f"{self.image_base_url}/models"
             ) as response:
                 self.image_models = [
                     reverse_aliases.get(x, x) for x in await response.json()
                 ]
             async with await client.get(
-                "https://text.pollinations.ai/models"
+                f"{self.text_base_url}/models"
             ) as response:
                 data = await response.json()
                 self.text_models = [
@@ -78,7 +82,8 @@ class PollinationsWorker(openai.OpenAiWorker):
         async for attempt in self._resources.get_retying(
             self.max_retries, 
             self.wait_time, 
-            [rnet.exceptions.StatusError, rnet.exceptions.TimeoutError, AssertionError]
+            [rnet.exceptions.StatusError, rnet.exceptions.TimeoutError, AssertionError, error.UpstreamStatusError],
+            policy=retry.get_policy(ctx),
         ):
             try:
                 async with attempt as api_key:
@@ -91,16 +96,14 @@ class PollinationsWorker(openai.OpenAiWorker):
 
                     data["nologo"] = str(bool(api_key))
 
-                    async with self.client() as client:
+                    async with self.client(ctx) as client:
                         async with await client.get(
-                            f"https://image.pollinations.ai/prompt/{prompt}?{urllib.parse.urlencode(data)}",
+                            f"{self.image_base_url}/prompt/{prompt}?{urllib.parse.urlencode(data)}",
                             json=ctx.body,
                             headers=headers,
                         ) as response:
                             assert isinstance(response, rnet.Response)
-                            assert response.ok, (
-                                f"ERROR: {response.status} {await response.text()}"
-                            )
+                            await self._raise_for_status(response, f"{self.image_base_url}/prompt/")
 
                             binary = await response.bytes()
                             return context.Image(
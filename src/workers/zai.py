@@ -5,6 +5,7 @@ import datetime
 import proxies
 import error
 import context
+import jsonbody
 from . import openai
 import rnet
 
@@ -12,11 +13,13 @@ class ZaiWorker(openai.OpenAiWorker):
     def __init__(
         self, settings: dict[str, typing.Any], proxies: proxies.ProxyFactory
     ) -> None:
-        settings.setdefault("completions_url", "https://chat.z.ai/api/chat/completions")
+        base_url = settings.get("base_url", "https://chat.z.ai").rstrip("/")
+        settings.setdefault("completions_url", f"{base_url}/api/chat/completions")
         settings.setdefault("streaming", True)
         super().__init__(settings, proxies)
+        self.base_url = base_url
         self.headers = {
-            "Referer": "https://chat.z.ai",
+            "Referer": self.base_url,
             "X-FE-Version": "prod-fe-1.0.79",
         }
     
@@ -50,23 +53,17 @@ class ZaiWorker(openai.OpenAiWorker):
     
     async def create_token(self):
         async with self.client() as client:
-            async with await client.get("https://chat.z.ai/api/v1/auths/") as response:
+            async with await client.get(f"{self.base_url}/api/v1/auths/") as response:
                 assert isinstance(response, rnet.Response)
                 assert response.ok, f"Failed to create token: {response.status} {await response.text()}"
                 data = await response.json()
                 return data["token"]
     
     async def _prepare_payload(self,
-            headers: dict[str, str],
             body: dict[str, typing.Any],
-            api_key: str,
             streaming: bool,
-        ) -> None:
-        if api_key:
-            headers["Authorization"] = f"Bearer {api_key}"
-        else:
-            headers["Authorization"] = f"Bearer {await self.create_token()}"
-        
+            ctx: context.Context,
+        ) -> jsonbody.Template:
         model = body.get("model", "GLM-4.5")
 
         upstream_model = "0727-360B-API"
@@ -81,8 +78,9 @@ class ZaiWorker(openai.OpenAiWorker):
         body.update({
             "stream": streaming,
             "model": upstream_model,
-            "chat_id": str(uuid.uuid4()),
-            "id": str(uuid.uuid4()),
+            # 每次尝试使用新的 chat_id 和 id，在 _prepare_request 中替换
+            "chat_id": "",
+            "id": "",
             "params": {},
             "features": {
                 "enable_thinking": "-thinking" in model,
@@ -114,13 +112,29 @@ class ZaiWorker(openai.OpenAiWorker):
             "mcp_servers": [ "deep-web-search" ] if "-search" in model else []
         })
 
-        headers["Referer"] = f"https://chat.z.ai/c/{body['chat_id']}"
+        # 消息与 ctx.body 共享，只复制需要修改的消息
+        body["messages"] = [
+            {**message, "role": "user"} if message.get("role", "") == "system" else message
+            for message in body.get("messages", [])
+        ]
+        return jsonbody.Template(body, ("chat_id", "id"))
+
+    async def _prepare_request(self,
+            headers: dict[str, str],
+            template: jsonbody.Template,
+            api_key: str,
+            ctx: context.Context,
+        ) -> bytes:
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        else:
+            headers["Authorization"] = f"Bearer {await self.create_token()}"
 
-        for message in body.get("messages", []):
-            if message.get("role", "") == "system":
-                message["role"] = "user"
+        chat_id = str(uuid.uuid4())
+        headers["Referer"] = f"{self.base_url}/c/{chat_id}"
+        return template.render(chat_id=chat_id, id=str(uuid.uuid4()))
     
-    async def _parse_response(self, data: dict[str, typing.Any]) -> context.Text:
+    async def _parse_response(self, data: dict[str, typing.Any], ctx: context.Context) -> context.Text:
         err = data.get("error") or data.get("data", {}).get("error") or data.get("data", {}).get("inner", {}).get("error")
         if err:
             raise error.WorkerOverloadError(f"zAI ERROR: {err}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# src 下是平铺的模块（import retry、import resources），与 main.py 的运行方式一致
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
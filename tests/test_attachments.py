@@ -0,0 +1,145 @@
+import base64
+import asyncio
+import pytest
+import attachments
+
+MB = 2**20
+
+
+def data_url(seed: int, size: int = MB) -> tuple[str, bytes]:
+    raw = bytes([seed % 256]) * size
+    return "data:image/png;base64," + base64.b64encode(raw).decode(), raw
+
+
+def test_same_image_is_decoded_once():
+    store = attachments.AttachmentStore()
+    url, raw = data_url(1, 1024)
+    first = store.get(url)
+    assert store.get(url) is first
+    assert store.data(first) == raw
+    assert first.mime_type == "image/png" and first.extension == "png"
+    assert store.counts == {"hit": 1, "miss": 1, "decoded": 1}
+
+
+def test_non_base64_urls_are_ignored():
+    store = attachments.AttachmentStore()
+    assert store.get("https://example.com/a.png") is None
+    assert store.get("data:text/plain,hello") is None
+
+
+def test_spilled_images_are_read_back():
+    store = attachments.AttachmentStore(max_memory=2 * MB, max_disk=64 * MB)
+    images = [data_url(i) for i in range(5)]
+    handles = [store.get(url) for url, _ in images]
+
+    assert store.memory <= 2 * MB and store.disk > 0
+    for handle, (_, raw) in zip(handles, images):
+        assert store.data(handle) == raw
+
+
+def test_data_is_readable_right_after_get_when_disk_resets():
+    store = attachments.AttachmentStore(max_memory=MB // 2, max_disk=MB + MB // 2)
+    (a, raw), (b, _) = data_url(1), data_url(2)
+    store.get(a)
+    store.get(b)
+    # a 在临时文件中；再次使用 a 时把 b 写入文件，超过上限清空了文件，a 需要重新解码
+    handle = store.get(a)
+    assert store.data(handle) == raw
+    assert store.counts["decoded"] == 3
+
+    images = [data_url(i) for i in range(8)]
+    for _ in range(3):
+        for url, raw in images:
+            assert store.data(store.get(url)) == raw
+
+
+def test_evicted_handle_raises_lookup_error():
+    store = attachments.AttachmentStore(max_memory=3 * MB, max_disk=4 * MB)
+    url, _ = data_url(0)
+    handle = store.get(url)
+    for i in range(1, 8):
+        store.get(data_url(i)[0])
+
+    # 其他请求写满临时文件后清空了它：需要字节的调用者应在 get() 之后立即读出
+    assert not handle.decoded
+    with pytest.raises(LookupError):
+        store.data(handle)
+
+
+def test_load_redecodes_evicted_handle():
+    store = attachments.AttachmentStore(max_memory=3 * MB, max_disk=4 * MB)
+    url, raw = data_url(0)
+    handle = store.get(url)
+    for i in range(1, 8):
+        store.get(data_url(i)[0])
+
+    assert not handle.decoded
+    assert store.load(handle, url) == raw
+
+
+def test_load_dropped_handle_is_not_counted():
+    store = attachments.AttachmentStore(max_entries=1)
+    url, raw = data_url(0, 16)
+    handle = store.find(url)
+    store.get(data_url(1, 16)[0])
+
+    memory = store.memory
+    assert store.load(handle, url) == raw
+    assert store.memory == memory
+
+
+def test_cached_derivation_skips_decoding():
+    store = attachments.AttachmentStore()
+    url, _ = data_url(1, 16)
+
+    async def upload():
+        store.load(handle, url)
+        return "https://files/1"
+
+    handle = store.find(url)
+    assert not handle.decoded
+    assert asyncio.run(store.derive(handle, "upload", upload)) == "https://files/1"
+    assert store.counts["decoded"] == 1
+
+    # 之后的请求只计算摘要，不再解码和读取字节
+    handle = store.find(url)
+    assert handle.derived("upload") == "https://files/1"
+    assert store.counts == {"hit": 1, "miss": 1, "decoded": 1}
+
+
+def test_max_entries_drops_oldest():
+    store = attachments.AttachmentStore(max_entries=2)
+    urls = [data_url(i, 16)[0] for i in range(3)]
+    for url in urls:
+        store.get(url)
+    assert len(store) == 2
+    store.get(urls[0])
+    assert store.counts["miss"] == 4
+
+
+def test_derive_is_single_flight_and_skips_failures():
+    store = attachments.AttachmentStore()
+    url, _ = data_url(1, 16)
+    calls = 0
+
+    async def upload():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "https://files/1"
+
+    async def failing():
+        raise RuntimeError("upload failed")
+
+    async def main():
+        handle = store.get(url)
+        with pytest.raises(RuntimeError):
+            await store.derive(handle, "upload", failing)
+        assert handle.derived("upload") is None
+
+        results = await asyncio.gather(*[store.derive(handle, "upload", upload) for _ in range(5)])
+        assert results == ["https://files/1"] * 5
+        assert await store.derive(handle, "upload", upload) == "https://files/1"
+
+    asyncio.run(main())
+    assert calls == 1
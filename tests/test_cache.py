@@ -0,0 +1,104 @@
+import gc
+import asyncio
+import weakref
+import pytest
+import cache
+
+
+def test_concurrent_misses_share_one_call():
+    calls = 0
+
+    @cache.ttl_cache(60)
+    async def load(key: str) -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    async def main():
+        return await asyncio.gather(*[load("a") for _ in range(10)])
+
+    assert asyncio.run(main()) == ["A"] * 10
+    assert calls == 1
+    assert load.cache.counts["miss"] == 1
+    assert load.cache.counts["coalesced"] == 9
+
+
+def test_exceptions_are_not_cached():
+    calls = 0
+
+    @cache.ttl_cache(60)
+    async def load() -> int:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("upstream down")
+        return calls
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await load()
+        return await load(), await load()
+
+    assert asyncio.run(main()) == (2, 2)
+    assert calls == 2
+
+
+def test_stale_value_is_served_while_refreshing():
+    version = 0
+
+    @cache.ttl_cache(0.05, stale=10)
+    async def load() -> int:
+        nonlocal version
+        version += 1
+        return version
+
+    async def main():
+        assert await load() == 1
+        await asyncio.sleep(0.06)
+        # 过期后立即返回旧值，同时在后台刷新
+        assert await load() == 1
+        await asyncio.sleep(0.01)
+        assert await load() == 2
+
+    asyncio.run(main())
+    assert load.cache.counts["stale"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    store = cache.TTLCache("test", 60, max_entries=2)
+    store.put("a", 1, 0)
+    store.put("b", 2, 0)
+    store.lookup("a", 0)
+    store.put("c", 3, 0)
+
+    assert list(store._entries) == ["a", "c"]
+    assert store.evictions == 1
+
+
+def test_byte_limit_evicts_and_skips_oversized_values():
+    store = cache.TTLCache("test", 60, max_bytes=cache.sizeof("x" * 1000) * 2)
+    store.put("a", "x" * 1000, 0)
+    store.put("b", "x" * 1000, 0)
+    store.put("c", "x" * 1000, 0)
+    assert list(store._entries) == ["b", "c"]
+
+    store.put("big", "x" * 10000, 0)
+    assert "big" not in store._entries
+
+
+def test_method_cache_does_not_keep_instance_alive():
+    class Service:
+        @cache.ttl_cache(60)
+        def models(self) -> list[str]:
+            return ["a"]
+
+    service = Service()
+    assert service.models() == ["a"]
+    assert service.models() == ["a"]
+    assert Service.models.cache.counts["hit"] == 1
+
+    ref = weakref.ref(service)
+    del service
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,97 @@
+import json
+import pickle
+import asyncio
+import pytest
+import drain
+import context
+
+
+def test_text_omits_role_and_tool_calls_when_none():
+    chunk = context.Text(type="text", content="hi", reasoning_content=None)
+    assert "role" not in chunk and "tool_calls" not in chunk
+    assert chunk.get("role", "x") == "x"
+    assert chunk.get("tool_calls") is None
+    with pytest.raises(KeyError):
+        chunk["role"]
+    assert dict(chunk) == {"type": "text", "content": "hi", "reasoning_content": None}
+    assert len(chunk) == 3
+
+    chunk["role"] = "assistant"
+    chunk["tool_calls"] = []
+    assert list(chunk) == ["role", "type", "content", "reasoning_content", "tool_calls"]
+
+
+def test_text_wire_format_keeps_baseline_keys():
+    chunk = context.Text(type="text", content="hi", reasoning_content=None)
+    assert json.dumps(chunk, default=context.to_json) == '{"type": "text", "content": "hi", "reasoning_content": null}'
+    assert chunk.to_dict() == {"type": "text", "content": "hi", "reasoning_content": None}
+
+    calls = [{"index": 0, "function": {"name": "f", "arguments": "{}"}}]
+    chunk = context.Text(content=None, reasoning_content=None, tool_calls=calls, role="assistant")
+    assert chunk.to_dict() == {
+        "role": "assistant", "type": "text", "content": None, "reasoning_content": None, "tool_calls": calls,
+    }
+
+
+def test_text_rejects_unknown_keys():
+    chunk = context.Text(content="hi")
+    with pytest.raises(KeyError):
+        chunk["extra"] = 1
+    with pytest.raises(KeyError):
+        chunk["extra"]
+    assert "extra" not in chunk
+    assert chunk.get("extra", 0) == 0
+
+
+def test_text_mapping_methods():
+    chunk = context.Text(content="a", reasoning_content="r")
+    assert chunk.pop("reasoning_content") == "r"
+    assert "reasoning_content" in chunk and chunk["reasoning_content"] is None
+    assert chunk.pop("role", "none") == "none"
+    assert chunk.setdefault("tool_calls", []) == []
+    assert chunk.setdefault("content", "b") == "a"
+    chunk.update(content="c")
+    assert chunk == {"type": "text", "content": "c", "reasoning_content": None, "tool_calls": []}
+
+
+def test_text_pickles_through_drain():
+    chunks = [context.Text(content=f"{i}" * 100, role="assistant" if i == 0 else None) for i in range(50)]
+    assert pickle.loads(pickle.dumps(chunks[0])) == chunks[0]
+
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def main():
+        # max_memory 很小，大部分块经过临时文件
+        buffer = drain.DrainBuffer(source(), max_memory=256)
+        await asyncio.sleep(0.05)
+        return [x async for x in buffer.stream()]
+
+    result = asyncio.run(main())
+    assert [x.to_dict() for x in result] == [x.to_dict() for x in chunks]
+    assert all(isinstance(x, context.Text) for x in result)
+
+
+def test_metadata_slots_and_extra_keys():
+    metadata = context.Metadata({"task_id": "t", "custom": 1})
+    assert metadata["task_id"] == "t" and metadata.task_id == "t"
+    assert metadata["custom"] == 1 and metadata.extra == {"custom": 1}
+    assert "worker" not in metadata
+    assert metadata.get("worker", "none") == "none"
+    with pytest.raises(KeyError):
+        metadata["worker"]
+    with pytest.raises(KeyError):
+        del metadata["worker"]
+
+    assert metadata.setdefault("resumes", 0) == 0
+    assert metadata.pop("custom") == 1
+    assert metadata.pop("worker_error", None) is None
+    assert dict(metadata) == {"task_id": "t", "resumes": 0}
+    assert json.loads(json.dumps({"m": metadata}, default=context.to_json)) == {"m": {"task_id": "t", "resumes": 0}}
+
+
+def test_context_converts_dict_metadata():
+    ctx = context.Context(headers={}, body={}, type="text", metadata={"task_id": "t"})
+    assert isinstance(ctx.metadata, context.Metadata)
+    assert ctx.task_id == "t"
@@ -0,0 +1,57 @@
+import gc
+import asyncio
+import drain
+
+
+async def source(n: int, pause: int = 0):
+    for i in range(n):
+        if pause and i % pause == 0:
+            await asyncio.sleep(0)
+        yield {"content": f"{i:06d}" * 10}
+
+
+def test_spilled_chunks_keep_order():
+    async def main():
+        # 上游偶尔让出，读取和写入文件交替进行
+        buffer = drain.DrainBuffer(source(500, 50), max_memory=300)
+        result = []
+        async for chunk in buffer.stream():
+            result.append(int(chunk["content"][:6]))
+            if len(result) % 7 == 0:
+                await asyncio.sleep(0)
+        assert buffer._spill is not None and buffer._spill.closed
+        return result
+
+    assert asyncio.run(main()) == list(range(500))
+
+
+def test_dropped_stream_closes_spill_file():
+    async def main():
+        buffer = drain.DrainBuffer(source(500), max_memory=100)
+        await asyncio.sleep(0.05)
+        spill = buffer._spill
+        assert spill is not None and not spill.closed
+
+        stream = buffer.stream()
+        del stream
+        gc.collect()
+        assert spill.closed
+
+    asyncio.run(main())
+
+
+def test_early_exit_cancels_source():
+    async def endless():
+        while True:
+            await asyncio.sleep(0)
+            yield "x"
+
+    async def main():
+        buffer = drain.DrainBuffer(endless())
+        stream = buffer.stream()
+        assert await anext(stream) == "x"
+        await stream.aclose()
+        await asyncio.sleep(0)
+        assert buffer._task.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import json
+import pytest
+import jsonbody
+
+BODY = {
+    "model": "glm-4.6",
+    "messages": [{"role": "user", "content": "你好，世界 \U0001f600 \"quoted\" \\ back"}],
+    "chat_id": None,
+    "id": None,
+    "stream": True,
+}
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        if jsonbody.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(jsonbody, "orjson", None)
+    return request.param
+
+
+def test_dumps_is_compact_utf8(encoder):
+    assert jsonbody.dumps({"a": "é", "b": [1, 2]}) == '{"a":"é","b":[1,2]}'.encode("utf-8")
+
+
+def test_template_renders_fields(encoder):
+    template = jsonbody.Template(BODY, ("chat_id", "id"))
+    data = template.render(chat_id="会话-1", id={"nested": ["x", 1]})
+    assert json.loads(data) == {**BODY, "chat_id": "会话-1", "id": {"nested": ["x", 1]}}
+
+    # 每次 render 只替换字段，其余字节复用
+    assert json.loads(template.render(chat_id="2", id=None)) == {**BODY, "chat_id": "2", "id": None}
+
+
+def test_template_without_fields_returns_same_bytes(encoder):
+    template = jsonbody.Template(BODY)
+    assert template.render() is template.render()
+    assert json.loads(template.render()) == BODY
+
+
+def test_orjson_fallback_to_stdlib():
+    # orjson 不支持超过 64 位的整数，交给标准库编码
+    body = {**BODY, "seed": 2**70}
+    template = jsonbody.Template(body, ("chat_id", "id"))
+    data = template.render(chat_id=2**65, id="x")
+    assert json.loads(data) == {**body, "chat_id": 2**65, "id": "x"}
+
+
+def test_lone_surrogate_is_escaped(encoder):
+    # 孤立代理项无法编码为 UTF-8，转义后发送给上游，不会变成 500
+    body = {**BODY, "messages": [{"role": "user", "content": "bad \ud800"}]}
+    data = jsonbody.dumps(body)
+    assert b'"bad \\ud800"' in data
+    assert json.loads(data) == body
+
+    template = jsonbody.Template(body, ("chat_id",))
+    assert json.loads(template.render(chat_id="会话")) == {**body, "chat_id": "会话"}
@@ -0,0 +1,41 @@
+import queue
+import logging
+import logs
+
+
+def emit(msg: str, *args) -> logging.LogRecord:
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logs.LazyQueueHandler(q)
+    record = logging.LogRecord("test", logging.DEBUG, __file__, 1, msg, args, None)
+    handler.emit(record)
+    return q.get_nowait()
+
+
+def test_scalar_args_stay_lazy():
+    record = emit("%s took %.1fs", "task", 1.5)
+    assert record.args == ("task", 1.5)
+    assert record.getMessage() == "task took 1.5s"
+
+
+def test_container_args_are_snapshotted():
+    messages = [{"role": "user", "content": "hi"}]
+    record = emit("%s messages: %s", "task", messages)
+    messages.append({"role": "system", "content": "injected"})
+
+    assert record.args[0] == "task"
+    assert "injected" not in record.getMessage()
+    assert record.getMessage() == "task messages: [{'content': 'hi', 'role': 'user'}]"
+
+
+def test_large_containers_are_capped():
+    messages = [{"role": "user", "content": "x" * 1_000_000}] * 1000
+    record = emit("%s messages: %s", "task", messages)
+    assert len(record.getMessage()) < 10_000
+
+
+def test_mapping_args_are_snapshotted():
+    body = {"model": "a", "messages": [{"role": "user"}]}
+    record = emit("%(model)s %(messages)s", body)
+    body["model"] = "b"
+    body["messages"].append({"role": "system"})
+    assert record.getMessage() == "a [{'role': 'user'}]"
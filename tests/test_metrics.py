@@ -0,0 +1,28 @@
+import asyncio
+import context
+import metrics
+import worker
+
+
+def finished(model: str) -> set[str]:
+    ctx = context.Context(headers={}, body={"model": model}, type="text")
+    metrics.request_finished(ctx, 0.1)
+    return { labels[1] for labels in metrics.REQUESTS.values }
+
+
+def test_unknown_models_share_one_label():
+    metrics.add_models(["known-model"])
+    labels = finished("known-model")
+    for i in range(10):
+        labels = finished(f"random-{i}")
+
+    assert "known-model" in labels
+    assert metrics.OTHER_MODEL in labels
+    assert not any(x.startswith("random-") for x in labels)
+
+
+def test_worker_models_become_labels():
+    manager = worker.WorkerManager({}, None)
+    manager.add_worker(worker.Worker({"name": "w", "models": ["listed-model"]}, None))
+    asyncio.run(manager.models())
+    assert "listed-model" in finished("listed-model")
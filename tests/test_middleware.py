@@ -0,0 +1,34 @@
+import asyncio
+import context
+import middleware
+
+
+class Passive(middleware.Middleware):
+    async def process_error(self, ctx, error, attempt):
+        return None
+
+
+class Claim(middleware.Middleware):
+    async def process_error(self, ctx, error, attempt):
+        return True
+
+
+def process_error(*middlewares: middleware.Middleware) -> bool:
+    manager = middleware.MiddlewareManager({}, None)
+    for x in middlewares:
+        manager.add_middleware(x)
+    ctx = context.Context(headers={}, body={}, type="text")
+    return asyncio.run(manager.process_error(ctx, RuntimeError(), 1))
+
+
+def test_no_middleware_does_not_claim_error():
+    assert process_error() is False
+
+
+def test_unhandled_error_is_not_claimed():
+    # 未覆盖 process_error 的中间件不会进入编译后的钩子列表
+    assert process_error(middleware.Middleware({}, None), Passive({}, None)) is False
+
+
+def test_claiming_middleware_stops_error():
+    assert process_error(Passive({}, None), Claim({}, None)) is True
@@ -0,0 +1,93 @@
+import asyncio
+import proxies
+
+
+class RenewingProxyManager(proxies.ProxyManager):
+    def __init__(self, results: list[list[str]]):
+        super().__init__("http://renew", [], timeout=5, renew_wait=0.01)
+        self.results = results
+        self.calls = 0
+
+    async def renew(self) -> list[str]:
+        self.calls += 1
+        return self.results.pop(0) if self.results else []
+
+
+async def use(manager: proxies.ProxyManager, order: list, name: str, release: asyncio.Event | None = None):
+    async with await manager.acquire() as proxy:
+        order.append((name, proxy))
+        if release is not None:
+            await release.wait()
+
+
+def test_released_proxy_goes_to_oldest_waiter():
+    async def main():
+        manager = proxies.ProxyManager("", ["p"], timeout=5)
+        order = []
+        release = asyncio.Event()
+        holder = asyncio.create_task(use(manager, order, "holder", release))
+        await asyncio.sleep(0)
+
+        waiters = [asyncio.create_task(use(manager, order, f"w{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert asyncio.run(main()) == [("holder", "p"), ("w0", "p"), ("w1", "p"), ("w2", "p")]
+
+
+def test_cancelled_waiter_passes_handed_proxy_on():
+    async def main():
+        manager = proxies.ProxyManager("", [], timeout=5)
+        first = asyncio.create_task(manager._get_or_wait_for_proxy())
+        second = asyncio.create_task(manager._get_or_wait_for_proxy())
+        await asyncio.sleep(0)
+
+        manager._put("p")
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+
+        assert first.cancelled()
+        assert await second == "p"
+
+    asyncio.run(main())
+
+
+def test_renew_retries_until_waiters_are_served():
+    async def main():
+        # 第一次更新失败，第二次只拿到一个代理，第三次才够分
+        manager = RenewingProxyManager([[], ["p1"], ["p2"]])
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(use(manager, order, x, release)) for x in "ab"]
+
+        async def served():
+            while len(order) < 2:
+                await asyncio.sleep(0.005)
+
+        await asyncio.wait_for(served(), 2)
+        release.set()
+        await asyncio.gather(*tasks)
+        await asyncio.sleep(0)
+        assert not manager._is_renewing
+        return sorted(x[1] for x in order), manager.calls
+
+    assert asyncio.run(main()) == (["p1", "p2"], 3)
+
+
+def test_renew_stops_without_waiters():
+    async def main():
+        manager = RenewingProxyManager([[]])
+        try:
+            await manager.acquire(0.02)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.1)
+        assert not manager._is_renewing
+        calls = manager.calls
+        await asyncio.sleep(0.1)
+        return calls, manager.calls
+
+    calls, later = asyncio.run(main())
+    assert calls == later
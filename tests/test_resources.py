@@ -0,0 +1,126 @@
+import asyncio
+import resources
+
+
+async def hold(manager: resources.ResourceManager, order: list, name: str, release: asyncio.Event | None = None):
+    async with manager.get() as resource:
+        order.append((name, resource))
+        if release is not None:
+            await release.wait()
+
+
+def test_released_resource_goes_to_oldest_waiter():
+    async def main():
+        manager = resources.ResourceManager(["a"])
+        order = []
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(manager, order, "holder", release))
+        await asyncio.sleep(0)
+
+        waiters = [asyncio.create_task(hold(manager, order, f"w{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert asyncio.run(main()) == [("holder", "a"), ("w0", "a"), ("w1", "a"), ("w2", "a")]
+
+
+def test_waiter_that_tried_resource_is_skipped():
+    async def main():
+        manager = resources.ResourceManager(["a", "b"])
+        a = manager._take()
+        b = manager._take()
+
+        # 已经试过 a 的重试者排在前面，但只能等 b
+        retrying = asyncio.create_task(manager._acquire_new_untried_resource({a}, None))
+        await asyncio.sleep(0)
+        plain = asyncio.create_task(manager._acquire_resource())
+        await asyncio.sleep(0)
+
+        manager._release_index(a)
+        assert await plain == a
+        assert not retrying.done()
+
+        manager._release_index(b)
+        assert await retrying == ("b", b)
+
+    asyncio.run(main())
+
+
+def test_all_tried_raises_without_waiting():
+    async def main():
+        manager = resources.ResourceManager(["a"])
+        index = manager._take()
+        try:
+            await manager._acquire_new_untried_resource({index}, None)
+        except resources.NoMoreResourceError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+
+
+def test_cancelled_waiter_passes_handed_resource_on():
+    async def main():
+        manager = resources.ResourceManager(["a"])
+        index = manager._take()
+        first = asyncio.create_task(manager._acquire_resource())
+        second = asyncio.create_task(manager._acquire_resource())
+        await asyncio.sleep(0)
+
+        # 资源已经交给 first，但 first 在恢复运行前被取消
+        manager._release_index(index)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+
+        assert first.cancelled()
+        assert await second == index
+        assert manager.in_use == 1
+
+    asyncio.run(main())
+
+
+def test_timed_out_waiter_does_not_leak_resource():
+    async def main():
+        manager = resources.ResourceManager(["a"])
+        index = manager._take()
+        assert await manager._acquire_resource(0.01) is None
+
+        manager._release_index(index)
+        assert manager.in_use == 0
+        assert not manager._waiters
+
+    asyncio.run(main())
+
+
+def test_cooldown_uses_timer_instead_of_task():
+    async def main():
+        manager = resources.ResourceManager(["a"], cooldown_time=0.05)
+        tasks = len(asyncio.all_tasks())
+        async with manager.get():
+            pass
+
+        assert manager.in_use == 1
+        assert len(asyncio.all_tasks()) == tasks
+        await asyncio.sleep(0.1)
+        assert manager.in_use == 0
+
+    asyncio.run(main())
+
+
+def test_duplicate_resources_are_released_by_index():
+    async def main():
+        manager = resources.ResourceManager(["k", "k"])
+        first = manager.get()
+        second = manager.get()
+        assert await first.__aenter__() == "k"
+        assert await second.__aenter__() == "k"
+        assert manager.in_use == 2
+
+        await first.__aexit__(None, None, None)
+        assert manager.in_use == 1
+        await second.__aexit__(None, None, None)
+        assert manager.in_use == 0
+
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+import error
+import retry
+import context
+import resources
+import middleware
+
+
+def make_policy(**settings) -> retry.RetryPolicy:
+    ctx = context.Context(headers={}, body={}, type="text")
+    return retry.RetryPolicy({"wait_time": 0, **settings}, retry.RetryBudget(), ctx)
+
+
+async def call(manager: resources.ResourceManager, policy: retry.RetryPolicy, failures: dict[str, int]) -> list[str]:
+    tried = []
+    async for attempt in manager.get_retying(3, 0, [error.UpstreamStatusError], policy=policy):
+        async with attempt as key:
+            tried.append(key)
+            if key in failures:
+                raise error.UpstreamStatusError(failures[key])
+    return tried
+
+
+@pytest.mark.parametrize("status", [401, 403, 429])
+def test_key_error_rotates_to_next_key(status):
+    manager = resources.ResourceManager(["revoked", "good"])
+    policy = make_policy()
+    assert asyncio.run(call(manager, policy, {"revoked": status})) == ["revoked", "good"]
+    assert policy.retries == 0
+
+
+def test_non_retryable_status_stops_rotation():
+    manager = resources.ResourceManager(["bad", "good"])
+    with pytest.raises(resources.NoMoreResourceError) as info:
+        asyncio.run(call(manager, make_policy(), {"bad": 400}))
+    assert isinstance(info.value.__cause__, error.UpstreamStatusError)
+
+
+def test_key_rotation_does_not_use_request_retries():
+    manager = resources.ResourceManager(["a", "b", "c"])
+    policy = make_policy(max_retries=1)
+    with pytest.raises(resources.NoMoreResourceError) as info:
+        asyncio.run(call(manager, policy, {"a": 500, "b": 500, "c": 500}))
+    assert policy.retries == 0
+    # 主 worker 的 key 全部失败后仍然可以切换到备用 worker
+    assert policy.should_retry(info.value, failover=True)
+    assert policy.retries == 1
+    assert not policy.should_retry(info.value, failover=True)
+
+
+def test_key_error_fails_over_but_is_not_retried_by_engine():
+    policy = make_policy()
+    try:
+        try:
+            raise error.UpstreamStatusError(401)
+        except error.UpstreamStatusError as e:
+            raise resources.NoMoreResourceError("All 2 attempts failed.") from e
+    except resources.NoMoreResourceError as e:
+        exc = e
+
+    assert policy.status(exc) == 401
+    assert not policy.should_retry(exc)
+    assert policy.should_retry(exc, failover=True)
+
+
+async def engine_attempts(manager: middleware.MiddlewareManager, max_attempts: int) -> int:
+    # 与 Engine 中的重试循环相同的用法
+    factory = retry.RetryFactory({"wait_time": 0, "max_attempts": max_attempts}, manager)
+    ctx = context.Context(headers={}, body={}, type="text")
+    attempts = 0
+    with pytest.raises(error.UpstreamStatusError):
+        async for attempt in factory(ctx):
+            async with attempt:
+                attempts += 1
+                raise error.UpstreamStatusError(500)
+    return attempts
+
+
+def test_engine_retries_up_to_max_attempts():
+    manager = middleware.MiddlewareManager({}, None)
+    assert asyncio.run(engine_attempts(manager, 3)) == 3
+
+
+def test_claimed_error_stops_retrying():
+    class Claim(middleware.Middleware):
+        async def process_error(self, ctx, error, attempt):
+            return True
+
+    manager = middleware.MiddlewareManager({}, None)
+    manager.add_middleware(Claim({}, None))
+    assert asyncio.run(engine_attempts(manager, 3)) == 1
@@ -0,0 +1,42 @@
+import time
+import threading
+import urllib.request
+import blacksheep
+import uvicorn
+import context
+import profiler
+
+
+def test_raw_headers_are_bytes():
+    response = context.Response(body={}, headers={"Server-Timing": "worker.mock;dur=1.00"})
+    assert response.raw_headers() == [(b"Server-Timing", b"worker.mock;dur=1.00")]
+
+
+def test_server_timing_header_under_httptools():
+    timings = profiler.Timings()
+    timings.add("worker.mock", 0.0125)
+    result = context.Response(body={}, headers={"Server-Timing": timings.server_timing()})
+
+    # 与 main.py 相同的构造方式，在真实的 uvicorn（httptools）中输出
+    app = blacksheep.Application()
+
+    @app.router.get("/")
+    async def index():
+        return blacksheep.Response(200, result.raw_headers(), blacksheep.Content(b"text/plain", b"ok"))
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, http="httptools", log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not server.started:
+            assert time.monotonic() < deadline and thread.is_alive()
+            time.sleep(0.01)
+
+        port = server.servers[0].sockets[0].getsockname()[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=10) as response:
+            assert response.status == 200
+            assert response.headers["Server-Timing"] == "worker.mock;dur=12.50"
+    finally:
+        server.should_exit = True
+        thread.join(10)
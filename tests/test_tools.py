@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+import context
+import middleware
+from middlewares import tools
+
+TEXT = 'answer <tool_calls>[{"id": "call_1"}]</tool_calls> tail'
+
+
+def feed(scanner: tools.ToolCallScanner, size: int) -> str | None:
+    for i in range(0, len(TEXT), size):
+        if (body := scanner.feed(TEXT[i:i + size])) is not None:
+            return body
+    return None
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 11, 13, len(TEXT)])
+def test_scanner_finds_tags_split_across_chunks(size):
+    assert feed(tools.ToolCallScanner(), size) == '[{"id": "call_1"}]'
+
+
+def test_scanner_without_tags():
+    scanner = tools.ToolCallScanner()
+    assert scanner.feed("<tool_") is None
+    assert scanner.feed("call> not a tag") is None
+    assert not scanner.opened
+
+
+def test_stream_blocks_chunks_after_open_tag():
+    middleware = tools.ToolCallMiddleware({}, None)
+    ctx = context.Context(headers={}, body={"stream": True}, type="text")
+
+    async def run():
+        return [
+            await middleware.process_chunk(ctx, context.Text(content=x))
+            for x in ["hello ", "<tool", "_calls>[", "1,"]
+        ]
+
+    assert asyncio.run(run()) == [None, None, False, False]
+
+
+def test_middleware_does_not_require_stream_content():
+    manager = middleware.MiddlewareManager({}, None)
+    manager.add_middleware(tools.ToolCallMiddleware({}, None))
+    assert manager.stream_content is False
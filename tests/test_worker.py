@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+import error
+import retry
+import worker
+import context
+
+
+class Failing(worker.Worker):
+    async def generate_text(self, ctx):
+        raise error.WorkerError("upstream down")
+
+
+class Good(worker.Worker):
+    async def generate_text(self, ctx):
+        return context.Text(content="ok")
+
+
+def make_manager(*workers: worker.Worker) -> worker.WorkerManager:
+    manager = worker.WorkerManager({}, None)
+    for x in workers:
+        manager.add_worker(x)
+    return manager
+
+
+def make_context() -> tuple[context.Context, retry.RetryPolicy]:
+    ctx = context.Context(headers={}, body={"model": "m"}, type="text")
+    policy = ctx.metadata["retry"] = retry.RetryPolicy({"wait_time": 0}, retry.RetryBudget(), ctx)
+    return ctx, policy
+
+
+def test_unsupported_workers_do_not_consume_failover():
+    manager = make_manager(
+        Failing({"name": "a", "models": ["m"]}, None),
+        Good({"name": "b", "models": ["other"]}, None),
+    )
+    ctx, policy = make_context()
+    with pytest.raises(error.WorkerError):
+        asyncio.run(manager.generate_text(ctx))
+    assert policy.retries == 0
+    assert policy.budget.tokens == policy.budget.capacity
+
+
+def test_failover_is_charged_on_next_supporting_worker():
+    manager = make_manager(
+        Failing({"name": "a", "models": ["m"]}, None),
+        Good({"name": "b", "models": ["other"]}, None),
+        Good({"name": "c", "models": ["m"]}, None),
+    )
+    ctx, policy = make_context()
+    assert asyncio.run(manager.generate_text(ctx)).content == "ok"
+    assert ctx.metadata["worker"] == "c"
+    assert policy.retries == 1